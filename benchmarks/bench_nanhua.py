@@ -0,0 +1,75 @@
+"""
+NanHua download benchmark against the offline stand-in server (tests/nanhua_stub.py).
+
+Simulates a cache that is topped up repeatedly: one backfill of --days, then
+--refreshes tail refreshes of one bar each, and reports wall time, requests and
+bytes received for three client behaviours:
+
+- legacy:   a new connection per call, full series every time (the old code path);
+- range:    keep-alive session, server honours startTime / endTime;
+- full+etag: keep-alive session, server ignores the range, full response cached with TTL / ETag.
+
+    python benchmarks/bench_nanhua.py --bars 20000 --refreshes 50 --latency 0.02
+"""
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+    sys.path.append(Path(__file__).parent.parent.as_posix())
+    sys.path.append((Path(__file__).parent.parent / "tests").as_posix())
+
+import argparse
+import inspect
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import requests
+
+from fintools.data_sources.fin_history import DATASOURCES, DataFrequency
+from nanhua_stub import NanHuaStubServer
+
+
+def legacy_history(url: str, symbol: str, start: datetime, end: datetime) -> pd.DataFrame:
+    df = pd.DataFrame(requests.get(f"{url}?ticker={symbol}&freq=MIN1").json())
+    df["date"] = pd.to_datetime(df["quoteTime"], unit="ms", utc=True)
+    return df[(df["date"] >= start) & (df["date"] <= end)]
+
+
+def run(mode: str, bars: int, days: int, refreshes: int, latency: float, ttl: float) -> dict:
+    end = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    with NanHuaStubServer(bars=bars, end=end, supports_range=(mode == "range"), latency=latency) as server:
+        cls = DATASOURCES["nanhua"]
+        history = inspect.unwrap(cls.history)
+        nh = cls(server.url, cache_ttl=ttl)
+        start = end - timedelta(days=days)
+        cursor = end - timedelta(minutes=refreshes)
+        t0 = time.perf_counter()
+        calls = [(start, cursor)] + [(cursor + timedelta(minutes=i), cursor + timedelta(minutes=i + 1)) for i in range(refreshes)]
+        rows = 0
+        for s, e in calls:
+            if mode == "legacy":
+                rows += len(legacy_history(server.url, "PP_NH", s, e))
+            else:
+                rows += len(history(nh, "PP_NH", start=s, end=e, freq=DataFrequency.MINUTE1))
+        elapsed = time.perf_counter() - t0
+        return {"mode": mode, "seconds": elapsed, "requests": len(server.requests), "bytes": server.bytes_sent, "rows": rows}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bars", type=int, default=20000, help="length of the served 1-minute series")
+    parser.add_argument("--days", type=int, default=5, help="length of the initial backfill")
+    parser.add_argument("--refreshes", type=int, default=50, help="number of one-bar tail refreshes")
+    parser.add_argument("--latency", type=float, default=0.0, help="server-side delay per request (seconds)")
+    parser.add_argument("--ttl", type=float, default=0.0, help="NANHUA_CACHE_TTL for the full+etag mode")
+    args = parser.parse_args()
+
+    for mode in ["legacy", "range", "full+etag"]:
+        DATASOURCES["nanhua"].range_supported.clear()
+        r = run(mode, args.bars, args.days, args.refreshes, args.latency, args.ttl)
+        print(f"{r['mode']:<10} {r['seconds'] * 1000:9.1f} ms  {r['requests']:5d} requests  "
+              f"{r['bytes'] / 1024:10.1f} KiB  {r['rows']:7d} rows")
+
+
+if __name__ == "__main__":
+    main()
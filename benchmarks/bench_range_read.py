@@ -0,0 +1,101 @@
+"""
+Range-read benchmark: rowid tables vs. WITHOUT ROWID tables.
+
+Builds the same minute-bar cache twice (N symbols x M bars), then times random
+(symbol, [start, end)) range reads two ways:
+
+- scan: an aggregate over the range, which isolates the storage layout (index
+  lookup + row visits) from Python row materialisation;
+- select: HistoryDB._select_range, i.e. what history() pays end to end.
+
+    python benchmarks/bench_range_read.py --symbols 50 --days 20 --queries 500
+"""
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+    sys.path.append(Path(__file__).parent.parent.as_posix())
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from fintools.databases.history_db import HistoryDB
+
+
+def build(path: str, without_rowid: bool, symbols: int, days: int) -> HistoryDB:
+    db = HistoryDB("bench", db_path=path, without_rowid=without_rowid)
+    start = datetime(2024, 1, 1, 9, 30).astimezone()
+    rng = np.random.default_rng(0)
+    # 每个 symbol 分天写入，模拟按日增量补数据，使不同 symbol 的行在 rowid 表中交错存放
+    for d in range(days):
+        day = start + timedelta(days=d)
+        dates = pd.date_range(day, day + timedelta(hours=4), freq="min", inclusive="left")
+        for i in range(symbols):
+            close = 10 + rng.standard_normal(len(dates)).cumsum() * 0.01
+            df = pd.DataFrame({"date": dates, "open": close, "high": close + 0.01, "low": close - 0.01,
+                               "close": close, "volume": rng.integers(100, 10000, len(dates)).astype(float)})
+            db._insert_data(df, key_fields={"symbol": f"S{i:04d}"}, common_fields={"freq": "1min"})
+    return db
+
+
+def _plan(symbols: int, days: int, queries: int):
+    start = datetime(2024, 1, 1, 9, 30).astimezone()
+    rnd = random.Random(1)
+    plan = []
+    for _ in range(queries):
+        s = start + timedelta(days=rnd.randrange(days))
+        plan.append(({"symbol": f"S{rnd.randrange(symbols):04d}"}, s, s + timedelta(days=rnd.randint(1, 5))))
+    return plan
+
+
+def bench_scan(db: HistoryDB, plan) -> float:
+    table_name = db._get_table_name(common_fields={"freq": "1min"})
+    cur = db._get_cursor()
+    t0 = time.perf_counter()
+    for key_fields, s, e in plan:
+        cur.execute(f'SELECT count(*), sum(close), sum(volume) FROM "{table_name}" WHERE symbol = ? AND date >= ? AND date < ?',
+                    (db._stored_key_fields(table_name, key_fields)["symbol"], int(s.timestamp() * 1e6), int(e.timestamp() * 1e6)))
+        assert cur.fetchone()[0] > 0
+    return (time.perf_counter() - t0) / len(plan)
+
+
+def bench_select(db: HistoryDB, plan) -> float:
+    table_name = db._get_table_name(common_fields={"freq": "1min"})
+    t0 = time.perf_counter()
+    for key_fields, s, e in plan:
+        assert len(db._select_range(table_name, [db._stored_key_fields(table_name, key_fields)], s, e)) > 0
+    return (time.perf_counter() - t0) / len(plan)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--days", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    plan = _plan(args.symbols, args.days, args.queries)
+    results = {}
+    for without_rowid in (False, True):
+        path = os.path.join(tmp, f"bench_{'without_rowid' if without_rowid else 'rowid'}.db")
+        db = build(path, without_rowid, args.symbols, args.days)
+        db.close()
+        # 重新打开，避免写入时留在页缓存中的数据影响结果
+        db = HistoryDB("bench", db_path=path)
+        bench_scan(db, plan[:50])  # 预热
+        results[without_rowid] = (bench_scan(db, plan), bench_select(db, plan))
+        print(f"{'WITHOUT ROWID' if without_rowid else 'rowid':>14}: scan {results[without_rowid][0] * 1000:.3f} ms/query, "
+              f"select {results[without_rowid][1] * 1000:.3f} ms/query, file {os.path.getsize(path) / 1024 / 1024:.1f} MiB")
+        db.close()
+    print(f"speedup: scan {results[False][0] / results[True][0]:.2f}x, select {results[False][1] / results[True][1]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+启动耗时基准：导入时间、数据源实例化以及 MCP 工具就绪时间。
+
+每次采样都在新的解释器中运行，各次测量之间不会通过 sys.modules 共享任何模块。
+记录四组耗时（--repeat 次运行的中位数，单位毫秒，不含解释器本身的启动）：
+
+- import:<module>   导入 fintools.api.F.*、fintools.api.mcp 以及各个 tool_* 模块；
+- load:<source>     第一次 DATASOURCES[name] 查找，即导入数据源模块；
+- init:<source>     实例化数据源类；
+- ready:<tool>      从导入 tool_* 模块到内存中的 MCP 客户端列出其工具。
+
+默认把联网的 SDK（yfinance、tushare、efinance、Playwright、EmQuantAPI）替换为生成的桩模块，
+测得的是 fintools 自身的耗时，且可以离线运行；传入 --real-sdks 则使用真实的 SDK。
+
+    python benchmarks/bench_startup.py --repeat 5
+    python benchmarks/bench_startup.py --save-baseline benchmarks/startup_baseline.json
+    python benchmarks/bench_startup.py --baseline benchmarks/startup_baseline.json --tolerance 0.25
+    python benchmarks/bench_startup.py --explain fintools.api.mcp.tool_fin_history
+
+基线与机器相关：每台机器（或 CI runner）各保存一份，并在同一台机器上比较。
+给出 --baseline 时，任一耗时的变慢同时超过 --tolerance（相对值）和 --min-delta（绝对值，毫秒）则退出码为 1。
+"""
+import argparse
+import json
+import os
+import platform
+import pkgutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+ROOT = Path(__file__).parent.parent
+
+# 包 -> 以 "from package.sub import ..." 形式导入的子模块
+STUB_SDKS: Dict[str, List[str]] = {
+    "yfinance": [],
+    "tushare": ["pro", "pro.client"],
+    "efinance": [],
+    "playwright": ["sync_api"],
+    "EmQuantAPI": [],
+}
+
+STUB_SOURCE = '''"""由 benchmarks/bench_startup.py 生成的离线桩模块。"""
+
+
+class _Stub:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return _Stub()
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _Stub()
+
+
+def __getattr__(name):
+    if name.startswith("__"):
+        raise AttributeError(name)
+    return _Stub()
+'''
+
+# 在子解释器中运行，TASK 以 JSON 字面量的形式注入
+CHILD_SOURCE = '''
+import time
+_t0 = time.perf_counter()
+import json, sys, importlib
+TASK = json.loads({task!r})
+sys.path[:0] = TASK["path"]
+result = {{}}
+if TASK["kind"] == "import":
+    importlib.import_module(TASK["module"])
+elif TASK["kind"] == "source":
+    registry = importlib.import_module(TASK["package"]).DATASOURCES
+    _t0 = time.perf_counter()  # 包本身的导入由 import 任务测量
+    cls = registry[TASK["name"]]
+    result["load"] = (time.perf_counter() - _t0) * 1000
+    _t1 = time.perf_counter()
+    cls()
+    result["init"] = (time.perf_counter() - _t1) * 1000
+elif TASK["kind"] == "ready":
+    import asyncio
+    from fastmcp import Client
+    module = importlib.import_module(TASK["module"])
+    async def _list():
+        async with Client(module.mcp) as client:
+            return await client.list_tools()
+    result["tools"] = len(asyncio.run(_list()))
+result.setdefault("elapsed", (time.perf_counter() - _t0) * 1000)
+print("BENCH_RESULT " + json.dumps(result))
+'''
+
+
+def write_stubs(directory: str) -> None:
+    for package, submodules in STUB_SDKS.items():
+        base = Path(directory, package)
+        if not submodules:
+            Path(directory, package + ".py").write_text(STUB_SOURCE, encoding="utf-8")
+            continue
+        base.mkdir(parents=True, exist_ok=True)
+        (base / "__init__.py").write_text(STUB_SOURCE, encoding="utf-8")
+        for sub in submodules:
+            parts = sub.split(".")
+            for i in range(1, len(parts)):
+                pkg = base.joinpath(*parts[:i])
+                pkg.mkdir(parents=True, exist_ok=True)
+                (pkg / "__init__.py").write_text(STUB_SOURCE, encoding="utf-8")
+            leaf = base.joinpath(*parts)
+            if not leaf.is_dir():
+                leaf.with_suffix(".py").write_text(STUB_SOURCE, encoding="utf-8")
+
+
+def tool_modules() -> List[str]:
+    path = ROOT / "fintools" / "api" / "mcp"
+    return sorted(f"fintools.api.mcp.{m.name}" for m in pkgutil.iter_modules([str(path)]) if m.name.startswith("tool_"))
+
+
+def source_names() -> List[Tuple[str, str]]:
+    """所有已登记数据源的 (包名, 数据源名)，读取时不导入数据源模块。"""
+    code = ("import json, importlib\n"
+            "pkgs = ['fintools.data_sources.fin_history', 'fintools.data_sources.fin_news', 'fintools.data_sources.fin_report']\n"
+            "print(json.dumps([[p, n] for p in pkgs for n in importlib.import_module(p).DATASOURCES]))\n")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return [tuple(x) for x in json.loads(out.stdout)]  # type: ignore
+
+
+def build_tasks(skip: List[str]) -> List[Tuple[str, Dict[str, Any]]]:
+    tasks: List[Tuple[str, Dict[str, Any]]] = []
+    for module in ["fintools.api.F.fin_history", "fintools.api.F.fin_news", "fintools.api.F.fin_report", "fintools.api.mcp"] + tool_modules():
+        tasks.append((f"import:{module}", {"kind": "import", "module": module}))
+    for package, name in source_names():
+        tasks.append((f"source:{package.rsplit('.', 1)[-1]}/{name}", {"kind": "source", "package": package, "name": name}))
+    for module in tool_modules():
+        tasks.append((f"ready:{module.rsplit('.', 1)[-1]}", {"kind": "ready", "module": module}))
+    return [(label, task) for label, task in tasks if not any(s in label for s in skip)]
+
+
+def run_child(task: Dict[str, Any], env: Dict[str, str]) -> Dict[str, Any]:
+    proc = subprocess.run([sys.executable, "-c", CHILD_SOURCE.format(task=json.dumps(task))],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith("BENCH_RESULT "):
+            return json.loads(line[len("BENCH_RESULT "):])
+    raise RuntimeError(f"child failed for {task}:\n{proc.stderr[-2000:]}")
+
+
+def measure(tasks: List[Tuple[str, Dict[str, Any]]], repeat: int, env: Dict[str, str], path: List[str]) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    for label, task in tasks:
+        task = {**task, "path": path}
+        try:
+            run_child(task, env)  # 预热：编译 .pyc 文件，填充操作系统的页缓存
+            samples = [run_child(task, env) for _ in range(repeat)]
+        except RuntimeError as e:
+            print(f"{label:<60} FAILED\n{e}", file=sys.stderr)
+            continue
+        if task["kind"] == "source":
+            prefix = label[len("source:"):]
+            results[f"load:{prefix}"] = statistics.median(s["load"] for s in samples)
+            results[f"init:{prefix}"] = statistics.median(s["init"] for s in samples)
+        else:
+            results[label] = statistics.median(s["elapsed"] for s in samples)
+    return results
+
+
+def explain(module: str, top: int, env: Dict[str, str], path: List[str]) -> None:
+    """打印累计导入时间最长的模块（python -X importtime）。"""
+    code = f"import sys; sys.path[:0] = {path!r}; import {module}"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:9.1f} ms cumulative {self_us / 1000:8.1f} ms self  {name}")
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float, min_delta: float) -> List[str]:
+    regressions = []
+    for label, value in results.items():
+        base = baseline.get(label)
+        if base is None:
+            continue
+        if value > base * (1 + tolerance) and value - base > min_delta:
+            regressions.append(label)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--real-sdks", action="store_true", help="不把联网的 SDK 替换为桩模块")
+    parser.add_argument("--skip", action="append", default=[], help="跳过标签中包含该文本的测量项")
+    parser.add_argument("--baseline", help="与该基线文件比较，有退化时退出码为 1")
+    parser.add_argument("--save-baseline", help="把结果写入该基线文件")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="视为退化的相对变慢比例")
+    parser.add_argument("--min-delta", type=float, default=15.0, help="视为退化的绝对变慢（毫秒）")
+    parser.add_argument("--explain", help="不做基准测试，改为打印该模块下最慢的导入")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        run(args, tmp)
+
+
+def run(args: argparse.Namespace, tmp: str) -> None:
+    """在临时目录 tmp 中生成桩模块和独立的缓存库后运行基准。"""
+    path = [str(ROOT)]
+    if not args.real_sdks:
+        stubs = os.path.join(tmp, "stubs")
+        os.makedirs(stubs)
+        write_stubs(stubs)
+        path.insert(0, stubs)
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(path + [os.environ.get("PYTHONPATH", "")]).rstrip(os.pathsep),
+        # 缓存在导入时登记，不要碰到用户自己的缓存库
+        "FINTOOLS_DB": os.path.join(tmp, "history.db"),
+        "FINTOOLS_CACHE_URL": "",
+        "TUSHARE_API_KEY": os.environ.get("TUSHARE_API_KEY", "offline-benchmark"),
+    }
+
+    if args.explain:
+        explain(args.explain, args.top, env, path)
+        return
+
+    results = measure(build_tasks(args.skip), args.repeat, env, path)
+    baseline: Dict[str, float] = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.tolerance, args.min_delta)
+
+    for label, value in results.items():
+        line = f"{label:<60} {value:9.1f} ms"
+        if label in baseline:
+            line += f"   baseline {baseline[label]:9.1f} ms ({(value / baseline[label] - 1) * 100 if baseline[label] else 0:+6.1f}%)"
+            if label in regressions:
+                line += "  REGRESSION"
+        print(line)
+
+    if args.save_baseline:
+        meta = {"python": platform.python_version(), "platform": platform.platform(),
+                "stubs": not args.real_sdks, "repeat": args.repeat}
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline saved to {args.save_baseline}")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
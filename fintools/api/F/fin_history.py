@@ -1,7 +1,7 @@
-from typing import Dict, Annotated
+from typing import Dict, Annotated, Iterable, Iterator, List, Literal, Optional
 
 from importlib.resources import files
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import pandas as pd
 import tzlocal
 
@@ -9,6 +9,7 @@ from fintools.data_sources.fin_history import (
     STANDARD_COLUMN_NAMES, OHLCDataSource,
     DATASOURCES
 )
+from fintools.data_sources import resolve_end
 from .types import UnderlyingType, DataFrequency
 
 import logging
@@ -24,7 +25,7 @@ def get_data(
     freq: Annotated[DataFrequency, "data frequency, supports: " + " / ".join([f.value for f in DataFrequency])] = DataFrequency.DAILY,
     indicators: Annotated[list[str], "list of technical indicators to compute, supported by stockstats, e.g., macd, rsi, boll"] = [],
     start: Annotated[str | datetime | date | int, "start time, supports str: YYYY-MM-DD / YYYY-MM-DD HH:MM:SS | datetime | date | int (timestamp)"] = 0,
-    end: Annotated[str | datetime | date | int, "end time, supports str: YYYY-MM-DD / YYYY-MM-DD HH:MM:SS | datetime | date | int (timestamp)"] = datetime.now(),
+    end: Annotated[Optional[str | datetime | date | int], "end time, supports str: YYYY-MM-DD / YYYY-MM-DD HH:MM:SS | datetime | date | int (timestamp)"] = None,
     only_standard_columns: Annotated[bool, "if True, only return standard columns"] = True
 ) -> pd.DataFrame:
     """
@@ -50,7 +51,7 @@ def get_data(
     - freq: DataFrequency, data frequency
     - indicators: list of str, technical indicators to compute, supported by stockstats
     - start: str | datetime | date | int, start time
-    - end: str | datetime | date | int, end time
+    - end: str | datetime | date | int, end time, defaults to now; rounded up to the next bar boundary of `freq`
     - only_standard_columns: bool, if True, only return standard columns
 
     Time range is [start, end), i.e., start is inclusive, end is exclusive.
@@ -71,6 +72,7 @@ def get_data(
         datasources[datasource] = DATASOURCES[datasource]()
     ds = datasources[datasource]
 
+    end = resolve_end(end, freq)
     logger.info(f"Fetching history: datasource={datasource}, symbol={symbol}, type={type}, start={start}, end={end}, freq={freq}, only_standard_columns={only_standard_columns}")
 
     df: pd.DataFrame = ds.history(
@@ -90,7 +92,64 @@ def get_data(
 
     if only_standard_columns:
         df = pd.DataFrame(df[STANDARD_COLUMN_NAMES])
-    
+
+    return _compute_indicators(df, indicators)
+
+def iter_history(
+    datasource: Annotated[str, "data source, selected from: " + ", ".join(DATASOURCES.keys())],
+    symbol: Annotated[str, "symbol code of the index in the data source"],
+    type: Annotated[UnderlyingType, "type of the symbol, selected from: " + " / ".join([t.value for t in UnderlyingType])],
+    freq: Annotated[DataFrequency, "data frequency, supports: " + " / ".join([f.value for f in DataFrequency])] = DataFrequency.DAILY,
+    indicators: Annotated[list[str], "list of technical indicators to compute, supported by stockstats, e.g., macd, rsi, boll"] = [],
+    start: Annotated[str | datetime | date | int, "start time, supports str: YYYY-MM-DD / YYYY-MM-DD HH:MM:SS | datetime | date | int (timestamp)"] = 0,
+    end: Annotated[Optional[str | datetime | date | int], "end time, supports str: YYYY-MM-DD / YYYY-MM-DD HH:MM:SS | datetime | date | int (timestamp)"] = None,
+    only_standard_columns: Annotated[bool, "if True, only return standard columns"] = True,
+    chunk_rows: Annotated[int, "number of rows per chunk"] = 100_000,
+    lookback: Annotated[int, "rows of the previous chunk used to warm up indicators"] = 250,
+) -> Iterator[pd.DataFrame]:
+    """
+    Same as get_data, but yields date-ordered chunks of at most `chunk_rows` rows instead of one DataFrame.
+
+    Cached data is streamed from the database with a cursor, so exports and backtests over long minute-bar
+    histories run in flat memory.
+
+    Indicators are computed on each chunk prefixed with the last `lookback` rows of the previous chunk,
+    which are then dropped again. Window indicators (sma, boll, rsi, atr, ...) with a window up to
+    `lookback` match get_data exactly; recursive ones (ema, macd) converge to it as `lookback` grows.
+
+    Parameters: same as get_data, plus
+    - chunk_rows: int, rows per chunk
+    - lookback: int, warm-up rows carried over between chunks
+    """
+    if datasource not in DATASOURCES:
+        raise ValueError(f"Unknown datasource: {datasource}\n\nSupported datasources: {' / '.join(DATASOURCES.keys())}")
+
+    if datasource not in datasources:
+        datasources[datasource] = DATASOURCES[datasource]()
+    ds = datasources[datasource]
+
+    end = resolve_end(end, freq)
+    logger.info(f"Streaming history: datasource={datasource}, symbol={symbol}, type={type}, start={start}, end={end}, freq={freq}, chunk_rows={chunk_rows}")
+
+    chunks = ds.iter_history(symbol=symbol, type=type, start=start, end=end, freq=freq, chunk_rows=chunk_rows)
+    if only_standard_columns:
+        chunks = (pd.DataFrame(chunk[STANDARD_COLUMN_NAMES]) for chunk in chunks)
+    yield from _iter_indicators(chunks, indicators, lookback=lookback)
+
+def _iter_indicators(chunks: Iterable[pd.DataFrame], indicators: List[str], lookback: int = 250) -> Iterator[pd.DataFrame]:
+    tail: Optional[pd.DataFrame] = None
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        if tail is None or not indicators or lookback <= 0:
+            yield _compute_indicators(chunk, indicators)
+        else:
+            # 用上一块的最后 lookback 行预热指标，计算后再去掉这些行
+            out = _compute_indicators(pd.concat([tail, chunk], ignore_index=True), indicators)
+            yield out.iloc[len(tail):].reset_index(drop=True)
+        tail = chunk.iloc[-lookback:] if lookback > 0 else None
+
+def _compute_indicators(df: pd.DataFrame, indicators: List[str]) -> pd.DataFrame:
     from stockstats import wrap
     df = df.sort_values(by='date', ascending=True)
     df = wrap(df)
@@ -107,6 +166,95 @@ def get_data(
 
     return df
     
+def get_panel(
+    datasource: Annotated[str, "data source, selected from: " + ", ".join(DATASOURCES.keys())],
+    symbols: Annotated[List[str], "symbol codes in the data source"],
+    type: Annotated[UnderlyingType, "type of the symbols, selected from: " + " / ".join([t.value for t in UnderlyingType])],
+    freq: Annotated[DataFrequency, "data frequency, supports: " + " / ".join([f.value for f in DataFrequency])] = DataFrequency.DAILY,
+    fields: Annotated[List[str], "columns to build matrices for, e.g., close, volume"] = ["close"],
+    start: Annotated[str | datetime | date | int, "start time, supports str: YYYY-MM-DD / YYYY-MM-DD HH:MM:SS | datetime | date | int (timestamp)"] = 0,
+    end: Annotated[Optional[str | datetime | date | int], "end time, supports str: YYYY-MM-DD / YYYY-MM-DD HH:MM:SS | datetime | date | int (timestamp)"] = None,
+    align: Annotated[Literal["asof", "exact"], "asof: carry each symbol's last observation forward onto the common index; exact: only keep values at their own timestamps"] = "asof",
+    tolerance: Annotated[Optional[timedelta], "with asof alignment, drop values older than this"] = None,
+    index: Annotated[Optional[pd.DatetimeIndex], "target index of the matrices, defaults to the union of all timestamps"] = None,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Get date-aligned wide matrices (date x symbol) for several symbols from the same data source.
+
+    Only the missing ranges of each symbol are downloaded; cached data is read with one query per table.
+
+    Returns: dict of field -> DataFrame, indexed by date (local timezone), one column per symbol in the order of `symbols`.
+
+    Parameters:
+    - datasource: str, data source to fetch data from
+    - symbols: list of str, symbol codes in the data source
+    - type: UnderlyingType, type of the symbols
+    - freq: DataFrequency, data frequency
+    - fields: list of str, columns to build matrices for
+    - start: str | datetime | date | int, start time
+    - end: str | datetime | date | int, end time, defaults to now; rounded up to the next bar boundary of `freq`
+    - align: "asof" or "exact"
+    - tolerance: timedelta, optional, maximum age of an as-of value
+    - index: pd.DatetimeIndex, optional, target index of the matrices
+
+    Markets in different time zones stamp their bars at different instants, so with "asof" each cell holds
+    the symbol's latest value at or before the row's timestamp.
+
+    Time range is [start, end), i.e., start is inclusive, end is exclusive.
+    """
+    if datasource not in DATASOURCES:
+        raise ValueError(f"Unknown datasource: {datasource}\n\nSupported datasources: {' / '.join(DATASOURCES.keys())}")
+
+    if datasource not in datasources:
+        datasources[datasource] = DATASOURCES[datasource]()
+    ds = datasources[datasource]
+
+    end = resolve_end(end, freq)
+    logger.info(f"Fetching panel: datasource={datasource}, symbols={symbols}, type={type}, start={start}, end={end}, freq={freq}, fields={fields}")
+
+    df = ds.history_many(symbols=symbols, type=type, start=start, end=end, freq=freq)
+    return _align_panel(df, symbols=symbols, fields=fields, align=align, tolerance=tolerance, index=index)
+
+def _align_panel(
+    df: pd.DataFrame,
+    symbols: List[str],
+    fields: List[str],
+    align: Literal["asof", "exact"] = "asof",
+    tolerance: Optional[timedelta] = None,
+    index: Optional[pd.DatetimeIndex] = None,
+) -> Dict[str, pd.DataFrame]:
+    if df.empty:
+        logger.warning("No data fetched, returning empty matrices")
+        empty_index = index if index is not None else pd.DatetimeIndex([], tz=tzlocal.get_localzone(), name="date")
+        return {field: pd.DataFrame(index=empty_index, columns=symbols, dtype="Float64") for field in fields}
+
+    df = df.copy()
+    df['date'] = pd.to_datetime(df['date'], utc=True).dt.tz_convert(tzlocal.get_localzone())
+    wide = df.pivot(index="date", columns="symbol", values=fields).sort_index()
+    target = index if index is not None else wide.index
+
+    if align == "exact":
+        wide = wide.reindex(target)
+    elif align == "asof":
+        full_index = wide.index.union(target)
+        # 每个 symbol 最近一次观测的时间，用于 tolerance 过滤
+        seen = df.pivot(index="date", columns="symbol", values="date").reindex(full_index).ffill().reindex(target)
+        wide = wide.reindex(full_index).ffill().reindex(target)
+        if tolerance is not None:
+            too_old = seen.rsub(pd.Series(target, index=target), axis=0) > tolerance
+            for field in fields:
+                wide[field] = wide[field].mask(too_old[wide[field].columns])
+    else:
+        raise ValueError(f"Unknown align method: {align}")
+
+    ret = {}
+    for field in fields:
+        mat = wide[field].reindex(columns=symbols)
+        mat.columns.name = None
+        mat.index.name = "date"
+        ret[field] = mat
+    return ret
+
 def list_indices() -> pd.DataFrame:
     """
     List known financial indices with their types and available data sources.
@@ -129,5 +277,7 @@ def list_indices() -> pd.DataFrame:
 
 __all__ = [
     "get_data",
+    "iter_history",
+    "get_panel",
     "list_indices"
 ]
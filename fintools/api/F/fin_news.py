@@ -1,4 +1,4 @@
-from typing import Dict, Annotated
+from typing import Dict, Annotated, Optional
 
 from datetime import datetime, date
 import pandas as pd
@@ -10,6 +10,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 from fintools.data_sources.fin_news import DATASOURCES, NewsDataSource
+from fintools.data_sources import resolve_end
 from fintools.databases.common_db import DB_CONNECTIONS
 
 datasources: Dict[str, NewsDataSource] = {}
@@ -18,7 +19,7 @@ def list_news(
     datasource: Annotated[str, "data source, selected from: " + ", ".join(DATASOURCES.keys())],
     symbol: Annotated[str, "any keywords to search for news articles"],
     start: Annotated[str | datetime | date | int, "start time, supports str: YYYY-MM-DD / YYYY-MM-DD HH:MM:SS | datetime | date | int (timestamp)"] = 0,
-    end: Annotated[str | datetime | date | int, "end time, supports str: YYYY-MM-DD / YYYY-MM-DD HH:MM:SS | datetime | date | int (timestamp)"] = datetime.now(),
+    end: Annotated[Optional[str | datetime | date | int], "end time, supports str: YYYY-MM-DD / YYYY-MM-DD HH:MM:SS | datetime | date | int (timestamp)"] = None,
 ) -> pd.DataFrame:
     """
     Search for news articles related to a given symbol from specified data source.
@@ -27,7 +28,7 @@ def list_news(
     - datasource: str, Data source
     - symbol: str, Keywords to search for news articles.
     - start: str | datetime | date | int, start time
-    - end: str | datetime | date | int, end time
+    - end: str | datetime | date | int, end time, defaults to now (rounded up to the next whole minute)
 
     Time range is [start, end), i.e., start is inclusive, end is exclusive.
     So if you want news up to and including 2025-01-01, please set end to 2025-01-02.
@@ -45,6 +46,7 @@ def list_news(
         datasources[datasource] = DATASOURCES[datasource]()
     ds = datasources[datasource]
 
+    end = resolve_end(end)
     logger.info(f"Fetching news: datasource={datasource}, symbol={symbol}, start={start}, end={end}")
 
     df: pd.DataFrame = ds.list_news(
@@ -3,11 +3,14 @@ import socket
 import json
 import time
 
-from langchain_mcp_adapters.sessions import Connection, StreamableHttpConnection
 from fastmcp import FastMCP
 from multiprocessing import Process
 
-from typing import Dict, List, Tuple
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    # langchain_mcp_adapters 导入很慢，只在真正启动服务时才导入（见 start_all_services）
+    from langchain_mcp_adapters.sessions import Connection
 
 from .ping_client import PingClient
 
@@ -23,7 +26,7 @@ MCP_PATH = "/mcp"
 
 
 MCP_SERVICES: Dict[str, FastMCP] = {}
-MCP_CONNECTIONS: Dict[str, Connection] = \
+MCP_CONNECTIONS: Dict[str, "Connection"] = \
     json.load(open(CONNECTION_RECORD_FILE, "r")) \
         if os.path.exists(CONNECTION_RECORD_FILE) else {}
 MCP_PROCESSES: Dict[str, Process] = {}
@@ -79,6 +82,7 @@ def start_all_services(start_anyway: bool = False, test_max_retries: int = 10, t
         check_services_running(test_max_retries, test_timeout)
         return
     if os.getenv("START_SERVICES_INTERNAL", "false").lower() == "true" or start_anyway:
+        from langchain_mcp_adapters.sessions import StreamableHttpConnection
         logger.info("Starting MCP services...")
         current_port = 8000
         for mcp_service in MCP_SERVICES:
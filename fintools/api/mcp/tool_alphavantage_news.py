@@ -18,6 +18,8 @@ import requests
 from dotenv import load_dotenv
 from fastmcp import FastMCP
 
+from fintools.databases.rate_limit import acquire
+
 load_dotenv()
 import json
 import sys
@@ -141,6 +143,7 @@ class AlphaVantageNewsTool:
             params["time_to"] = time_to
 
         try:
+            acquire("alphavantage", "news_sentiment")
             response = requests.get(self.base_url, params=params, timeout=30)
             response.raise_for_status()
 
@@ -1,7 +1,7 @@
 from fastmcp import FastMCP
 import pandas as pd
 from datetime import datetime, date
-from typing import Literal, List, Dict, Any
+from typing import Literal, List, Dict, Any, Optional
 
 import os
 import sys
@@ -15,6 +15,7 @@ if not __package__:
     sys.path.append(str(Path(__file__).parent.parent.parent))
 from fintools.data_sources.fin_history import OHLCDataSource
 from fintools.data_sources.fin_history import UnderlyingType, DataFrequency, STANDARD_COLUMN_NAMES, DATASOURCES
+from fintools.utils.metrics import REGISTRY
 
 mcp = FastMCP(
     name = "Financial Data History MCP Service",
@@ -44,7 +45,7 @@ Parameters:
 - symbol: str, The symbol code, e.g., "AAPL", "000001.SZ", "AUDCAD.FXCM". It's recommended to use list_indices tool to find valid symbols, or refer to the data source documentation.
 - type: str, The type of the symbol, supports: "{'" / "'.join([t.value for t in UnderlyingType])}"
 - start: str, start time, supports: "YYYY-MM-DD" / "YYYY-MM-DD HH:MM:SS"
-- end: str, end time, supports: "YYYY-MM-DD" / "YYYY-MM-DD HH:MM:SS", default is current time
+- end: str, end time, supports: "YYYY-MM-DD" / "YYYY-MM-DD HH:MM:SS", default is current time (rounded up to the next bar boundary)
 - freq: str, data frequency, supports: "{'" / "'.join([f.value for f in DataFrequency])}", default is "daily"
 - only_standard_columns: bool, if True, only return standard columns
 """
@@ -54,7 +55,7 @@ def history(
     symbol: str,
     type: str,
     start: str = "2000-01-01 00:00:00",
-    end: str = datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    end: Optional[str] = None,
     freq: str = "daily",
     only_standard_columns: bool = True
 ) -> List[Dict[str, Any]]:
@@ -131,7 +132,24 @@ def list_indices() -> List[Dict[str, str]]:
     return ret
 
 
-__all__ = ["mcp", "history", "list_indices"]
+@mcp.tool(
+    description =
+"""
+Report cache and data source metrics of this service: cache hits / misses, downloaded rows and bytes,
+and latency histograms of upstream downloads, database reads, writes and DataFrame conversion,
+labelled per table and per data source.
+
+Parameters:
+- format: str, "json" (default) returns a dictionary of metrics; "prometheus" returns the Prometheus text exposition format as a string
+"""
+)
+def cache_metrics(format: Literal["json", "prometheus"] = "json") -> Dict[str, Any] | str:
+    if format == "prometheus":
+        return REGISTRY.to_prometheus()
+    return REGISTRY.snapshot()
+
+
+__all__ = ["mcp", "history", "list_indices", "cache_metrics"]
 
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 from fastmcp import FastMCP
 import pandas as pd
 from datetime import datetime, date
-from typing import Literal, List, Dict, Any
+from typing import Literal, List, Dict, Any, Optional
 
 import os
 import sys
@@ -15,6 +15,7 @@ if not __package__:
     sys.path.append(str(Path(__file__).parent.parent.parent))
 from fintools.data_sources.fin_news import NewsDataSource
 from fintools.data_sources.fin_news import DATASOURCES
+from fintools.data_sources import resolve_end
 
 mcp = FastMCP(
     name = "Financial News MCP Service",
@@ -56,7 +57,7 @@ def list_news(
     datasource: str,
     symbol: str,
     start: str = "2000-01-01 00:00:00",
-    end: str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    end: Optional[str] = None
 ) -> List[Dict[str, Any]]:
     try:
         if datasource not in DATASOURCES:
@@ -71,7 +72,7 @@ def list_news(
         df: pd.DataFrame = ds.list_news(
             symbol=symbol,
             start=start,
-            end=end,
+            end=resolve_end(end),
         )
 
         df['date'] = df['date'].dt.strftime("%Y-%m-%d %H:%M:%S")
@@ -18,6 +18,8 @@ import requests
 from dotenv import load_dotenv
 from fastmcp import FastMCP
 
+from fintools.databases.rate_limit import acquire
+
 load_dotenv()
 import json
 import os
@@ -137,6 +139,7 @@ class WebScrapingJinaTool:
                 "X-Timeout": "10",
                 "X-With-Generated-Alt": "true",
             }
+            acquire("jina", "reader")
             response = requests.get(jina_url, headers=headers)
 
             if response.status_code != 200:
@@ -165,6 +168,7 @@ class WebScrapingJinaTool:
         }
 
         try:
+            acquire("jina", "search")
             response = requests.get(url, headers=headers)
             response.raise_for_status()  # 检查HTTP状态码
 
@@ -1,4 +1,4 @@
-from pyparsing import ABC
+from abc import ABC
 from typing import Optional, Union
 from enum import Enum
 from datetime import datetime, date, timedelta, timezone
@@ -34,13 +34,72 @@ class DataFrequency(Enum):
     YEARLY = 'yearly'
 
 
+def bar_duration(freq: DataFrequency) -> timedelta:
+    if freq == DataFrequency.MINUTE1:
+        return timedelta(minutes=1)
+    elif freq == DataFrequency.MINUTE2:
+        return timedelta(minutes=2)
+    elif freq == DataFrequency.MINUTE5:
+        return timedelta(minutes=5)
+    elif freq == DataFrequency.MINUTE15:
+        return timedelta(minutes=15)
+    elif freq == DataFrequency.MINUTE30:
+        return timedelta(minutes=30)
+    elif freq == DataFrequency.MINUTE60:
+        return timedelta(minutes=60)
+    elif freq == DataFrequency.MINUTE90:
+        return timedelta(minutes=90)
+    elif freq == DataFrequency.MINUTE120:
+        return timedelta(minutes=120)
+    elif freq == DataFrequency.MINUTE240:
+        return timedelta(minutes=240)
+    elif freq == DataFrequency.MINUTE300:
+        return timedelta(minutes=300)
+    elif freq == DataFrequency.DAILY:
+        return timedelta(days=1)
+    elif freq == DataFrequency.DAY5:
+        return timedelta(days=5)
+    elif freq == DataFrequency.WEEKLY:
+        return timedelta(weeks=1)
+    elif freq == DataFrequency.MONTHLY:
+        return timedelta(days=30)
+    elif freq == DataFrequency.MONTH3:
+        return timedelta(days=90)
+    else:
+        raise NotImplementedError(f"Frequency {freq} not supported for datetime shift")
+
+def resolve_end(end: Optional[Union[str, datetime, date, int]] = None, freq: Optional[DataFrequency] = None) -> datetime:
+    """
+    在调用时解析结束时间。None 表示当前时间，并向上对齐到 bar 的边界（本地时区）：
+    分钟线对齐到当日零点起 bar 长度的整数倍，日线及以上（包括 bar_duration 不支持的年线等）对齐到次日零点，
+    不指定 freq 时对齐到整分钟，
+    同一根 bar 内的重复请求得到相同的 end，可以共享已缓存的区间和缓存键。
+
+    显式给出的 end 原样返回：各数据源的 bar 不一定以本地零点标记（如美股日线、以收盘时间标记的 bar），
+    按本地时区对齐可能把 end 之后的 bar 也包含进来。
+    """
+    if end is not None:
+        return parse_datetime(end)
+    dt = datetime.now().astimezone()
+    if freq is None:
+        step = timedelta(minutes=1)
+    elif freq.value.startswith("minute"):
+        step = bar_duration(freq)
+    else:
+        step = timedelta(days=1)
+    midnight = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight + step * -(-(dt - midnight) // step)
+
+
 class DataSource(ABC):
 
     name: str = "base"
     token: Optional[Union[str, dict]] = None
 
 
-    def _parse_datetime(self, datetime_input: Union[str, datetime, date, int]) -> datetime:
+    def _parse_datetime(self, datetime_input: Optional[Union[str, datetime, date, int]]) -> datetime:
+        if datetime_input is None:
+            return resolve_end(None)
         return parse_datetime(datetime_input)
     
     def _parse_date(self, date_input: Union[str, datetime, date, int]) -> date:
@@ -48,35 +107,4 @@ class DataSource(ABC):
         return dt.date()
 
     def _datetime_shift_base(self, freq: DataFrequency) -> timedelta:
-        if freq == DataFrequency.MINUTE1:
-            return timedelta(minutes=1)
-        elif freq == DataFrequency.MINUTE2:
-            return timedelta(minutes=2)
-        elif freq == DataFrequency.MINUTE5:
-            return timedelta(minutes=5)
-        elif freq == DataFrequency.MINUTE15:
-            return timedelta(minutes=15)
-        elif freq == DataFrequency.MINUTE30:
-            return timedelta(minutes=30)
-        elif freq == DataFrequency.MINUTE60:
-            return timedelta(minutes=60)
-        elif freq == DataFrequency.MINUTE90:
-            return timedelta(minutes=90)
-        elif freq == DataFrequency.MINUTE120:
-            return timedelta(minutes=120)
-        elif freq == DataFrequency.MINUTE240:
-            return timedelta(minutes=240)
-        elif freq == DataFrequency.MINUTE300:
-            return timedelta(minutes=300)
-        elif freq == DataFrequency.DAILY:
-            return timedelta(days=1)
-        elif freq == DataFrequency.DAY5:
-            return timedelta(days=5)
-        elif freq == DataFrequency.WEEKLY:
-            return timedelta(weeks=1)
-        elif freq == DataFrequency.MONTHLY:
-            return timedelta(days=30)
-        elif freq == DataFrequency.MONTH3:
-            return timedelta(days=90)
-        else:
-            raise NotImplementedError(f"Frequency {freq} not supported for datetime shift")
\ No newline at end of file
+        return bar_duration(freq)
\ No newline at end of file
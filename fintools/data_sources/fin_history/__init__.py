@@ -1,48 +1,16 @@
 from .base import DataFrequency, UnderlyingType, OHLCDataSource, STANDARD_COLUMN_NAMES
-import pkgutil
-import importlib
-import inspect
-from pathlib import Path
-from typing import Type, Dict
-
-import logging
-logger = logging.getLogger(__name__)
-
-DATASOURCES: Dict[str, Type[OHLCDataSource]] = {}
-
-def _discover_datasource_classes():
-    """
-    扫描当前包下所有 .py 模块，找到所有继承 OHLCDataSource 的子类，
-    填充到 DATASOURCES 里。
-    """
-    package_name = __name__
-    package_path = Path(__file__).parent
-
-    for module_info in pkgutil.iter_modules([str(package_path)]):
-        mod_name = module_info.name
-
-        if mod_name in ("base", "__init__") or mod_name.startswith("_"):
-            continue
-
-        full_name = f"{package_name}.{mod_name}"
-        module = importlib.import_module(full_name)
-        if hasattr(module, "__deprecated__") and getattr(module, "__deprecated__"):
-            logger.info(f"Skipping deprecated module: {full_name}")
-            continue
-
-        for attr_name, obj in inspect.getmembers(module, inspect.isclass):
-            if issubclass(obj, OHLCDataSource) and obj is not OHLCDataSource:
-                key = getattr(obj, "name", obj.__name__)
-                if key == "base":
-                    logger.warning(f"OHLCDataSource subclass in {full_name} has reserved name 'base'.")
-                    logger.warning("Please rename it to avoid conflicts.")
-                    logger.warning("Skipping registration of this class.")
-                    continue
-                if key in DATASOURCES:
-                    raise ValueError(f"Duplicate OHLCDataSource name detected: {key} in {obj.__name__} and {DATASOURCES[key].__name__}")
-                DATASOURCES[key] = obj
-
-_discover_datasource_classes()
+from ..registry import LazyRegistry
+
+# 内置数据源清单：名字 -> 模块:类名。模块在第一次 DATASOURCES[name] 时才导入；
+# 第三方数据源通过 entry_points 分组 "fintools.fin_history" 注册
+DATASOURCES: LazyRegistry[OHLCDataSource] = LazyRegistry(__name__, OHLCDataSource, {
+    "choice": ".choice:ChoiceDataSource",
+    "efinance": ".efinance:EFinanceDataSource",
+    "investing.com": ".investing_com:InvestingComDataSource",
+    "nanhua": ".nanhua:NanHuaDataSource",
+    "tushare": ".tushare:TushareDataSource",
+    "yahoo_finance": ".yfinance:YahooFinanceDataSource",
+}, entry_point_group="fintools.fin_history")
 
 __all__ = [
     "OHLCDataSource",
@@ -50,4 +18,4 @@ __all__ = [
     "DataFrequency",
     "STANDARD_COLUMN_NAMES",
     "DATASOURCES",
-]
\ No newline at end of file
+]
@@ -2,11 +2,17 @@ from abc import ABC, abstractmethod
 import sqlite3
 import numpy as np
 import pandas as pd
-from typing import Literal, Callable, Optional, Union
+from typing import Literal, Callable, Optional, Union, List, Iterator
 from enum import Enum
 from datetime import datetime, date, timedelta
 
-from .. import DataSource, DataFrequency, UnderlyingType
+import inspect
+from functools import wraps
+from time import perf_counter
+
+from .. import DataSource, DataFrequency, UnderlyingType, resolve_end
+from fintools.utils.metrics import SOURCE_REQUESTS, SOURCE_SECONDS
+from fintools.databases.keys import enum_normalizer
 
 STANDARD_COLUMN_NAMES = ["date", "open", "high", "low", "close", "volume"]
 
@@ -17,17 +23,94 @@ class OHLCDataSource(DataSource, ABC):
     column_names: list = STANDARD_COLUMN_NAMES
     freq_map: dict
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # 为每个数据源的 history 记录调用次数和耗时（包含缓存命中的情况）
+        if "history" in cls.__dict__ and not getattr(cls.__dict__["history"], "__isabstractmethod__", False):
+            cls.history = _instrument_history(cls.__dict__["history"], cls)
+
     @abstractmethod
     def history(
         self,
         symbol: str,
         type: UnderlyingType,
         start: Union[str, datetime, date, int] = 0,
-        end: Union[str, datetime, date, int] = datetime.now(),
+        end: Optional[Union[str, datetime, date, int]] = None,
         freq: DataFrequency = DataFrequency.DAILY
     ) -> pd.DataFrame:
         raise NotImplementedError("Subclasses must implement this method")
     
+    def history_many(
+        self,
+        symbols: List[str],
+        type: UnderlyingType,
+        start: Union[str, datetime, date, int] = 0,
+        end: Optional[Union[str, datetime, date, int]] = None,
+        freq: DataFrequency = DataFrequency.DAILY
+    ) -> pd.DataFrame:
+        """
+        批量获取多个 symbol 的历史数据，返回带 symbol 列的长表。
+
+        history 被 history_cache 装饰时，只补齐各 symbol 的缺失区间，并用一条 SQL 读出全部数据；
+        否则逐个调用 history 后拼接。数据源实现了 _history_batch 时，缺失区间相同的 symbol 合并为一次批量下载。
+        """
+        end = resolve_end(end, enum_normalizer(DataFrequency)(freq))
+        many = getattr(self.__class__.history, "many", None)
+        batch = self._history_batch if self.__class__._history_batch is not OHLCDataSource._history_batch else None
+        if many is not None:
+            df = many(self, symbol=list(symbols), type=type, start=start, end=end, freq=freq, batch=batch)
+            return df.drop(columns=[c for c in ("type", "freq") if c in df.columns])
+        if batch is not None:
+            df = batch(symbol=list(symbols), type=type, start=start, end=end, freq=freq)
+            return df.drop(columns=[c for c in ("type", "freq") if c in df.columns]).reset_index(drop=True)
+        frames = []
+        for symbol in symbols:
+            df = self.history(symbol=symbol, type=type, start=start, end=end, freq=freq)
+            df.insert(0, "symbol", symbol)
+            frames.append(df)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["symbol"] + STANDARD_COLUMN_NAMES)
+
+    def _history_batch(
+        self,
+        symbol: List[str],
+        type: UnderlyingType,
+        start: Union[str, datetime, date, int],
+        end: Union[str, datetime, date, int],
+        freq: Union[DataFrequency, List[DataFrequency]]
+    ) -> pd.DataFrame:
+        """
+        可选：一次下载多个 symbol 的 [start, end) 数据，返回带 symbol 列的长表（列与 history 相同）。
+
+        参数与 history 相同，但 symbol 为列表；history_cache 的其他 key 字段（如 freq）可能是与 symbol 等长的列表，
+        此时返回的长表也须带上这些列。数据源有批量接口时覆盖此方法。
+        """
+        raise NotImplementedError("Subclasses may implement batch downloads")
+
+    def iter_history(
+        self,
+        symbol: str,
+        type: UnderlyingType,
+        start: Union[str, datetime, date, int] = 0,
+        end: Optional[Union[str, datetime, date, int]] = None,
+        freq: DataFrequency = DataFrequency.DAILY,
+        chunk_rows: int = 100_000
+    ) -> Iterator[pd.DataFrame]:
+        """
+        按时间升序分块返回历史数据，每块最多 chunk_rows 行。
+
+        history 被 history_cache 装饰时由 HistoryDB 用游标逐块读出，内存占用与总行数无关；
+        否则调用一次 history 后再切块。
+        """
+        end = resolve_end(end, enum_normalizer(DataFrequency)(freq))
+        iter_chunks = getattr(self.__class__.history, "iter_chunks", None)
+        if iter_chunks is not None:
+            yield from iter_chunks(self, symbol=symbol, type=type, start=start, end=end, freq=freq, chunk_rows=chunk_rows)
+            return
+        df = self.history(symbol=symbol, type=type, start=start, end=end, freq=freq)
+        df = df.sort_values(by="date", ascending=True, kind="stable", ignore_index=True)
+        for i in range(0, len(df), chunk_rows):
+            yield df.iloc[i:i + chunk_rows].reset_index(drop=True)
+
     @abstractmethod
     def subscribe(self, symbol: str, interval: str, callback: Callable) -> None:
         raise NotImplementedError("Subclasses must implement this method")
@@ -37,6 +120,12 @@ class OHLCDataSource(DataSource, ABC):
         raise NotImplementedError("Subclasses must implement this method")
     
     
+    def _history_db(self):
+        """history 被 history_cache 装饰时返回其缓存后端（HistoryDB / ShardedHistoryDB / RemoteHistoryDB），否则返回 None。"""
+        from fintools.databases import DB_CONNECTIONS
+        fn = self.__class__.history
+        return DB_CONNECTIONS.get(f"{fn.__module__}:{fn.__qualname__}")
+
     def _format_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
         for custom, standard in zip(self.__class__.column_names, STANDARD_COLUMN_NAMES):
             if custom is None:
@@ -53,4 +142,28 @@ class OHLCDataSource(DataSource, ABC):
         if freq in self.__class__.freq_map:
             return self.__class__.freq_map[freq]
         else:
-            raise NotImplementedError(f"Frequency {freq} not supported in {self.__class__.__name__}")
\ No newline at end of file
+            raise NotImplementedError(f"Frequency {freq} not supported in {self.__class__.__name__}")
+
+
+def _instrument_history(func: Callable[..., pd.DataFrame], cls: type) -> Callable[..., pd.DataFrame]:
+    sig = inspect.signature(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs) -> pd.DataFrame:
+        source = getattr(cls, "name", cls.__name__)
+        # 在调用时解析 end：None 解析为当前时间并对齐到 bar 边界，缓存层看到的是解析后的 end
+        bound = sig.bind(*args, **kwargs)
+        bound.apply_defaults()
+        if "end" in bound.arguments:
+            bound.arguments["end"] = resolve_end(bound.arguments["end"], enum_normalizer(DataFrequency)(bound.arguments.get("freq", DataFrequency.DAILY)))
+        t0 = perf_counter()
+        try:
+            df = func(*bound.args, **bound.kwargs)
+        except Exception:
+            SOURCE_REQUESTS.inc(source=source, result="error")
+            raise
+        finally:
+            SOURCE_SECONDS.observe(perf_counter() - t0, source=source)
+        SOURCE_REQUESTS.inc(source=source, result="ok")
+        return df
+    return wrapper
@@ -1,21 +1,226 @@
 from contextlib import contextmanager
-from .base import OHLCDataSource, UnderlyingType, DataFrequency
+from .base import OHLCDataSource, UnderlyingType, DataFrequency, STANDARD_COLUMN_NAMES
 from fintools.databases.history_db import history_cache
+from fintools.databases.keys import upper_symbol
 import pandas as pd
 import os
-from typing import Optional, Callable, Union, Any
+import time
+import atexit
+from typing import Optional, Callable, Union, Any, Dict, List, Tuple, Iterator
 from datetime import datetime, date, timedelta
 from threading import Lock, Timer
+from concurrent.futures import Future
 
 import importlib
 
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ChoiceSession:
+    """
+    EmQuantAPI 的长连接会话。
+
+    登录（choice.start）很慢，因此会话在多次调用之间保持；空闲超过 idle_timeout 秒后才退出登录，
+    距离上次成功调用超过 health_interval 秒时，借出前先做一次健康检查，失败则重新登录。
+    EmQuantAPI 的调用不可重入，所有调用通过同一把锁串行执行；并发的 csd 请求在 batch_window 内合并为多代码调用。
+    """
+    def __init__(self, module: str = "EmQuantAPI",
+                 idle_timeout: float = float(os.getenv("CHOICE_IDLE_TIMEOUT", "1800")),
+                 health_interval: float = float(os.getenv("CHOICE_HEALTH_INTERVAL", "60")),
+                 batch_window: float = float(os.getenv("CHOICE_BATCH_WINDOW", "0.05")),
+                 batch_size: int = int(os.getenv("CHOICE_BATCH_SIZE", "100"))):
+        """
+        参数：
+            module: 提供 `c` 对象的模块名，测试时可以换成假的 EmQuantAPI
+            idle_timeout: 空闲多少秒后退出登录，负数表示保持到进程退出
+            health_interval: 距离上次成功调用超过该秒数时，借出前先检查会话是否可用，负数表示不检查
+            batch_window: 第一个 csd 请求等待其他并发请求的秒数，0 表示不等待（仍会合并已在排队的请求）
+            batch_size: 单次 csd 调用最多包含的代码数
+        """
+        self.module = module
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self.api: Any = None
+        self.running = False
+        self.lock = Lock()
+        self._state = Lock()
+        self._timer: Optional[Timer] = None
+        self._last_ok = 0.0
+        self._pending: Dict[Tuple[str, ...], List[Tuple[str, Future]]] = {}
+
+    def _load(self) -> Any:
+        if self.api is None:
+            try:
+                self.api = importlib.import_module(self.module).c
+            except (ModuleNotFoundError, AttributeError) as e:
+                raise ImportError("EmQuantAPI module is not installed. Please install it to use ChoiceDataSource.") from e
+        return self.api
+
+    def _start(self) -> None:
+        api = self._load()
+        result = api.start(f"ForceLogin=1,UserName={os.getenv('CHOICE_USERNAME','')},Password={os.getenv('CHOICE_PASSWORD','')}")
+        if getattr(result, "ErrorCode", 0) != 0:
+            raise ConnectionError(f"Choice 登录失败：{result.ErrorMsg}")
+        self.running = True
+        self._last_ok = time.monotonic()
+        logger.debug("[ChoiceSession]: 已登录。")
+
+    def _stop(self) -> None:
+        if self.running:
+            self.running = False
+            try:
+                self.api.stop()
+            except Exception as e:
+                logger.warning(f"[ChoiceSession]: 退出登录失败：{e}")
+            logger.debug("[ChoiceSession]: 已退出登录。")
+
+    def _healthy(self) -> bool:
+        today = date.today().strftime("%Y-%m-%d")
+        try:
+            result = self.api.tradedates(today, today, "")
+        except Exception as e:
+            logger.warning(f"[ChoiceSession]: 健康检查失败：{e}")
+            return False
+        return getattr(result, "ErrorCode", 0) == 0
+
+    def _ensure(self) -> None:
+        # 调用方已持有 self.lock
+        if not self.running:
+            self._start()
+        elif 0 <= self.health_interval < time.monotonic() - self._last_ok and not self._healthy():
+            logger.info("[ChoiceSession]: 会话不可用，重新登录。")
+            self._stop()
+            self._start()
+
+    @contextmanager
+    def borrow(self, timeout: float = -1) -> Iterator[Any]:
+        """独占地借出 EmQuantAPI 的 `c` 对象，必要时先登录。"""
+        with self._state:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not self.lock.acquire(timeout=timeout):
+            raise TimeoutError("Timeout while waiting to acquire Choice API lock")
+        try:
+            self._ensure()
+            yield self.api
+            self._last_ok = time.monotonic()
+        finally:
+            self.lock.release()
+            self._schedule_idle_stop()
+
+    def _schedule_idle_stop(self) -> None:
+        if self.idle_timeout < 0:
+            return
+        with self._state:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = Timer(self.idle_timeout, self._idle_stop)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _idle_stop(self) -> None:
+        # 正在被使用时不退出，归还时会重新计时
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self._last_ok >= self.idle_timeout:
+                self._stop()
+        finally:
+            self.lock.release()
+
+    def close(self) -> None:
+        with self._state:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        with self.lock:
+            self._stop()
+
+    def csd(self, code: str, indicators: str, start: str, end: str, options: str, timeout: float = -1) -> pd.DataFrame:
+        """
+        单个代码的 csd 请求，返回 reset_index 后的 DataFrame。
+
+        参数相同、代码不同的并发请求会合并：第一个到达的请求等待 batch_window 秒后，把排队的代码合并为一次 csd_many 调用。
+        """
+        key = (indicators, start, end, options)
+        future: Future = Future()
+        with self._state:
+            leader = key not in self._pending
+            self._pending.setdefault(key, []).append((code, future))
+        if leader:
+            if self.batch_window > 0:
+                time.sleep(self.batch_window)
+            with self._state:
+                requests = self._pending.pop(key)
+            try:
+                frames, errors = self._csd_codes(list(dict.fromkeys(c for c, _ in requests)), indicators, start, end, options, timeout)
+            except BaseException as e:
+                for _, f in requests:
+                    f.set_exception(e)
+            else:
+                # 只有出错的代码对应的请求抛出异常，其余请求正常返回
+                for c, f in requests:
+                    if c in errors:
+                        f.set_exception(errors[c])
+                    else:
+                        f.set_result(frames[c].copy())
+        return future.result()
+
+    def csd_many(self, codes: List[str], indicators: str, start: str, end: str, options: str, timeout: float = -1) -> Dict[str, pd.DataFrame]:
+        """
+        多个代码的 csd 请求，每 batch_size 个代码调用一次，返回 {代码: reset_index 后的 DataFrame}；没有数据的代码对应空表。
+
+        多代码调用出错时（通常是其中某个代码无效）退回逐个调用；所有代码都请求完之后，如有代码出错则抛出第一个错误。
+        """
+        frames, errors = self._csd_codes(codes, indicators, start, end, options, timeout)
+        if errors:
+            raise next(iter(errors.values()))
+        return frames
+
+    def _csd_codes(self, codes: List[str], indicators: str, start: str, end: str, options: str,
+                   timeout: float) -> Tuple[Dict[str, pd.DataFrame], Dict[str, Exception]]:
+        """
+        返回 ({代码: DataFrame}, {代码: 异常})：Choice 返回错误的代码记在第二个字典中，不影响其他代码；
+        连接、超时等整批失败的异常直接抛出。
+        """
+        frames: Dict[str, pd.DataFrame] = {}
+        errors: Dict[str, Exception] = {}
+        for i in range(0, len(codes), self.batch_size):
+            chunk = codes[i:i + self.batch_size]
+            with self.borrow(timeout=timeout) as choice:
+                data = choice.csd(",".join(chunk), indicators, start, end, options)
+                failed = isinstance(data, choice.EmQuantData) and data.ErrorCode != 0
+            if failed and len(chunk) > 1:
+                logger.info(f"[ChoiceSession]: {len(chunk)} 个代码的 csd 调用失败（{data.ErrorMsg}），改为逐个调用。")
+                for code in chunk:
+                    part, error = self._csd_codes([code], indicators, start, end, options, timeout)
+                    frames.update(part)
+                    errors.update(error)
+                continue
+            if failed:
+                errors[chunk[0]] = ValueError(f"Error fetching data from Choice API: {data.ErrorMsg}")
+                continue
+            if not isinstance(data, pd.DataFrame):
+                raise ValueError("Unexpected data format received from Choice API")
+            df = data.reset_index()
+            if "CODES" in df.columns and len(chunk) > 1:
+                parts = {str(k).upper(): part.reset_index(drop=True) for k, part in df.groupby("CODES", sort=False)}
+                for code in chunk:
+                    frames[code] = parts.get(code.upper(), df.iloc[0:0])
+            else:
+                frames[chunk[0]] = df
+        return frames, errors
+
 class ChoiceDataSource(OHLCDataSource):
 
     name = "choice"
-    choice: Any  # Placeholder for EmQuantAPI module
-    choice_running: bool = False
-    lock: Lock
-    release_timer: Timer
+    fields = "OPEN,CLOSE,HIGH,LOW,VOLUME"
+    _session: Optional[ChoiceSession] = None
+    _session_lock = Lock()
 
     freq_map = {
         DataFrequency.DAILY: '1',
@@ -33,60 +238,64 @@ class ChoiceDataSource(OHLCDataSource):
         db_path=os.getenv("FINTOOLS_DB", ""),
         key_fields=("symbol", "freq"),
         except_fields=("type",),
-        missing_threshold=5
+        missing_threshold=5,
+        normalizers={"symbol": upper_symbol},
     )
-    def history(self, symbol: str, type: UnderlyingType = UnderlyingType.UNKNOWN, start: Union[str, datetime, date, int] = 0, end: Union[str, datetime, date, int] = datetime.now(), freq: DataFrequency = DataFrequency.DAILY) -> pd.DataFrame:
-        yf_freq = self._map_frequency(freq)
+    def history(self, symbol: str, type: UnderlyingType = UnderlyingType.UNKNOWN, start: Union[str, datetime, date, int] = 0, end: Optional[Union[str, datetime, date, int]] = None, freq: DataFrequency = DataFrequency.DAILY) -> pd.DataFrame:
+        start_date = self._parse_datetime(start)
+        end_date = self._parse_datetime(end)
+        df = self.session().csd(symbol, self.__class__.fields, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"), self._options(freq), timeout=30)
+        return self._format_quotes(df)
+
+    def _history_batch(self, symbol: List[str], type: UnderlyingType, start: Union[str, datetime, date, int], end: Union[str, datetime, date, int], freq: Union[DataFrequency, List[DataFrequency]]) -> pd.DataFrame:
+        """
+        用 csd 的多代码调用一次下载多个 symbol，按 freq 分组。
+        """
         start_date = self._parse_datetime(start)
         end_date = self._parse_datetime(end)
-        with self.borrow_choice(timeout=30) as choice:
-            data = choice.csd(symbol, "OPEN,CLOSE,HIGH,LOW,VOLUME", start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"), f"period={yf_freq},adjustflag=1,curtype=1,order=1,Ispandas=1")
-        if isinstance(data, choice.EmQuantData) and data.ErrorCode != 0:
-            raise ValueError(f"Error fetching data from Choice API: {data.ErrorMsg}")
-        if not isinstance(data, pd.DataFrame):
-            raise ValueError("Unexpected data format received from Choice API")
-        df = data.reset_index()
+        freqs = list(freq) if isinstance(freq, (list, tuple)) else [freq] * len(symbol)
+        frames = []
+        for f in dict.fromkeys(freqs):
+            codes = [s for s, g in zip(symbol, freqs) if g == f]
+            quotes = self.session().csd_many(codes, self.__class__.fields, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"), self._options(f), timeout=30)
+            for code in codes:
+                df = self._format_quotes(quotes[code])
+                if df.empty:
+                    continue
+                df.insert(0, "freq", f)
+                df.insert(0, "symbol", code)
+                frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=["symbol", "freq"] + STANDARD_COLUMN_NAMES)
+        return pd.concat(frames, ignore_index=True)
+
+    def _options(self, freq: DataFrequency) -> str:
+        return f"period={self._map_frequency(freq)},adjustflag=1,curtype=1,order=1,Ispandas=1"
+
+    def _format_quotes(self, df: pd.DataFrame) -> pd.DataFrame:
+        if df.empty:
+            return pd.DataFrame(columns=STANDARD_COLUMN_NAMES)
+        df = df.copy()
         df['DATES'] = pd.to_datetime(df['DATES']).dt.tz_localize("Asia/Shanghai")
         return self._format_dataframe(df)
 
     @classmethod
-    def _release(cls):
-        if hasattr(cls, 'choice'):
-            cls.choice.stop()
-            cls.choice_running = False
-            if cls.lock.locked(): cls.lock.release()
-            cls.release_timer.cancel()
-        
+    def session(cls) -> ChoiceSession:
+        """进程内共用的 Choice 会话。"""
+        with cls._session_lock:
+            if cls._session is None:
+                cls._session = ChoiceSession()
+                atexit.register(cls._session.close)
+            return cls._session
+
     @classmethod
     @contextmanager
-    def borrow_choice(cls, timeout: float = -1, release_after: float = 5.0):
-        try:
-            if not hasattr(cls, 'choice'):
-                cls.choice = importlib.import_module("EmQuantAPI").c
-                cls.lock = Lock()
-        except (ModuleNotFoundError, AttributeError) as e:
-            raise ImportError("EmQuantAPI module is not installed. Please install it to use ChoiceDataSource.") from e
-
-        if not cls.choice_running:
-            cls.choice_running = True
-            cls.choice.start(f"ForceLogin=1,UserName={os.getenv('CHOICE_USERNAME','')},Password={os.getenv('CHOICE_PASSWORD','')}")
-        if hasattr(cls, 'release_timer'):
-            cls.release_timer.cancel()
-        
-        try:
-            if cls.lock.acquire(timeout=timeout):
-                yield cls.choice
-            else:
-                raise TimeoutError("Timeout while waiting to acquire Choice API lock")
-        except TimeoutError as e:
-            raise e
-        finally:
-            cls.lock.release()
-            cls.release_timer = Timer(release_after, cls._release)
-            cls.release_timer.start()
+    def borrow_choice(cls, timeout: float = -1):
+        with cls.session().borrow(timeout=timeout) as choice:
+            yield choice
 
     def subscribe(self, symbol: str, interval: str, callback: Callable) -> None:
         raise NotImplementedError("Yahoo Finance does not support real-time data subscription")
 
     def unsubscribe(self, symbol: str, interval: str) -> None:
-        raise NotImplementedError("Yahoo Finance does not support real-time data unsubscription")
\ No newline at end of file
+        raise NotImplementedError("Yahoo Finance does not support real-time data unsubscription")
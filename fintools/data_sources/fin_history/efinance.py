@@ -1,9 +1,11 @@
-from .base import OHLCDataSource, UnderlyingType, DataFrequency
+from .base import OHLCDataSource, UnderlyingType, DataFrequency, STANDARD_COLUMN_NAMES
 from fintools.databases.history_db import history_cache
+from fintools.databases.keys import strip_symbol
 import pandas as pd
 import os
-from typing import Optional, Callable, Union
+from typing import Optional, Callable, Union, List, Dict
 from datetime import datetime, date, timedelta
+from zoneinfo import ZoneInfo
 
 import efinance as ef
 
@@ -28,23 +30,65 @@ class EFinanceDataSource(OHLCDataSource):
         table_basename=name,
         db_path=os.getenv("FINTOOLS_DB", ""),
         key_fields=("symbol", "freq"),
-        except_fields=("type",)
+        except_fields=("type",),
+        normalizers={"symbol": strip_symbol},
     )
-    def history(self, symbol: str, type: UnderlyingType = UnderlyingType.INDEX, start: Union[str, datetime, date, int] = 0, end: Union[str, datetime, date, int] = datetime.now(), freq: DataFrequency = DataFrequency.DAILY) -> pd.DataFrame:
-        ef_freq = int(self._map_frequency(freq))
+    def history(self, symbol: str, type: UnderlyingType = UnderlyingType.INDEX, start: Union[str, datetime, date, int] = 0, end: Optional[Union[str, datetime, date, int]] = None, freq: DataFrequency = DataFrequency.DAILY) -> pd.DataFrame:
         start_date = self._parse_datetime(start)
         end_date = self._parse_datetime(end)
+        df = self._quote_api(type)(symbol, klt=int(self._map_frequency(freq)), **self._date_range(start_date, end_date))
+        assert isinstance(df, pd.DataFrame)
+        return self._format_quotes(df, start_date, end_date)
+
+    def _history_batch(self, symbol: List[str], type: UnderlyingType, start: Union[str, datetime, date, int], end: Union[str, datetime, date, int], freq: Union[DataFrequency, List[DataFrequency]]) -> pd.DataFrame:
+        """
+        用 efinance 的多代码接口（内部并发请求）一次下载多个 symbol，按 freq 分组调用。期货接口不支持多代码，逐个下载。
+        """
+        start_date = self._parse_datetime(start)
+        end_date = self._parse_datetime(end)
+        freqs = list(freq) if isinstance(freq, (list, tuple)) else [freq] * len(symbol)
+        api = self._quote_api(type)
+        frames = []
+        for f in dict.fromkeys(freqs):
+            codes = [s for s, g in zip(symbol, freqs) if g == f]
+            kwargs = {"klt": int(self._map_frequency(f)), **self._date_range(start_date, end_date)}
+            if type == UnderlyingType.COMMODITY:
+                quotes: Dict[str, pd.DataFrame] = {code: api(code, **kwargs) for code in codes}
+            else:
+                result = api(codes, **kwargs)
+                quotes = result if isinstance(result, dict) else {codes[0]: result}
+            for code in codes:
+                df = quotes.get(code)
+                if df is None or df.empty:
+                    continue
+                df = self._format_quotes(df, start_date, end_date)
+                df.insert(0, "freq", f)
+                df.insert(0, "symbol", code)
+                frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=["symbol", "freq"] + STANDARD_COLUMN_NAMES)
+        return pd.concat(frames, ignore_index=True)
+
+    @staticmethod
+    def _quote_api(type: UnderlyingType) -> Callable[..., Union[pd.DataFrame, Dict[str, pd.DataFrame]]]:
         if type in [UnderlyingType.STOCK, UnderlyingType.FUND, UnderlyingType.INDEX]:
-            # if start_date.time() == datetime.min.time() and end_date.time() == datetime.min.time():
-            #     end_date = end_date + self._datetime_shift_base(freq)
-            df = ef.stock.get_quote_history(symbol, klt=ef_freq)
+            return ef.stock.get_quote_history
         elif type == UnderlyingType.COMMODITY:
-            df = ef.futures.get_quote_history(symbol, klt=ef_freq)
+            return ef.futures.get_quote_history
         elif type == UnderlyingType.BOND:
-            df = ef.bond.get_quote_history(symbol, klt=ef_freq)
+            return ef.bond.get_quote_history
         else:
             raise ValueError(f"Unsupported UnderlyingType: {type}")
-        assert isinstance(df, pd.DataFrame)
+
+    @staticmethod
+    def _date_range(start_date: datetime, end_date: datetime) -> Dict[str, str]:
+        # beg / end 为北京时间的日期且包含 end 当天；[start, end) 的精确范围在 _format_quotes 中再过滤
+        tz = ZoneInfo("Asia/Shanghai")
+        last = max(start_date, end_date - timedelta(microseconds=1))
+        return {"beg": start_date.astimezone(tz).strftime("%Y%m%d"), "end": last.astimezone(tz).strftime("%Y%m%d")}
+
+    def _format_quotes(self, df: pd.DataFrame, start_date: datetime, end_date: datetime) -> pd.DataFrame:
+        df = df.copy()
         df['date'] = pd.to_datetime(df['日期']).dt.tz_localize('Asia/Shanghai')
         df.drop(columns=['日期'], inplace=True)
         df = df[(df['date'] >= start_date) & (df['date'] < end_date)]
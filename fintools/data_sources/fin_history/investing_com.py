@@ -1,24 +1,172 @@
-from .base import OHLCDataSource, UnderlyingType, DataFrequency
+from .base import OHLCDataSource, UnderlyingType, DataFrequency, STANDARD_COLUMN_NAMES
 from fintools.databases.history_db import history_cache
+from fintools.databases.common_db import common_cache
+from fintools.databases.keys import lower_symbol
 import pandas as pd
 import sqlite3
-from typing import Optional, Callable, Union
-from threading import Lock
+from typing import Optional, Callable, Union, Any, Awaitable, Dict, List
+from threading import Lock, Thread
 from datetime import datetime, date
 
 from lxml import etree
 import requests
 import json
-from playwright.sync_api import sync_playwright, Response
-import pandas as pd
+import asyncio
+import atexit
 import os
 import logging
 logger = logging.getLogger(__name__)
 
-from typing import Optional, Union
-
 from typing_extensions import deprecated
 
+
+class BrowserPool:
+    """
+    可复用的 Playwright 浏览器上下文池。
+
+    Playwright 的同步 API 只能在创建它的线程中使用，因此浏览器运行在一个专用线程的事件循环中（async API），
+    各线程通过 get / get_many 提交请求；最多同时打开 size 个 BrowserContext，用完归还而不是关闭，
+    页面请求在这些上下文上并发执行。浏览器在第一次请求时才启动。
+    """
+    def __init__(self, size: int = int(os.getenv("INVESTING_BROWSER_CONTEXTS", "4")),
+                 timeout: float = float(os.getenv("INVESTING_PAGE_TIMEOUT", "60")),
+                 launch: Optional[Callable[[], Awaitable[Any]]] = None):
+        """
+        参数：
+            size: 最多同时打开的 BrowserContext 数，即并发的页面请求数
+            timeout: 单个页面请求（含等待空闲上下文）的超时秒数
+            launch: 在事件循环中启动并返回浏览器的协程函数，默认启动无头 Firefox；测试时可以换成假的浏览器
+        """
+        assert size > 0, "size 必须为正数"
+        self.size = size
+        self.timeout = timeout
+        self.launch = launch or self._launch_firefox
+        self.browser: Any = None
+        self._playwright: Any = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[Thread] = None
+        self._lock = Lock()
+        self._idle: List[Any] = []
+        self._launching: Optional[asyncio.Lock] = None
+        # 保护 _idle / _created；归还上下文或释放名额时通知等待者
+        self._available: Optional[asyncio.Condition] = None
+        self._created = 0
+
+    async def _launch_firefox(self) -> Any:
+        from playwright.async_api import async_playwright
+        self._playwright = await async_playwright().start()
+        return await self._playwright.firefox.launch(headless=True)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = Thread(target=loop.run_forever, name="fintools-investing", daemon=True)
+                self._thread.start()
+                self._loop = loop
+                self._launching = asyncio.Lock()
+                self._available = asyncio.Condition()
+            return self._loop
+
+    async def _acquire(self) -> Any:
+        assert self._launching is not None and self._available is not None
+        async with self._launching:
+            if self.browser is None:
+                self.browser = await self.launch()
+        async with self._available:
+            # 有空闲上下文时直接借出，否则在名额内新建；都没有时等待归还或释放名额
+            while not self._idle and self._created >= self.size:
+                await self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        try:
+            context = await self.browser.new_context()
+            try:
+                await context.route("**/*", self._route_handler)
+            except BaseException:
+                await self._close_context(context)
+                raise
+        except BaseException:
+            await self._release(None)
+            raise
+        return context
+
+    async def _release(self, context: Any) -> None:
+        """归还上下文；context 为 None 时表示该上下文已丢弃，释放它的名额，等待者可以重新创建。"""
+        assert self._available is not None
+        async with self._available:
+            if context is None:
+                self._created -= 1
+            else:
+                self._idle.append(context)
+            self._available.notify()
+
+    @staticmethod
+    async def _close_context(context: Any) -> None:
+        try:
+            await context.close()
+        except Exception as e:
+            logger.debug(f"[BrowserPool]: 关闭上下文失败：{e}")
+
+    @staticmethod
+    async def _route_handler(route: Any) -> None:
+        # 只允许主文档（index.html）
+        if route.request.resource_type == "document":
+            await route.continue_()
+        else:
+            await route.abort()
+
+    async def _fetch(self, url: str) -> bytes:
+        context = await self._acquire()
+        try:
+            page = await context.new_page()
+            try:
+                res = await page.goto(url, wait_until="networkidle")
+                if res is None:
+                    raise ValueError(f"Failed to load URL: {url}")
+                body = await res.body()
+            finally:
+                await page.close()
+        except BaseException:
+            # 出错（含超时取消）的上下文可能已经损坏：释放名额，由等待者或下一个请求重新创建，再关闭它
+            await self._release(None)
+            await self._close_context(context)
+            raise
+        await self._release(context)
+        return body
+
+    def get(self, url: str) -> bytes:
+        """在池中的一个上下文里打开 url，返回主文档的响应体。"""
+        return self.get_many([url])[0]
+
+    def get_many(self, urls: List[str]) -> List[bytes]:
+        """并发打开多个 url（最多 size 个同时进行），按顺序返回响应体；任一请求失败时抛出其异常。"""
+        async def gather() -> List[bytes]:
+            return list(await asyncio.gather(*[asyncio.wait_for(self._fetch(url), self.timeout) for url in urls]))
+        return asyncio.run_coroutine_threadsafe(gather(), self._ensure_loop()).result()
+
+    def close(self) -> None:
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def shutdown() -> None:
+            if self.browser is not None:
+                await self.browser.close()
+            if self._playwright is not None:
+                await self._playwright.stop()
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"[BrowserPool]: 关闭浏览器失败：{e}")
+        finally:
+            self.browser, self._playwright, self._idle, self._created = None, None, [], 0
+            loop.call_soon_threadsafe(loop.stop)
+
+
 @deprecated("InvestingComDataSource is not available now.")
 class InvestingComDataSource(OHLCDataSource):
 
@@ -36,7 +184,18 @@ class InvestingComDataSource(OHLCDataSource):
         DataFrequency.MONTHLY: 'P1M'
     }
     column_names = ["date", "open", "high", "low", "close", "volume"]
-
+    types = {
+        UnderlyingType.INDEX: "indices",
+        UnderlyingType.STOCK: "equities",
+        UnderlyingType.COMMODITY: "commodities",
+        UnderlyingType.BOND: "rates-bonds",
+        UnderlyingType.FOREX: "currencies",
+        UnderlyingType.CRYPTO: "currencies",
+    }
+    _pool: Optional[BrowserPool] = None
+    _pool_lock = Lock()
+    # 进程内的 instrument id 缓存；FINTOOLS_DB 非空时 instrument_id 另外持久化在缓存库中
+    _instrument_ids: Dict[tuple, str] = {}
 
     def __init__(self) -> None:
         self.headers = {
@@ -51,37 +210,54 @@ class InvestingComDataSource(OHLCDataSource):
             'Sec-Fetch-User': '?1',
             'Priority': 'u=0, i'
         }
-        self._playwright = sync_playwright().start()
-        self.browser = self._playwright.firefox.launch(headless=True)
-        self.lock = Lock()
-    
-    def __del__(self) -> None:
-        self.browser.close()
-        self._playwright.stop()
-    
+
+    @classmethod
+    def pool(cls) -> BrowserPool:
+        """进程内共用的浏览器上下文池，第一次请求页面时才启动 Playwright。"""
+        with cls._pool_lock:
+            if cls._pool is None:
+                cls._pool = BrowserPool()
+                atexit.register(cls._pool.close)
+            return cls._pool
+
     @history_cache(
         table_basename="investing_com",
         db_path=os.getenv("FINTOOLS_DB", ""),
         key_fields=("symbol", "freq"),
         common_fields= ("type",),
         except_fields=(),
+        normalizers={"symbol": lower_symbol},
     )
-    def history(self, symbol: str, type: UnderlyingType, start: Union[str, datetime, date, int] = 0, end: Union[str, datetime, date, int] = datetime.now(), freq: DataFrequency = DataFrequency.DAILY) -> pd.DataFrame:
+    def history(self, symbol: str, type: UnderlyingType, start: Union[str, datetime, date, int] = 0, end: Optional[Union[str, datetime, date, int]] = None, freq: DataFrequency = DataFrequency.DAILY) -> pd.DataFrame:
         ic_freq = self._map_frequency(freq)
-        if type == UnderlyingType.INDEX:
-            data = self.load_data(name=symbol, type="indices", freq=ic_freq)
-        elif type == UnderlyingType.STOCK:
-            data = self.load_data(name=symbol, type="equities", freq=ic_freq)
-        elif type == UnderlyingType.COMMODITY:
-            data = self.load_data(name=symbol, type="commodities", freq=ic_freq)
-        elif type == UnderlyingType.BOND:
-            data = self.load_data(name=symbol, type="rates-bonds", freq=ic_freq)
-        elif type == UnderlyingType.FOREX:
-            data = self.load_data(name=symbol, type="currencies", freq=ic_freq)
-        elif type == UnderlyingType.CRYPTO:
-            data = self.load_data(name=symbol, type="currencies", freq=ic_freq)
-        else:
+        data = self.load_data(name=symbol, type=self._investing_type(type), freq=ic_freq)
+        return self._filter_range(data, start, end, freq)
+
+    def _history_batch(self, symbol: List[str], type: UnderlyingType, start: Union[str, datetime, date, int], end: Union[str, datetime, date, int], freq: Union[DataFrequency, List[DataFrequency]]) -> pd.DataFrame:
+        """
+        先查出各 symbol 的 instrument id，再在浏览器上下文池中并发请求所有图表接口。
+        """
+        freqs = list(freq) if isinstance(freq, (list, tuple)) else [freq] * len(symbol)
+        ids = [self.instrument_id(s, self._investing_type(type)) for s in symbol]
+        bodies = self.pool().get_many([self._chart_url(i, self._map_frequency(f)) for i, f in zip(ids, freqs)])
+        frames = []
+        for s, f, body in zip(symbol, freqs, bodies):
+            df = self._filter_range(self._parse_chart(body), start, end, f)
+            if df.empty:
+                continue
+            df.insert(0, "freq", f)
+            df.insert(0, "symbol", s)
+            frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=["symbol", "freq"] + STANDARD_COLUMN_NAMES)
+        return pd.concat(frames, ignore_index=True)
+
+    def _investing_type(self, type: UnderlyingType) -> str:
+        if type not in self.__class__.types:
             raise NotImplementedError(f"UnderlyingType {type} not supported in Investing.com data source")
+        return self.__class__.types[type]
+
+    def _filter_range(self, data: pd.DataFrame, start: Union[str, datetime, date, int], end: Union[str, datetime, date, int], freq: DataFrequency) -> pd.DataFrame:
         start_date = self._parse_datetime(start)
         end_date = self._parse_datetime(end)
         if start_date.time() == datetime.min.time() and end_date.time() == datetime.min.time():
@@ -95,25 +271,8 @@ class InvestingComDataSource(OHLCDataSource):
     def unsubscribe(self, symbol: str, interval: str) -> None:
         raise NotImplementedError("Investing.com does not support real-time data unsubscription")
 
-    def _route_handler(self, route):
-        req = route.request
-
-        # 只允许主文档（index.html）
-        if req.resource_type == "document":
-            route.continue_()
-        else:
-            route.abort()
-
     def driver_get(self, url: str) -> bytes:
-        with self.lock:
-            page = self.browser.new_page()
-            page.route("**/*", self._route_handler)
-            res = page.goto(url, wait_until="networkidle")
-            if res is None:
-                raise ValueError(f"Failed to load URL: {url}")
-            body = res.body()
-            page.close()
-            return body
+        return self.pool().get(url)
 
     def grab_investing_com_html(self, name: str, type: str) -> str:
         url = f"https://www.investing.com/{type}/{name}"
@@ -141,20 +300,40 @@ class InvestingComDataSource(OHLCDataSource):
         except KeyError:
             raise ValueError("Instrument ID not found in metadata.")
     
-    def load_data(self, name: Optional[str] = None, type: str = "indices", freq: str = "P1D", instrument_id: Optional[Union[str, int]] = None) -> pd.DataFrame:
-        if instrument_id is None:
-            if name is None:
-                raise ValueError("Either 'name' or 'instrument_id' must be provided.")
+    @common_cache(
+        table_basename="investing_com_instruments",
+        db_path=os.getenv("FINTOOLS_DB", ""),
+        key_fields=("name", "type"),
+        common_fields=(),
+        except_fields=()
+    )
+    def instrument_id(self, name: str, type: str) -> str:
+        """抓取 https://www.investing.com/{type}/{name} 页面，解析出 instrument id。同一进程内只抓取一次。"""
+        key = (name, type)
+        if key not in self.__class__._instrument_ids:
             try:
                 html = self.grab_investing_com_html(name, type)
                 metadata = self.get_investing_com_metadata(html)
-                instrument_id = self.get_investing_com_instrument_id(metadata)
+                self.__class__._instrument_ids[key] = str(self.get_investing_com_instrument_id(metadata))
             except Exception as e:
                 raise ValueError(f"Error retrieving instrument ID for index '{name}': {e}")
+        return self.__class__._instrument_ids[key]
+
+    def load_data(self, name: Optional[str] = None, type: str = "indices", freq: str = "P1D", instrument_id: Optional[Union[str, int]] = None) -> pd.DataFrame:
+        if instrument_id is None:
+            if name is None:
+                raise ValueError("Either 'name' or 'instrument_id' must be provided.")
+            instrument_id = self.instrument_id(name, type)
         else: instrument_id = str(instrument_id)
-        url = f"https://api.investing.com/api/financialdata/{instrument_id}/historical/chart/?interval={freq}&pointscount=160"
-        res = self.driver_get(url)
-        data = json.loads(res.decode('utf-8'))
+        return self._parse_chart(self.driver_get(self._chart_url(instrument_id, freq)))
+
+    @staticmethod
+    def _chart_url(instrument_id: Union[str, int], freq: str) -> str:
+        return f"https://api.investing.com/api/financialdata/{instrument_id}/historical/chart/?interval={freq}&pointscount=160"
+
+    @staticmethod
+    def _parse_chart(body: bytes) -> pd.DataFrame:
+        data = json.loads(body.decode('utf-8'))
         data = data['data']
         df = pd.DataFrame(data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'null'])
         df['date'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
@@ -1,13 +1,30 @@
 from .base import OHLCDataSource, UnderlyingType, DataFrequency
 from fintools.databases.history_db import history_cache
+from fintools.databases.keys import strip_symbol
 import pandas as pd
 import sqlite3
 import os
-from typing import Optional, Callable, Union
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Callable, Union, Dict, Tuple, Any
 from datetime import datetime, date, timedelta
 
 import requests
 
+import logging
+logger = logging.getLogger(__name__)
+
+
+class _FullSeries:
+    """服务端不支持按区间查询时缓存的整段响应。"""
+    def __init__(self, data: list, etag: Optional[str], last_modified: Optional[str]):
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = time.monotonic()
+
+
 class NanHuaDataSource(OHLCDataSource):
 
     name = "nanhua"
@@ -25,12 +42,37 @@ class NanHuaDataSource(OHLCDataSource):
         DataFrequency.MONTHLY: 'MONTH1'
     }
     column_names = ["date", "open", "high", "low", "close", "volume"]
+    # 按区间查询时使用的参数名，取值为毫秒时间戳（与 quoteTime 相同）
+    range_params = ("startTime", "endTime")
+    # 各服务地址是否支持按区间查询：None 表示尚未确认
+    range_supported: Dict[str, Optional[bool]] = {}
 
 
-    def __init__(self, data_server_url: str = os.getenv("NANHUA_SERVER_URL", "http://localhost:13200/")):
+    def __init__(self, data_server_url: str = os.getenv("NANHUA_SERVER_URL", "http://localhost:13200/"),
+                 cache_ttl: float = float(os.getenv("NANHUA_CACHE_TTL", "60")),
+                 cache_size: int = int(os.getenv("NANHUA_CACHE_SIZE", "32"))):
+        """
+        参数：
+            data_server_url: 数据服务地址
+            cache_ttl: 服务端不支持按区间查询时，整段响应在 TTL 秒内直接复用，过期后带 ETag / Last-Modified 重新验证
+            cache_size: 最多缓存多少个 (ticker, freq) 的整段响应
+        """
         if not data_server_url.endswith('/'):
             data_server_url += '/'
         self.data_server_url = data_server_url
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._local = threading.local()
+        self._full: "OrderedDict[Tuple[str, str], _FullSeries]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """每个线程一个 keep-alive 会话。"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
 
 
     @history_cache(
@@ -39,19 +81,74 @@ class NanHuaDataSource(OHLCDataSource):
         key_fields=("symbol",),
         common_fields= ("freq", ),
         except_fields=("type", ),
+        normalizers={"symbol": strip_symbol},
     )
-    def history(self, symbol: str, type: UnderlyingType = UnderlyingType.INDEX, start: Union[str, datetime, date, int] = 0, end: Union[str, datetime, date, int] = datetime.now(), freq: DataFrequency = DataFrequency.DAILY) -> pd.DataFrame:
+    def history(self, symbol: str, type: UnderlyingType = UnderlyingType.INDEX, start: Union[str, datetime, date, int] = 0, end: Optional[Union[str, datetime, date, int]] = None, freq: DataFrequency = DataFrequency.DAILY) -> pd.DataFrame:
         nh_freq = self._map_frequency(freq)
-        data_raw = requests.get(f'{self.data_server_url}?ticker={symbol}&freq={nh_freq}').json()
-        df = pd.DataFrame(data_raw)
-        df["date"] = pd.to_datetime(df['quoteTime'], unit='ms', utc=True)
         start_date = self._parse_datetime(start)
         end_date = self._parse_datetime(end)
         if start_date.time() == datetime.min.time() and end_date.time() == datetime.min.time():
             end_date = end_date + self._datetime_shift_base(freq)
+        df = pd.DataFrame(self._fetch(symbol, nh_freq, start_date, end_date))
+        if df.empty:
+            return self._format_dataframe(pd.DataFrame(columns=self.__class__.column_names))
+        df["date"] = pd.to_datetime(df['quoteTime'], unit='ms', utc=True)
         df = pd.DataFrame(df[(df["date"] >= start_date) & (df["date"] <= end_date)])
         return self._format_dataframe(df)
 
+    def _fetch(self, symbol: str, nh_freq: str, start_date: datetime, end_date: datetime) -> list:
+        """
+        取 [start_date, end_date] 内的原始数据行。
+
+        先带上区间参数请求；若返回了区间之外的数据，说明服务端忽略了这些参数，之后对该服务改为请求整段数据并在本地缓存。
+        """
+        params: Dict[str, Any] = {"ticker": symbol, "freq": nh_freq}
+        supported = self.__class__.range_supported.get(self.data_server_url)
+        if supported is not False:
+            start_ms, end_ms = int(start_date.timestamp() * 1000), int(end_date.timestamp() * 1000)
+            res = self.session.get(self.data_server_url, params={**params, self.range_params[0]: start_ms, self.range_params[1]: end_ms})
+            res.raise_for_status()
+            data = res.json()
+            if any(row["quoteTime"] < start_ms or row["quoteTime"] > end_ms for row in data):
+                logger.info(f"[NanHua]: {self.data_server_url} 不支持按区间查询，改为缓存整段数据。")
+                self.__class__.range_supported[self.data_server_url] = False
+                self._store_full((symbol, nh_freq), res, data)
+                return data
+            if data:
+                self.__class__.range_supported[self.data_server_url] = True
+            return data
+        return self._fetch_full(symbol, nh_freq, params)
+
+    def _fetch_full(self, symbol: str, nh_freq: str, params: Dict[str, Any]) -> list:
+        """整段数据在 TTL 内直接复用；过期后带 If-None-Match / If-Modified-Since 请求，304 时继续使用旧数据。"""
+        key = (symbol, nh_freq)
+        with self._lock:
+            cached = self._full.get(key)
+            if cached is not None:
+                self._full.move_to_end(key)
+        if cached is not None and time.monotonic() - cached.fetched_at < self.cache_ttl:
+            return cached.data
+        headers = {}
+        if cached is not None and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached is not None and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+        res = self.session.get(self.data_server_url, params=params, headers=headers)
+        if res.status_code == 304 and cached is not None:
+            cached.fetched_at = time.monotonic()
+            return cached.data
+        res.raise_for_status()
+        data = res.json()
+        self._store_full(key, res, data)
+        return data
+
+    def _store_full(self, key: Tuple[str, str], res: requests.Response, data: list) -> None:
+        with self._lock:
+            self._full[key] = _FullSeries(data, res.headers.get("ETag"), res.headers.get("Last-Modified"))
+            self._full.move_to_end(key)
+            while len(self._full) > self.cache_size:
+                self._full.popitem(last=False)
+
 
     def subscribe(self, symbol: str, interval: str, callback: Callable) -> None:
         raise NotImplementedError("NanHuaDataSource does not support real-time data subscription")
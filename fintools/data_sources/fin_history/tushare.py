@@ -1,14 +1,24 @@
-from .base import OHLCDataSource, UnderlyingType, DataFrequency
+from .base import OHLCDataSource, UnderlyingType, DataFrequency, STANDARD_COLUMN_NAMES
+from .. import bar_duration
 from fintools.databases.history_db import history_cache
+from fintools.databases.keys import upper_symbol
+from fintools.databases import UpsertResult
+from fintools.databases.cache_server import CacheServerError
+from fintools.databases.rate_limit import RateLimitProxy
 import pandas as pd
 import sqlite3
 import os
-from typing import Optional, Callable, Union
-from datetime import datetime, date
+from typing import Optional, Callable, Union, List, Dict, Tuple
+from datetime import datetime, date, timedelta
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import tushare as ts
 from tushare.pro.client import DataApi
 
+import logging
+logger = logging.getLogger(__name__)
+
 
 class TushareDataSource(OHLCDataSource):
 
@@ -25,6 +35,17 @@ class TushareDataSource(OHLCDataSource):
         DataFrequency.MONTHLY: 'monthly'
     }
     column_names = ["trade_date", "open", "high", "low", "close", "vol"]
+    # 支持按 trade_date 一次返回全市场日线的接口
+    cross_section_apis = {
+        UnderlyingType.STOCK: "daily",
+        UnderlyingType.FUND: "fund_daily",
+    }
+    # stk_mins / fut_mins 单次调用最多返回的行数，超出的部分会被静默截断
+    minute_row_limit = int(os.getenv("TUSHARE_MINUTE_ROW_LIMIT", "8000"))
+    # 并发拉取分钟线窗口的线程数，实际请求速率由 rate_limit 中 tushare 的配额控制
+    minute_workers = int(os.getenv("TUSHARE_MINUTE_WORKERS", "4"))
+    # 每个自然日最多的交易分钟数：A 股 4 小时，期货连同夜盘最长约 9 小时 15 分
+    session_minutes = {"stk_mins": 240, "fut_mins": 555}
 
     pro: DataApi
 
@@ -32,7 +53,7 @@ class TushareDataSource(OHLCDataSource):
         if token is None and os.getenv('TUSHARE_API_KEY') is not None: token = os.getenv('TUSHARE_API_KEY')
         if token is not None and (self.__class__.token is None or self.__class__.token != token):
             self.__class__.token = token
-            self.__class__.pro = ts.pro_api(token=token)
+            self.__class__.pro = RateLimitProxy(ts.pro_api(token=token), "tushare")  # type: ignore
         assert self.__class__.token is not None, "Tushare API token must be provided either as an argument or through the TUSHARE_API_KEY environment variable"
         assert self.__class__.pro is not None, "Tushare API client initialization failed"
 
@@ -43,9 +64,10 @@ class TushareDataSource(OHLCDataSource):
         key_fields=("symbol",),
         common_fields=("type", "freq"),
         except_fields=(),
-        missing_threshold=0
+        missing_threshold=0,
+        normalizers={"symbol": upper_symbol},
     )
-    def history(self, symbol: str, type: UnderlyingType, start: Union[str, datetime, date, int] = 0, end: Union[str, datetime, date, int] = datetime.now(), freq: DataFrequency = DataFrequency.DAILY) -> pd.DataFrame:
+    def history(self, symbol: str, type: UnderlyingType, start: Union[str, datetime, date, int] = 0, end: Optional[Union[str, datetime, date, int]] = None, freq: DataFrequency = DataFrequency.DAILY) -> pd.DataFrame:
         if type == UnderlyingType.STOCK: return self._format_dataframe(self._history_stock(symbol, start, end, freq))
         elif type == UnderlyingType.INDEX: return self._format_dataframe(self._history_index(symbol, start, end, freq))
         elif type == UnderlyingType.FOREX: return self._format_dataframe(self._history_forex(symbol, start, end, freq))
@@ -53,6 +75,62 @@ class TushareDataSource(OHLCDataSource):
         elif type == UnderlyingType.FUND: return self._format_dataframe(self._history_etf(symbol, start, end, freq))
         else: raise NotImplementedError(f"Data type {type} not supported in Tushare")
 
+    def load_daily_cross_section(
+        self,
+        start: Union[str, datetime, date, int],
+        end: Optional[Union[str, datetime, date, int]] = None,
+        type: UnderlyingType = UnderlyingType.STOCK,
+        symbols: Optional[List[str]] = None
+    ) -> UpsertResult:
+        """
+        按交易日逐日拉取全市场日线（daily / fund_daily 的 trade_date 参数），批量写入 history 的缓存。
+
+        逐个 symbol 调用 history 需要数千次请求，而一个交易日的横截面只需一次请求；
+        每天的数据在一个事务中写入，并把当天出现过的全部 symbol 的区间一起登记为已缓存，之后的 history 调用直接命中缓存。
+
+        参数：
+            start, end: 拉取的日期范围，end 默认为当前时间
+            type: UnderlyingType.STOCK 或 UnderlyingType.FUND
+            symbols: 额外登记区间的 symbol（如停牌的股票），当天没有数据也视为已缓存
+
+        返回值：
+            UpsertResult，所有交易日写入行数的合计
+        """
+        db = self._history_db()
+        assert db is not None, "history 缓存未开启（FINTOOLS_DB 为空），无法批量写入"
+        if type not in self.__class__.cross_section_apis:
+            raise NotImplementedError(f"Cross-sectional daily data not supported for {type} in Tushare")
+        api = getattr(self.__class__.pro, self.__class__.cross_section_apis[type])
+        start_dt = self._parse_datetime(start)
+        end_dt = self._parse_datetime(end)
+        cal = self.__class__.pro.trade_cal(exchange="SSE", start_date=start_dt.strftime("%Y%m%d"), end_date=end_dt.strftime("%Y%m%d"), is_open="1")
+        common_fields = {"type": type, "freq": DataFrequency.DAILY}
+        universe = {upper_symbol(s) for s in symbols or []}
+
+        result = UpsertResult()
+        cursor = start_dt
+        for trade_date in sorted(cal["cal_date"].astype(str)):
+            df = api(trade_date=trade_date)
+            if df.empty:
+                # 当天数据尚未发布，之后的日期也不会有数据
+                logger.info(f"[Tushare]: {trade_date} 的横截面数据为空，停止批量拉取。")
+                break
+            df["trade_date"] = pd.to_datetime(df["trade_date"]).dt.tz_localize("Asia/Shanghai")
+            data = self._format_dataframe(df)
+            data.insert(0, "symbol", data["ts_code"].str.upper())
+            universe.update(data["symbol"])
+            # [cursor, 次日 0 点)：上一个交易日之后的休市日也一并登记
+            day_end = (pd.Timestamp(trade_date).tz_localize("Asia/Shanghai") + pd.Timedelta(days=1)).to_pydatetime()
+            result += db.bulk_insert(data, key_columns=["symbol"], common_fields=common_fields,
+                                     start=cursor, end=day_end, key_fields_list=[{"symbol": s} for s in sorted(universe)])
+            cursor = day_end
+        else:
+            # 范围内的交易日都已拉取：末尾的休市日没有数据，只要已经过去就可以登记
+            if universe and cursor < end_dt <= datetime.now().astimezone():
+                db.bulk_insert(pd.DataFrame(), key_columns=["symbol"], common_fields=common_fields,
+                               start=cursor, end=end_dt, key_fields_list=[{"symbol": s} for s in sorted(universe)])
+        return result
+
     def _history_stock(self, symbol: str, start: Union[str, datetime, date, int], end: Union[str, datetime, date, int], freq: DataFrequency) -> pd.DataFrame:
         ts_freq = self._map_frequency(freq)
         start_date = self._parse_datetime(start).strftime("%Y%m%d")
@@ -64,9 +142,7 @@ class TushareDataSource(OHLCDataSource):
         elif ts_freq == "monthly":
             df = self.__class__.pro.monthly(ts_code=symbol, start_date=start_date, end_date=end_date)
         elif ts_freq in ['1min', '5min', '15min', '30min', '60min']:
-            start_date = self._parse_datetime(start).strftime("%Y-%m-%d %H:%M:%S")
-            end_date = self._parse_datetime(end).strftime("%Y-%m-%d %H:%M:%S")
-            df = self.__class__.pro.stk_mins(ts_code=symbol, freq=self._map_frequency(freq), start_date=start_date, end_date=end_date)
+            return self._history_minutes("stk_mins", symbol, UnderlyingType.STOCK, start, end, freq)
         else:
             raise NotImplementedError(f"Frequency {freq} not supported for stock data in Tushare")
         df['trade_date'] = pd.to_datetime(df['trade_date']).dt.tz_localize('Asia/Shanghai')
@@ -117,10 +193,7 @@ class TushareDataSource(OHLCDataSource):
             df = self.__class__.pro.fut_weekly_monthly(ts_code=symbol, start_date=start_date, end_date=end_date, freq="month")
             return df
         elif ts_freq in ['1min', '5min', '15min', '30min', '60min']:
-            start_date = self._parse_datetime(start).strftime("%Y-%m-%d %H:%M:%S")
-            end_date = self._parse_datetime(end).strftime("%Y-%m-%d %H:%M:%S")
-            df = self.__class__.pro.fut_mins(ts_code=symbol, freq=self._map_frequency(freq), start_date=start_date, end_date=end_date)
-            return df
+            return self._history_minutes("fut_mins", symbol, UnderlyingType.COMMODITY, start, end, freq)
         else:
             raise NotImplementedError(f"Frequency {freq} not supported for commodity data in Tushare")
     
@@ -131,14 +204,81 @@ class TushareDataSource(OHLCDataSource):
         if ts_freq == "daily":
             df = self.__class__.pro.fund_daily(ts_code=symbol, start_date=start_date, end_date=end_date)
         elif ts_freq in ['1min', '5min', '15min', '30min', '60min']:
-            start_date = self._parse_datetime(start).strftime("%Y-%m-%d %H:%M:%S")
-            end_date = self._parse_datetime(end).strftime("%Y-%m-%d %H:%M:%S")
-            df = self.__class__.pro.stk_mins(ts_code=symbol, freq=self._map_frequency(freq), start_date=start_date, end_date=end_date)
+            return self._history_minutes("stk_mins", symbol, UnderlyingType.FUND, start, end, freq)
         else:
             raise NotImplementedError(f"Frequency {freq} not supported for ETF data in Tushare")
         df['trade_date'] = pd.to_datetime(df['trade_date']).dt.tz_localize('Asia/Shanghai')
         return df
 
+    def _history_minutes(self, api_name: str, symbol: str, type: UnderlyingType, start: Union[str, datetime, date, int], end: Union[str, datetime, date, int], freq: DataFrequency) -> pd.DataFrame:
+        """
+        把分钟线的长区间拆成若干窗口并发拉取后拼接，每个窗口的预计行数低于 minute_row_limit。
+
+        history 开启了缓存时，每个窗口完成后立即写入缓存并登记区间，中断后再次调用只会拉取剩下的窗口；
+        此时只返回写入缓存失败的窗口，由缓存层照常写入，已经写入的数据不再重复写一遍。
+        """
+        start_dt, end_dt = self._parse_datetime(start), self._parse_datetime(end)
+        db = self._history_db()
+        common_fields = {"type": type, "freq": freq}
+        # 之前中断的补数已经登记过的窗口不再重复拉取；缓存层只需要本次新拉取的数据
+        missing = getattr(db, "missing", None)
+        ranges = missing({"symbol": symbol}, common_fields, start_dt, end_dt) if missing is not None else [(start_dt, end_dt)]
+        bars_per_day = self.__class__.session_minutes[api_name] * 60 // int(bar_duration(freq).total_seconds()) + 1
+        step = timedelta(days=max(1, int(self.__class__.minute_row_limit * 0.9) // bars_per_day))
+        windows: List[Tuple[datetime, datetime]] = []
+        for ws, we in ranges:
+            while ws < we:
+                windows.append((ws, min(ws + step, we)))
+                ws = windows[-1][1]
+        if not windows:
+            return pd.DataFrame(columns=STANDARD_COLUMN_NAMES)
+
+        frames: Dict[datetime, pd.DataFrame] = {}
+        persisted: List[datetime] = []
+        errors: List[BaseException] = []
+        with ThreadPoolExecutor(max_workers=min(self.__class__.minute_workers, len(windows)), thread_name_prefix="fintools-tushare") as executor:
+            futures = {executor.submit(self._fetch_minute_window, api_name, symbol, freq, ws, we): (ws, we) for ws, we in windows}
+            for future in as_completed(futures):
+                ws, we = futures[future]
+                try:
+                    df = frames[ws] = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if db is None or df.empty:
+                    continue
+                # 与 HistoryDB 补数一致：最后一个窗口只登记到最后一根 bar，之后的数据可能尚未发布
+                covered_end = we if we < end_dt else (df["date"].max() + pd.Timedelta(microseconds=1)).to_pydatetime()
+                try:
+                    db.bulk_insert(df.assign(symbol=symbol), key_columns=["symbol"], common_fields=common_fields,
+                                   start=ws, end=covered_end)
+                except (sqlite3.Error, CacheServerError, OSError) as e:
+                    logger.warning(f"[Tushare]: 写入 {symbol} [{ws} - {we}) 的分钟线缓存失败：{e}")
+                else:
+                    persisted.append(ws)
+        if errors:
+            raise errors[0]
+        parts = [frames[ws] for ws, _ in windows if not frames[ws].empty and ws not in persisted]
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=STANDARD_COLUMN_NAMES)
+
+    def _fetch_minute_window(self, api_name: str, symbol: str, freq: DataFrequency, start: datetime, end: datetime) -> pd.DataFrame:
+        """拉取 [start, end) 的分钟线；返回行数达到 minute_row_limit 时视为被截断，对半拆分后重新拉取。"""
+        tz = ZoneInfo("Asia/Shanghai")
+        df = getattr(self.__class__.pro, api_name)(ts_code=symbol, freq=self._map_frequency(freq),
+                                                   start_date=start.astimezone(tz).strftime("%Y-%m-%d %H:%M:%S"),
+                                                   end_date=end.astimezone(tz).strftime("%Y-%m-%d %H:%M:%S"))
+        if len(df) >= self.__class__.minute_row_limit and end - start > bar_duration(freq):
+            mid = start + (end - start) / 2
+            logger.debug(f"[Tushare]: {api_name} {symbol} [{start} - {end}) 返回 {len(df)} 行，可能被截断，拆分后重新拉取。")
+            return pd.concat([self._fetch_minute_window(api_name, symbol, freq, start, mid),
+                              self._fetch_minute_window(api_name, symbol, freq, mid, end)], ignore_index=True)
+        if df.empty:
+            return pd.DataFrame(columns=STANDARD_COLUMN_NAMES)
+        df = df.rename(columns={"trade_time": "trade_date"})
+        df["trade_date"] = pd.to_datetime(df["trade_date"]).dt.tz_localize(tz)
+        df = self._format_dataframe(df)
+        return df[(df["date"] >= start) & (df["date"] < end)].reset_index(drop=True)
+
     def subscribe(self, symbol: str, interval: str, callback: Callable) -> None:
         # Tushare does not support real-time data subscription
         raise NotImplementedError("Tushare does not support real-time data subscription")
@@ -1,26 +1,31 @@
-from .base import OHLCDataSource, UnderlyingType, DataFrequency
+from .base import OHLCDataSource, UnderlyingType, DataFrequency, STANDARD_COLUMN_NAMES
 from fintools.databases.history_db import history_cache
+from fintools.databases.keys import upper_symbol
+from fintools.databases.cache_server import CacheServerError, RemoteHistoryDB
 import pandas as pd
 import sqlite3
 import os
-from typing import Optional, Callable, Union
+from typing import Optional, Callable, Union, List, Dict, Tuple
 from datetime import datetime, date, timedelta
 
 import yfinance as yf
 
+import logging
+logger = logging.getLogger(__name__)
+
 
 class YahooFinanceDataSource(OHLCDataSource):
 
     name = "yahoo_finance"
 
     freq_map = {
-        DataFrequency.MINUTE1: '1min',
-        DataFrequency.MINUTE2: '2min',
-        DataFrequency.MINUTE5: '5min',
-        DataFrequency.MINUTE15: '15min',
-        DataFrequency.MINUTE30: '30min',
+        DataFrequency.MINUTE1: '1m',
+        DataFrequency.MINUTE2: '2m',
+        DataFrequency.MINUTE5: '5m',
+        DataFrequency.MINUTE15: '15m',
+        DataFrequency.MINUTE30: '30m',
         DataFrequency.MINUTE60: '1h',
-        DataFrequency.MINUTE90: '90min',
+        DataFrequency.MINUTE90: '90m',
         DataFrequency.DAILY: '1d',
         DataFrequency.DAY5: '5d',
         DataFrequency.WEEKLY: '1wk',
@@ -28,28 +33,126 @@ class YahooFinanceDataSource(OHLCDataSource):
         DataFrequency.MONTH3: '3mo'
     }
     column_names = ["Date", "Open", "High", "Low", "Close", "Volume"]
+    # Yahoo 对分钟线的限制：(最早可以取到多久以前的数据, 单次请求的最大跨度)，超出时整个请求被拒绝
+    interval_limits: Dict[str, Tuple[timedelta, timedelta]] = {
+        '1m': (timedelta(days=30), timedelta(days=7)),
+        '2m': (timedelta(days=60), timedelta(days=60)),
+        '5m': (timedelta(days=60), timedelta(days=60)),
+        '15m': (timedelta(days=60), timedelta(days=60)),
+        '30m': (timedelta(days=60), timedelta(days=60)),
+        '90m': (timedelta(days=60), timedelta(days=60)),
+        '1h': (timedelta(days=730), timedelta(days=730)),
+    }
+    # 最早可取时间按请求时刻计算，留出余量避免请求发出时已经越界
+    lookback_margin = timedelta(minutes=10)
 
     @history_cache(
         table_basename=name,
         db_path=os.getenv("FINTOOLS_DB", ""),
         key_fields=("symbol", "freq"),
-        except_fields=("type",)
+        except_fields=("type",),
+        normalizers={"symbol": upper_symbol},
     )
-    def history(self, symbol: str, type: UnderlyingType = UnderlyingType.INDEX, start: Union[str, datetime, date, int] = 0, end: Union[str, datetime, date, int] = datetime.now(), freq: DataFrequency = DataFrequency.DAILY) -> pd.DataFrame:
+    def history(self, symbol: str, type: UnderlyingType = UnderlyingType.INDEX, start: Union[str, datetime, date, int] = 0, end: Optional[Union[str, datetime, date, int]] = None, freq: DataFrequency = DataFrequency.DAILY) -> pd.DataFrame:
         yf_freq = self._map_frequency(freq)
         start_date = self._parse_datetime(start)
         end_date = self._parse_datetime(end)
         # if start_date.time() == datetime.min.time() and end_date.time() == datetime.min.time():
         #     end_date = end_date + self._datetime_shift_base(freq)
+        windows = self._plan_windows([symbol], start_date, end_date, freq)
         ticker = yf.Ticker(symbol)
-        df = ticker.history(start=start_date, end=end_date, interval=yf_freq)
+        frames = []
+        for ws, we in windows:
+            df = ticker.history(start=ws, end=we, interval=yf_freq)
+            if not df.empty:
+                frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=STANDARD_COLUMN_NAMES)
+        df = pd.concat(frames)
+        df = df[~df.index.duplicated(keep="last")]
         df.index.name = "date"
         df = df.reset_index()
         return self._format_dataframe(df)
 
+    def _history_batch(self, symbol: List[str], type: UnderlyingType, start: Union[str, datetime, date, int], end: Union[str, datetime, date, int], freq: Union[DataFrequency, List[DataFrequency]]) -> pd.DataFrame:
+        """
+        用 yf.download 一次下载多个 symbol（内部多线程），按 freq 分组，每组按 interval_limits 拆分窗口。
+        """
+        start_date = self._parse_datetime(start)
+        end_date = self._parse_datetime(end)
+        freqs = list(freq) if isinstance(freq, (list, tuple)) else [freq] * len(symbol)
+        frames = []
+        for f in dict.fromkeys(freqs):
+            tickers = [s for s, g in zip(symbol, freqs) if g == f]
+            parts: Dict[str, List[pd.DataFrame]] = {t: [] for t in tickers}
+            for ws, we in self._plan_windows(tickers, start_date, end_date, f):
+                data = yf.download(tickers, start=ws, end=we, interval=self._map_frequency(f), group_by="ticker",
+                                   actions=True, auto_adjust=True, ignore_tz=False, threads=True, progress=False)
+                if data is None or data.empty:
+                    continue
+                for t in tickers:
+                    if isinstance(data.columns, pd.MultiIndex):
+                        if t not in data.columns.get_level_values(0):
+                            continue
+                        df = data[t]
+                    else:
+                        df = data
+                    parts[t].append(df)
+            for t in tickers:
+                if not parts[t]:
+                    continue
+                df = pd.concat(parts[t])
+                df = df[~df.index.duplicated(keep="last")]
+                df.columns.name = None
+                df.index.name = "date"
+                df = self._format_dataframe(df.reset_index())
+                if df.empty:
+                    continue
+                df.insert(0, "freq", f)
+                df.insert(0, "symbol", t)
+                frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=["symbol", "freq"] + STANDARD_COLUMN_NAMES)
+        return pd.concat(frames, ignore_index=True)
+
+    def _plan_windows(self, symbols: List[str], start: datetime, end: datetime, freq: DataFrequency,
+                      now: Optional[datetime] = None) -> List[Tuple[datetime, datetime]]:
+        """
+        把 [start, end) 拆成 Yahoo 接受的请求窗口。
+
+        早于最早可取时间的部分永远取不到：history 开启了本地缓存时，把这一段登记为这些 symbol 的已缓存区间（没有数据），
+        之后不再回源。
+        """
+        limits = self.__class__.interval_limits.get(self._map_frequency(freq))
+        if limits is None:
+            return [(start, end)] if start < end else []
+        lookback, span = limits
+        now = now if now is not None else datetime.now().astimezone()
+        earliest = now - lookback + self.__class__.lookback_margin
+        if start < earliest:
+            self._mark_unavailable(symbols, freq, start, min(end, earliest))
+            start = earliest
+        windows: List[Tuple[datetime, datetime]] = []
+        while start < end:
+            windows.append((start, min(start + span, end)))
+            start = windows[-1][1]
+        return windows
+
+    def _mark_unavailable(self, symbols: List[str], freq: DataFrequency, start: datetime, end: datetime) -> None:
+        db = self._history_db()
+        # 远程缓存服务会丢弃空的写入，登记只会白白多一次往返；服务端执行 history 时由它自己的 HistoryDB 登记
+        if db is None or isinstance(db, RemoteHistoryDB) or getattr(db, "read_only", False):
+            return
+        logger.debug(f"[YahooFinance]: {symbols} 的 {freq} 数据在 {end} 之前已超出 Yahoo 的可取范围，登记 [{start} - {end}) 为空。")
+        try:
+            db.bulk_insert(pd.DataFrame(), key_columns=["symbol", "freq"], common_fields={}, start=start, end=end,
+                           key_fields_list=[{"symbol": s, "freq": freq} for s in symbols])
+        except (sqlite3.Error, CacheServerError, OSError) as e:
+            logger.warning(f"[YahooFinance]: 登记 {symbols} 不可取区间失败：{e}")
+
 
     def subscribe(self, symbol: str, interval: str, callback: Callable) -> None:
         raise NotImplementedError("Yahoo Finance does not support real-time data subscription")
 
     def unsubscribe(self, symbol: str, interval: str) -> None:
-        raise NotImplementedError("Yahoo Finance does not support real-time data unsubscription")
\ No newline at end of file
+        raise NotImplementedError("Yahoo Finance does not support real-time data unsubscription")
@@ -1,47 +1,12 @@
 from .base import NewsDataSource
-import pkgutil
-import importlib
-import inspect
-from pathlib import Path
-from typing import Type, Dict
+from ..registry import LazyRegistry
 
-import logging
-logger = logging.getLogger(__name__)
-
-DATASOURCES: Dict[str, Type[NewsDataSource]] = {}
-
-def _discover_datasource_classes():
-    """
-    扫描当前包下所有 .py 模块，找到所有继承 NewsDataSource 的子类，
-    填充到 DATASOURCES 里。
-    """
-    package_name = __name__
-    package_path = Path(__file__).parent
-
-    for module_info in pkgutil.iter_modules([str(package_path)]):
-        mod_name = module_info.name
-
-        if mod_name in ("base", "__init__") or mod_name.startswith("_"):
-            continue
-
-        full_name = f"{package_name}.{mod_name}"
-        module = importlib.import_module(full_name)
-
-        for attr_name, obj in inspect.getmembers(module, inspect.isclass):
-            if issubclass(obj, NewsDataSource) and obj is not NewsDataSource:
-                key = getattr(obj, "name", obj.__name__)
-                if key == "base":
-                    logger.warning(f"NewsDataSource subclass in {full_name} has reserved name 'base'.")
-                    logger.warning("Please rename it to avoid conflicts.")
-                    logger.warning("Skipping registration of this class.")
-                    continue
-                if key in DATASOURCES:
-                    raise ValueError(f"Duplicate NewsDataSource name detected: {key} in {obj.__name__} and {DATASOURCES[key].__name__}")
-                DATASOURCES[key] = obj
-
-_discover_datasource_classes()
+# 内置数据源清单，见 fin_history；第三方数据源通过 entry_points 分组 "fintools.fin_news" 注册
+DATASOURCES: LazyRegistry[NewsDataSource] = LazyRegistry(__name__, NewsDataSource, {
+    "eastmoney": ".eastmoney:EastMoneyNewsDataSource",
+}, entry_point_group="fintools.fin_news")
 
 __all__ = [
     "NewsDataSource",
     "DATASOURCES",
-]
\ No newline at end of file
+]
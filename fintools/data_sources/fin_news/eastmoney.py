@@ -1,4 +1,5 @@
 from datetime import date, datetime, timedelta
+from typing import Optional
 from lxml import etree
 import pandas as pd
 import requests
@@ -10,6 +11,8 @@ from .base import NewsDataSource, SortingMethod
 
 from fintools.databases.history_db import history_cache
 from fintools.databases.common_db import common_cache
+from fintools.databases.keys import strip_symbol
+from fintools.databases.rate_limit import acquire
 
 class EastMoneyNewsDataSource(NewsDataSource):
     """
@@ -54,13 +57,14 @@ class EastMoneyNewsDataSource(NewsDataSource):
         db_path=os.getenv("FINTOOLS_DB", ""),
         key_fields=("symbol", ),
         common_fields=(),
-        except_fields=()
+        except_fields=(),
+        normalizers={"symbol": strip_symbol},
     )
     def list_news(
         self,
         symbol: str,
         start: str | datetime | date | int = 0,
-        end: str | datetime | date | int = datetime.now()
+        end: Optional[str | datetime | date | int] = None
     ) -> pd.DataFrame:
         params = self.COMMON_PARAMS.copy()
         params["param"]["keyword"] = symbol
@@ -77,6 +81,7 @@ class EastMoneyNewsDataSource(NewsDataSource):
                 "param": json.dumps(params["param"], separators=(',', ':')),
                 "_": params["_"]
             }
+            acquire("eastmoney", "list_news")
             res = requests.get(
                 url = self.BASE_URL,
                 params = get_params,
@@ -110,6 +115,7 @@ class EastMoneyNewsDataSource(NewsDataSource):
         except_fields=()
     )
     def news_details(self, code: str) -> str:
+        acquire("eastmoney", "news_details")
         res = requests.get(
             url=f"https://finance.eastmoney.com/a/{code}.html",
             headers=self.COMMON_HEADERS
@@ -1,4 +1,4 @@
-from pyparsing import ABC, abstractmethod
+from abc import ABC, abstractmethod
 from datetime import datetime, date, timedelta
 import pandas as pd
 from typing import Optional, Union, Annotated
@@ -21,7 +21,7 @@ class ReportDataSource(DataSource, ABC):
         self,
         symbol: str,
         start: Union[str, datetime, date, int] = 0,
-        end: Union[str, datetime, date, int] = datetime.now()
+        end: Optional[Union[str, datetime, date, int]] = None
     ) -> pd.DataFrame:
         """Fetch a list of reports for a given symbol within a specified date range.
         Args:
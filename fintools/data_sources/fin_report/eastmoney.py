@@ -1,4 +1,5 @@
 from datetime import date, datetime, timedelta
+from typing import Optional
 from lxml import etree
 import pandas as pd
 import requests
@@ -10,6 +11,8 @@ from .base import ReportDataSource, SortingMethod
 
 from fintools.databases.history_db import history_cache
 from fintools.databases.common_db import common_cache
+from fintools.databases.keys import strip_symbol
+from fintools.databases.rate_limit import acquire
 
 class EastMoneyReportDataSource(ReportDataSource):
     """
@@ -49,13 +52,14 @@ class EastMoneyReportDataSource(ReportDataSource):
         db_path=os.getenv("FINTOOLS_DB", ""),
         key_fields=("symbol", ),
         common_fields=(),
-        except_fields=()
+        except_fields=(),
+        normalizers={"symbol": strip_symbol},
     )
     def list_reports(
         self,
         symbol: str,
         start: str | datetime | date | int = 0,
-        end: str | datetime | date | int = datetime.now()
+        end: Optional[str | datetime | date | int] = None
     ) -> pd.DataFrame:
         params = self.COMMON_PARAMS.copy()
         params["param"]["keyword"] = symbol
@@ -72,6 +76,7 @@ class EastMoneyReportDataSource(ReportDataSource):
                 "param": json.dumps(params["param"], separators=(',', ':')),
                 "_": params["_"]
             }
+            acquire("eastmoney", "list_reports")
             res = requests.get(
                 url = self.BASE_URL,
                 params = get_params,
@@ -104,6 +109,7 @@ class EastMoneyReportDataSource(ReportDataSource):
         except_fields=()
     )
     def report_details(self, code: str) -> str:
+        acquire("eastmoney", "report_details")
         res = requests.get(
             url=f"https://data.eastmoney.com/report/zw_stock.jshtml?infocode={code}",
             headers=self.COMMON_HEADERS
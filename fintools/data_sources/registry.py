@@ -0,0 +1,100 @@
+"""
+数据源的惰性注册表。
+
+各类数据源包（fin_history / fin_news / fin_report）在 __init__ 中以静态清单 `名字 -> "模块:类名"` 声明内置数据源，
+第三方包可以通过 entry_points 追加。模块只在第一次 `DATASOURCES[name]` 时导入，
+导入包本身不会加载 yfinance、tushare、efinance、Playwright 等 SDK。
+"""
+import importlib
+import threading
+from importlib.metadata import entry_points
+from typing import Dict, Generic, Iterator, List, Optional, Type, TypeVar, Union
+from collections.abc import Mapping
+
+import logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class LazyRegistry(Mapping, Generic[T]):
+    """
+    只读映射 `名字 -> 数据源类`，键的集合和顺序来自清单，值在首次访问时才导入。
+
+    `name in DATASOURCES`、`DATASOURCES.keys()` 不会导入任何模块；`values()` / `items()` 会导入全部数据源。
+    """
+    def __init__(self, package: str, base: Type[T], manifest: Dict[str, str], entry_point_group: Optional[str] = None):
+        """
+        参数：
+            package: 清单中以 "." 开头的相对模块名相对于哪个包解析，一般传 __name__
+            base: 数据源基类，导入后检查类型
+            manifest: 内置数据源清单，值为 "模块:类名"（如 ".tushare:TushareDataSource"）；名字须与类的 name 属性一致
+            entry_point_group: 第三方数据源的 entry_points 分组，值的格式同上（模块名须为绝对路径）
+        """
+        self.package = package
+        self.base = base
+        self.entry_point_group = entry_point_group
+        self._targets: Dict[str, Union[str, Type[T]]] = dict(manifest)
+        self._classes: Dict[str, Type[T]] = {}
+        self._entry_points_loaded = entry_point_group is None
+        self._lock = threading.Lock()
+
+    def _all_targets(self) -> Dict[str, Union[str, Type[T]]]:
+        if not self._entry_points_loaded:
+            with self._lock:
+                if not self._entry_points_loaded:
+                    # 只读取元数据，不导入 entry point 指向的模块
+                    for ep in entry_points(group=self.entry_point_group):
+                        if ep.name in self._targets:
+                            raise ValueError(f"Duplicate data source name detected: {ep.name} ({ep.value})")
+                        self._targets[ep.name] = ep.value
+                    self._entry_points_loaded = True
+        return self._targets
+
+    def register(self, name: str, target: Union[str, Type[T]]) -> None:
+        """运行时注册数据源，target 为 "模块:类名" 或类本身。"""
+        if name == "base":
+            raise ValueError("Data source name 'base' is reserved.")
+        if name in self._all_targets():
+            raise ValueError(f"Duplicate data source name detected: {name}")
+        self._targets[name] = target
+
+    def _load(self, name: str, target: Union[str, Type[T]]) -> Type[T]:
+        if isinstance(target, str):
+            module_name, _, attr = target.partition(":")
+            module = importlib.import_module(module_name, self.package if module_name.startswith(".") else None)
+            cls = getattr(module, attr)
+        else:
+            cls = target
+        if not (isinstance(cls, type) and issubclass(cls, self.base)):
+            raise TypeError(f"{target} is not a subclass of {self.base.__name__}")
+        if getattr(cls, "name", None) != name:
+            raise ValueError(f"Data source registered as {name!r} but {cls.__name__}.name is {getattr(cls, 'name', None)!r}")
+        return cls
+
+    def __getitem__(self, name: str) -> Type[T]:
+        cls = self._classes.get(name)
+        if cls is None:
+            target = self._all_targets()[name]
+            cls = self._classes[name] = self._load(name, target)
+            logger.debug(f"Loaded data source {name}: {cls.__module__}.{cls.__qualname__}")
+        return cls
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._all_targets()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._all_targets()))
+
+    def __len__(self) -> int:
+        return len(self._all_targets())
+
+    def loaded(self) -> List[str]:
+        """已经导入的数据源名字。"""
+        return list(self._classes)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.package}, {list(self)}, loaded={self.loaded()})"
+
+
+__all__ = ["LazyRegistry"]
@@ -1,6 +1,6 @@
-from .base import BaseDB, Fields
+from .base import BaseDB, Fields, UpsertResult, CacheMissError
 from typing import Dict
 
 DB_CONNECTIONS: Dict[str, BaseDB] = {} 
 
-__all__ = ["BaseDB", "Fields", "DB_CONNECTIONS"]
+__all__ = ["BaseDB", "Fields", "UpsertResult", "CacheMissError", "DB_CONNECTIONS"]
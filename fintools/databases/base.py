@@ -1,25 +1,61 @@
+import os
 import sqlite3
 from hashlib import sha1
 from contextlib import contextmanager
+from dataclasses import dataclass
 from typing import Dict, Optional, Any, List
 from datetime import datetime, date, timedelta
-from pyparsing import ABC, abstractmethod
+from abc import ABC, abstractmethod
 
 from contextvars import ContextVar
 
 from .utils import _python_value_to_sqlite_value
+from fintools.utils.metrics import DB_READ_SECONDS
 
 
 Fields = Dict[str, int | str | datetime | float | bool]
 
+# 只读模式下的连接参数：mmap 大小（字节）、页缓存大小（KiB）、是否以 immutable 方式打开
+READONLY_MMAP_SIZE = int(os.getenv("FINTOOLS_DB_MMAP_SIZE", str(1 << 30)))
+READONLY_CACHE_KB = int(os.getenv("FINTOOLS_DB_CACHE_KB", str(256 * 1024)))
+READONLY_IMMUTABLE = os.getenv("FINTOOLS_DB_IMMUTABLE", "0") == "1"
+
+
+class CacheMissError(LookupError):
+    """只读模式下请求的区间尚未缓存。"""
+    def __init__(self, table_name: str, key_fields: Fields, missing: List[Any]):
+        self.table_name = table_name
+        self.key_fields = key_fields
+        self.missing = missing
+        super().__init__(f"表 {table_name} 中 {key_fields} 缺少 {len(missing)} 个区间：{missing}")
+
+
+@dataclass(frozen=True)
+class UpsertResult:
+    """一次写入中新增、实际修改、以及内容未变化的行数。"""
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+    def __add__(self, other: "UpsertResult") -> "UpsertResult":
+        return UpsertResult(self.inserted + other.inserted, self.updated + other.updated, self.unchanged + other.unchanged)
+
+
 class BaseDB(ABC):
 
     table_basename: str
     db_path: str
-    connection: ContextVar[Optional[sqlite3.Connection]] = ContextVar(
-        "connection", default=None
+    # 每个上下文（线程）按数据库路径各持有一个连接，不同文件之间互不干扰
+    connections: ContextVar[Optional[Dict[str, sqlite3.Connection]]] = ContextVar(
+        "connections", default=None
+    )
+    # 每个上下文中各连接当前的事务嵌套层数，见 _tx
+    tx_depths: ContextVar[Optional[Dict[str, int]]] = ContextVar(
+        "tx_depths", default=None
     )
     tables: Dict[str, Any] = {}
+    # 只读模式：以 mode=ro 打开，不建表、不写入
+    read_only: bool = False
 
     def list_all_cached(self, common_fields: Fields = {}) -> List[Any]:
         """
@@ -39,10 +75,11 @@ class BaseDB(ABC):
         primary_keys = self._get_primary_keys(common_fields=common_fields)
 
         cur = self._get_cursor()
-        cur.execute(f"""
-            SELECT {", ".join(primary_keys)} FROM {table_name};
-        """)
-        return cur.fetchall()
+        with DB_READ_SECONDS.time(table=self.table_basename):
+            cur.execute(f"""
+                SELECT {", ".join(primary_keys)} FROM {table_name};
+            """)
+            return cur.fetchall()
     
     def select_by_primary_keys(self, keys: List[Dict[str, Any]], common_fields: Fields = {}) -> List[Any]:
         """
@@ -74,35 +111,70 @@ WITH temp_keys({",".join(primary_keys)}) AS ( VALUES {",".join(all_values)} )
 SELECT * FROM "{table_name}" JOIN temp_keys USING ({",".join(primary_keys)});
         """
         cur = self._get_cursor()
-        cur.execute(sql)
-        return cur.fetchall()
+        with DB_READ_SECONDS.time(table=self.table_basename):
+            cur.execute(sql)
+            return cur.fetchall()
 
     def _connect(self) -> sqlite3.Connection:
-        conn = self.connection.get()
+        conns = self.connections.get()
+        if conns is None:
+            conns = {}
+            self.connections.set(conns)
+        conn = conns.get(self._connection_key())
         if not isinstance(conn, sqlite3.Connection):
-            self.connection.set(
-                sqlite3.connect(
+            if self.read_only:
+                # immutable=1 时 SQLite 不再加锁、不检查文件变化，只适用于刷新任务以整体替换文件方式更新的场景
+                uri = f"file:{self.db_path}?mode=ro" + ("&immutable=1" if READONLY_IMMUTABLE else "")
+                conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+                conn.execute(f"PRAGMA mmap_size={READONLY_MMAP_SIZE};")
+                conn.execute(f"PRAGMA cache_size={-READONLY_CACHE_KB};")
+                conn.execute("PRAGMA query_only=ON;")
+            else:
+                conn = sqlite3.connect(
                     self.db_path,
                     check_same_thread=False,
                 )
-            )
-            conn = self.connection.get()
+                conn.execute("PRAGMA journal_mode=WAL;")
             assert isinstance(conn, sqlite3.Connection), "数据库连接未正确建立。"
-            conn.execute("PRAGMA journal_mode=WAL;")
             conn.row_factory = sqlite3.Row
+            conns[self._connection_key()] = conn
         return conn
 
+    def _connection_key(self) -> str:
+        # 同一文件的只读连接和读写连接分开保存
+        return f"{self.db_path}?mode=ro" if self.read_only else self.db_path
+
     @contextmanager
     def _tx(self):
-        """简单事务封装，保证一组操作要么全成功，要么全失败。"""
+        """
+        简单事务封装，保证一组操作要么全成功，要么全失败。
+
+        同一文件的各个 BaseDB 共用一个连接；在已打开的事务中再次调用时并入外层事务，由最外层提交或回滚。
+        """
+        assert not self.read_only, f"只读模式下不能写入数据库 {self.db_path}"
         conn = self._connect()
+        depths = self.tx_depths.get()
+        if depths is None:
+            depths = {}
+            self.tx_depths.set(depths)
+        key = self._connection_key()
+        if depths.get(key):
+            depths[key] += 1
+            try:
+                yield
+            finally:
+                depths[key] -= 1
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        depths[key] = 1
         try:
-            conn.execute("BEGIN IMMEDIATE")
             yield
             conn.commit()
         except Exception as e:
             conn.rollback()
             raise e
+        finally:
+            depths[key] = 0
 
     def _get_cursor(self):
         conn = self._connect()
@@ -112,16 +184,34 @@ SELECT * FROM "{table_name}" JOIN temp_keys USING ({",".join(primary_keys)});
         self.close()
     
     def close(self):
-        conn = self.connection.get()
+        conns = self.connections.get()
+        conn = conns.pop(self._connection_key(), None) if conns else None
         if conn:
-            conn.commit()
+            if not self.read_only: conn.commit()
             conn.close()
-            self.connection.set(None)
     
     def _get_table_name(self, common_fields: Fields) -> str:
         hashed_name = sha1(("-".join([str(v) for v in common_fields.values()])).encode()).hexdigest()
         return f"{self.table_basename}_{hashed_name}"
     
+    @staticmethod
+    def _upsert_sql(table_name: str, columns: List[str], primary_keys: List[str]) -> str:
+        """
+        生成只在内容变化时才更新的 UPSERT 语句。
+
+        与 INSERT OR REPLACE（删除 + 插入）不同，主键冲突且各列都未变化的行不会被改写，
+        从而避免刷新重叠区间时重写整页、放大 WAL。
+        """
+        col_sql = ", ".join([f'"{c}"' for c in columns])
+        placeholders = ", ".join(["?"] * len(columns))
+        pk_sql = ", ".join([f'"{c}"' for c in primary_keys])
+        others = [c for c in columns if c not in primary_keys]
+        if not others:
+            return f'INSERT INTO "{table_name}" ({col_sql}) VALUES ({placeholders}) ON CONFLICT ({pk_sql}) DO NOTHING;'
+        set_sql = ", ".join([f'"{c}" = excluded."{c}"' for c in others])
+        changed_sql = " OR ".join([f'"{c}" IS NOT excluded."{c}"' for c in others])
+        return f'INSERT INTO "{table_name}" ({col_sql}) VALUES ({placeholders}) ON CONFLICT ({pk_sql}) DO UPDATE SET {set_sql} WHERE {changed_sql};'
+
     def _get_primary_keys(self, common_fields: Fields) -> List[str]:
         table_name = self._get_table_name(common_fields=common_fields)
         cur = self._get_cursor()
@@ -138,4 +228,4 @@ SELECT * FROM "{table_name}" JOIN temp_keys USING ({",".join(primary_keys)});
         raise NotImplementedError
 
 
-__all__ = ["BaseDB", "Fields"]
+__all__ = ["BaseDB", "Fields", "UpsertResult", "CacheMissError"]
@@ -0,0 +1,168 @@
+"""
+分块压缩的时间序列格式。
+
+一个 block 保存一个 key（如 symbol）在一个时间桶（天 / 月）内的所有行：
+    - 时间戳：int64 微秒，差分编码
+    - 价格等浮点列：能无损缩放为整数时，按 10^digits 缩放成 int64 并差分编码，否则保留 float64
+    - 整数列：差分编码
+    - 其他列：JSON
+    - NaN / NULL 用位图单独记录
+整体再用 zlib 压缩，作为一行 BLOB 存入 SQLite。
+"""
+import json
+import zlib
+import struct
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Tuple
+
+
+BLOCK_VERSION = 1
+PRICE_DIGITS = 4
+
+_HEADER = struct.Struct("<I")
+
+
+def bucket_start(ts: np.ndarray, period: str) -> np.ndarray:
+    """把微秒时间戳向下取整到所在时间桶（UTC）的起点。"""
+    if period == "day":
+        day = 86400 * 1000000
+        return ts - np.mod(ts, day)
+    elif period in ("month", "year"):
+        unit = "datetime64[M]" if period == "month" else "datetime64[Y]"
+        return ts.astype("datetime64[us]").astype(unit).astype("datetime64[us]").astype(np.int64)
+    else:
+        raise ValueError(f"不支持的分块周期：{period}")
+
+
+def bucket_end(start: int, period: str) -> int:
+    """时间桶 [start, end) 的结束时间戳。"""
+    if period == "day":
+        return start + 86400 * 1000000
+    elif period == "month":
+        dt = datetime.fromtimestamp(start / 1000000, tz=timezone.utc)
+        nxt = datetime(dt.year + (dt.month == 12), dt.month % 12 + 1, 1, tzinfo=timezone.utc)
+        return int(nxt.timestamp() * 1000000)
+    elif period == "year":
+        dt = datetime.fromtimestamp(start / 1000000, tz=timezone.utc)
+        return int(datetime(dt.year + 1, 1, 1, tzinfo=timezone.utc).timestamp() * 1000000)
+    else:
+        raise ValueError(f"不支持的分块周期：{period}")
+
+
+def _scaled(values: np.ndarray, digits: int) -> np.ndarray | None:
+    scale = 10 ** digits
+    finite = values[np.isfinite(values)]
+    if finite.size and np.abs(finite).max() * scale >= 2 ** 62:
+        return None
+    ints = np.round(np.nan_to_num(values) * scale)
+    if not np.allclose(ints / scale, np.nan_to_num(values), rtol=0, atol=0.5 / scale / 100):
+        return None
+    return ints.astype(np.int64)
+
+
+def _delta(values: np.ndarray) -> np.ndarray:
+    out = np.empty_like(values)
+    if values.size:
+        out[0] = values[0]
+        out[1:] = np.diff(values)
+    return out
+
+
+def encode_block(df: pd.DataFrame, digits: int = PRICE_DIGITS) -> bytes:
+    """
+    编码一个 block。
+
+    df 中的值必须已经是 SQLite 形式（见 _pandas_value_to_sqlite_value），且包含 int64 的 date 列。
+    """
+    df = df.sort_values("date")
+    columns: List[Dict[str, Any]] = []
+    buffers: List[bytes] = []
+    for col in df.columns:
+        series = df[col]
+        spec: Dict[str, Any] = {"name": col}
+        mask = series.isna().to_numpy()
+        if mask.any():
+            spec["mask"] = len(buffers)
+            buffers.append(np.packbits(mask).tobytes())
+        if pd.api.types.is_bool_dtype(series.dtype) or pd.api.types.is_integer_dtype(series.dtype):
+            values = series.fillna(0).to_numpy(dtype=np.int64)
+            spec["enc"] = "int"
+            data = _delta(values).tobytes()
+        elif pd.api.types.is_float_dtype(series.dtype):
+            values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+            ints = _scaled(values, digits)
+            if ints is not None:
+                spec["enc"] = "scaled"
+                spec["digits"] = digits
+                data = _delta(ints).tobytes()
+            else:
+                spec["enc"] = "float"
+                data = values.tobytes()
+        else:
+            spec["enc"] = "json"
+            data = json.dumps([None if m else v for v, m in zip(series.astype(object).tolist(), mask)]).encode()
+        spec["data"] = len(buffers)
+        buffers.append(data)
+        columns.append(spec)
+    header = json.dumps({"v": BLOCK_VERSION, "n": len(df), "columns": columns, "sizes": [len(b) for b in buffers]}).encode()
+    return zlib.compress(_HEADER.pack(len(header)) + header + b"".join(buffers))
+
+
+def decode_block(payload: bytes) -> Tuple[int, Dict[str, np.ndarray]]:
+    """解码一个 block，返回 (行数, 列名 -> NumPy 数组)。"""
+    raw = zlib.decompress(payload)
+    (hlen,) = _HEADER.unpack_from(raw, 0)
+    header = json.loads(raw[_HEADER.size:_HEADER.size + hlen])
+    assert header["v"] == BLOCK_VERSION, f"不支持的 block 版本：{header['v']}"
+    n = header["n"]
+    offsets = np.cumsum([_HEADER.size + hlen] + header["sizes"])
+    bufs = [raw[offsets[i]:offsets[i + 1]] for i in range(len(header["sizes"]))]
+    out: Dict[str, np.ndarray] = {}
+    for spec in header["columns"]:
+        data = bufs[spec["data"]]
+        mask = np.unpackbits(np.frombuffer(bufs[spec["mask"]], dtype=np.uint8), count=n).astype(bool) if "mask" in spec else None
+        if spec["enc"] == "int":
+            values: np.ndarray = np.cumsum(np.frombuffer(data, dtype=np.int64))
+            if mask is not None:
+                values = values.astype(np.float64)
+                values[mask] = np.nan
+        elif spec["enc"] == "scaled":
+            values = np.cumsum(np.frombuffer(data, dtype=np.int64)) / (10 ** spec["digits"])
+            if mask is not None:
+                values[mask] = np.nan
+        elif spec["enc"] == "float":
+            values = np.frombuffer(data, dtype=np.float64).copy()
+        else:
+            values = np.array(json.loads(data), dtype=object)
+        out[spec["name"]] = values
+    return n, out
+
+
+def decode_blocks(payloads: List[bytes], keys: List[Dict[str, Any]] | None = None) -> pd.DataFrame:
+    """
+    批量解码多个 block，按列拼接后一次性构建 DataFrame。
+
+    keys 为每个 block 对应的 key 列取值，会被展开成与行数相同的列。
+    """
+    if not payloads:
+        return pd.DataFrame([])
+    decoded = [decode_block(p) for p in payloads]
+    names: List[str] = []
+    for _, cols in decoded:
+        for name in cols:
+            if name not in names: names.append(name)
+    data: Dict[str, Any] = {}
+    if keys:
+        for k in keys[0]:
+            data[k] = np.repeat(np.array([kv[k] for kv in keys], dtype=object), [n for n, _ in decoded])
+    for name in names:
+        parts = []
+        for n, cols in decoded:
+            parts.append(cols[name] if name in cols else np.full(n, np.nan))
+        data[name] = np.concatenate(parts)
+    return pd.DataFrame(data)
+
+
+__all__ = ["encode_block", "decode_block", "decode_blocks", "bucket_start", "bucket_end", "PRICE_DIGITS"]
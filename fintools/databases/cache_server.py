@@ -0,0 +1,580 @@
+"""
+本机缓存服务：同一台机器上的多个进程（MCP 服务、回测 worker 等）共用一个缓存库。
+
+由服务进程统一读写 SQLite、统一下载缺失数据，客户端进程不再各自持有写锁，也不会重复下载同一段数据。
+
+- 传输：标准库 http.server，监听 TCP（http://host:port）或 Unix socket（unix:///path/to.sock），不依赖任何外部服务
+- 接口：POST /v1/get 批量读取，缺失的区间由服务端调用被缓存的函数下载；POST /v1/put 批量写入客户端自行下载的数据；
+  GET /health、GET /metrics
+- 载荷：请求和响应都是若干帧 `[类型 1 字节][长度 8 字节][内容]`；双方都安装了 pyarrow 时 DataFrame 使用 Arrow IPC 流，
+  否则退回 changelog 的 JSON 编码
+- 合并：正在执行的相同请求只执行一次，其余请求等待同一个结果；同一个 key 的不同区间请求串行执行，
+  后到的请求直接复用先到请求补好的数据
+
+客户端：设置 FINTOOLS_CACHE_URL 后，history_cache / common_cache 注册 RemoteHistoryDB / RemoteCommonDB，
+调用时把参数发给服务端；服务不可用时退回直接调用原函数（本次结果不缓存）。
+
+    python -m fintools.databases.cache_server --db history.db --listen unix:///tmp/fintools-cache.sock
+"""
+import io
+import os
+import json
+import socket
+import struct
+import argparse
+import threading
+import importlib
+import http.client
+from datetime import datetime
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import urlsplit
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from .base import Fields, UpsertResult
+from .keys import normalize_arguments
+from .changelog import encode_data, decode_data
+from .refresh_queue import dumps_arguments, loads_arguments, resolve_registry_key
+from fintools.utils.metrics import REGISTRY, CACHE_SERVER_REQUESTS
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+FRAMES = "application/x-fintools-frames"
+DEFAULT_URL = "http://127.0.0.1:8765"
+
+# 帧类型：J 请求头 / 元数据（JSON），A Arrow IPC 流，D changelog 的 JSON 编码，E 服务端异常
+Frame = Tuple[bytes, bytes]
+_FRAME = struct.Struct(">cQ")
+
+
+class CacheServerError(RuntimeError):
+    """服务端执行请求时抛出的异常，或服务端返回了非 200 的响应。"""
+
+
+def _import_pyarrow() -> Any:
+    try:
+        return importlib.import_module("pyarrow")
+    except ImportError:
+        return None
+
+pa = _import_pyarrow()
+
+
+def pack_frames(frames: Iterable[Frame]) -> bytes:
+    buf = io.BytesIO()
+    for kind, body in frames:
+        buf.write(_FRAME.pack(kind, len(body)))
+        buf.write(body)
+    return buf.getvalue()
+
+
+def unpack_frames(data: bytes) -> List[Frame]:
+    frames: List[Frame] = []
+    pos = 0
+    while pos < len(data):
+        kind, n = _FRAME.unpack_from(data, pos)
+        pos += _FRAME.size
+        frames.append((kind, data[pos:pos + n]))
+        pos += n
+    return frames
+
+
+def encode_payload(data: Any, arrow: bool) -> Frame:
+    """DataFrame 在 arrow=True 且安装了 pyarrow 时编码为 Arrow IPC 流，其余情况用 changelog 的 JSON 编码。"""
+    if arrow and pa is not None and isinstance(data, pd.DataFrame):
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return b"A", sink.getvalue().to_pybytes()
+    return b"D", encode_data(data).encode("utf-8")
+
+
+def decode_payload(frame: Frame) -> Any:
+    kind, body = frame
+    if kind == b"A":
+        assert pa is not None, "收到 Arrow 编码的数据，但没有安装 pyarrow"
+        return pa.ipc.open_stream(body).read_pandas()
+    if kind == b"D":
+        return decode_data(body.decode("utf-8"))
+    if kind == b"J":
+        return json.loads(body)
+    if kind == b"E":
+        err = json.loads(body)
+        raise CacheServerError(f"{err['type']}: {err['message']}")
+    raise ValueError(f"未知的帧类型：{kind!r}")
+
+
+def _json_frame(obj: Any) -> Frame:
+    return b"J", json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def _error_frame(e: BaseException) -> Frame:
+    return b"E", json.dumps({"type": type(e).__name__, "message": str(e)}, ensure_ascii=False).encode("utf-8")
+
+
+def _parse_url(url: str) -> Tuple[str, Any]:
+    """返回 ("unix", socket 路径) 或 ("tcp", (host, port))。"""
+    parts = urlsplit(url if "://" in url else "http://" + url)
+    if parts.scheme == "unix":
+        return "unix", parts.netloc + parts.path
+    assert parts.scheme == "http", f"不支持的缓存服务地址：{url}"
+    return "tcp", (parts.hostname or "127.0.0.1", parts.port if parts.port is not None else 80)
+
+
+# ----------------------------------------------------------------------------------------------------
+# 服务端
+# ----------------------------------------------------------------------------------------------------
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive，客户端每个线程复用一个连接
+    server: Any
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server.cache._lock:
+            self.server.cache._connections.add(self.request)
+
+    def finish(self) -> None:
+        with self.server.cache._lock:
+            self.server.cache._connections.discard(self.request)
+        super().finish()
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._reply(200, "application/json", json.dumps({"ok": True, "arrow": pa is not None}).encode("utf-8"))
+        elif self.path == "/metrics":
+            self._reply(200, "text/plain; version=0.0.4", REGISTRY.to_prometheus().encode("utf-8"))
+        else:
+            self._reply(404, "text/plain", b"not found")
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        arrow = ARROW_STREAM in self.headers.get("Accept", "")
+        cache: CacheServer = self.server.cache
+        try:
+            frames = unpack_frames(body)
+            header = decode_payload(frames[0])
+            if self.path == "/v1/get":
+                out = cache.handle_get(header, arrow)
+            elif self.path == "/v1/put":
+                out = cache.handle_put(header, frames[1:])
+            else:
+                self._reply(404, "text/plain", b"not found")
+                return
+        except Exception as e:
+            logger.exception(f"[CacheServer]: 处理 {self.path} 失败")
+            out = [_error_frame(e)]
+        self._reply(200, FRAMES, pack_frames(out))
+
+    def _reply(self, status: int, content_type: str, payload: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        if pa is not None:
+            self.send_header("Accept", ARROW_STREAM)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Unix socket 下没有客户端地址，不使用默认的 address_string
+        logger.debug("[CacheServer]: " + format % args)
+
+
+class _UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+class CacheServer:
+    """
+    把本进程中的 history_cache / common_cache 缓存（DB_CONNECTIONS）通过 HTTP 提供给其他进程。
+
+    请求中的 registry_key 即 DB_CONNECTIONS 的注册名（"模块名:qualname"），服务端用 resolve 解析回被缓存的函数并调用，
+    因此补数用的是服务进程自己的数据源配置（API key 等）。
+    """
+    def __init__(self, listen: str = DEFAULT_URL, max_workers: int = int(os.getenv("FINTOOLS_CACHE_WORKERS", "8")),
+                 resolve: Callable[[str], Callable[..., Any]] = resolve_registry_key):
+        """
+        参数：
+            listen: 监听地址，http://host:port（port 为 0 时自动分配）或 unix:///path/to.sock
+            max_workers: 批量请求中各条请求并发执行的线程数
+            resolve: 把 registry_key 解析为被缓存函数的方法，默认按模块名和 qualname 导入
+        """
+        self.resolve = resolve
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fintools-cache-server")
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple[str, str, str], Future] = {}
+        # 每个 key 的锁及持有 / 等待它的请求数，计数归零时删除，避免长期运行时无限增长
+        self._key_locks: Dict[Tuple[str, str, str], Tuple[threading.Lock, int]] = {}
+        self._connections: Set[socket.socket] = set()
+        self._thread: Optional[threading.Thread] = None
+
+        kind, address = _parse_url(listen)
+        if kind == "unix":
+            if os.path.exists(address):
+                os.unlink(address)  # 上次异常退出留下的 socket 文件
+            self._httpd: Any = _UnixHTTPServer(address, _Handler)
+            self.url = f"unix://{address}"
+        else:
+            self._httpd = ThreadingHTTPServer(address, _Handler)
+            self.url = f"http://{address[0]}:{self._httpd.server_address[1]}"
+        self._httpd.cache = self
+        self._socket_path = address if kind == "unix" else None
+
+    # -------------------------------- 读取 --------------------------------
+
+    def get(self, registry_key: str, method: str, arguments: str) -> Any:
+        """
+        执行一条读取请求，arguments 为 dumps_arguments 编码后的调用参数。
+
+        与正在执行的请求完全相同时直接等待其结果；否则先取得该 key（去掉 start / end 后的参数）的锁再执行。
+        """
+        inflight_key = (registry_key, method, arguments)
+        with self._lock:
+            future = self._inflight.get(inflight_key)
+            owner = future is None
+            if owner:
+                future = self._inflight[inflight_key] = Future()
+        if not owner:
+            CACHE_SERVER_REQUESTS.inc(endpoint="get", result="coalesced")
+            return future.result()
+
+        try:
+            with self._key_lock(registry_key, method, arguments):
+                future.set_result(self._call(registry_key, method, loads_arguments(arguments)))
+            CACHE_SERVER_REQUESTS.inc(endpoint="get", result="executed")
+        except BaseException as e:
+            future.set_exception(e)
+            CACHE_SERVER_REQUESTS.inc(endpoint="get", result="error")
+        finally:
+            with self._lock:
+                del self._inflight[inflight_key]
+        return future.result()
+
+    @contextmanager
+    def _key_lock(self, registry_key: str, method: str, arguments: str) -> Iterator[None]:
+        rest = {k: v for k, v in json.loads(arguments).items() if k not in ("start", "end")}
+        key = (registry_key, method, json.dumps(rest, sort_keys=True))
+        with self._lock:
+            lock, count = self._key_locks.get(key, (threading.Lock(), 0))
+            self._key_locks[key] = (lock, count + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, count = self._key_locks[key]
+                if count == 1:
+                    del self._key_locks[key]
+                else:
+                    self._key_locks[key] = (lock, count - 1)
+
+    def _call(self, registry_key: str, method: str, arguments: Dict[str, Any]) -> Any:
+        fn = self.resolve(registry_key)
+        if method == "call":
+            return fn(**arguments)
+        assert method == "many", f"不支持的读取方式：{method}"
+        many = getattr(fn, "many")
+        # 绑定方法上取到的 many 是未绑定的函数，需要显式传入实例
+        return many(fn.__self__, **arguments) if hasattr(fn, "__self__") else many(**arguments)
+
+    def handle_get(self, header: Dict[str, Any], arrow: bool) -> List[Frame]:
+        requests = header["requests"]
+
+        def run(request: Dict[str, Any]) -> Frame:
+            try:
+                return encode_payload(self.get(request["registry_key"], request["method"], request["arguments"]), arrow)
+            except Exception as e:
+                logger.exception(f"[CacheServer]: 执行 {request['registry_key']} 失败")
+                return _error_frame(e)
+
+        if len(requests) == 1:
+            return [run(requests[0])]
+        return list(self._executor.map(run, requests))
+
+    # -------------------------------- 写入 --------------------------------
+
+    def put(self, registry_key: str, key_fields: Fields, common_fields: Fields,
+            start: datetime, end: datetime, data: pd.DataFrame) -> int:
+        """把客户端下载好的 [start, end) 数据写入服务端缓存并记为已缓存区间，返回写入的行数。"""
+        from . import DB_CONNECTIONS
+        from .history_db import HistoryDB
+        from .sharded_db import ShardedHistoryDB
+        fn = self.resolve(registry_key)  # 同时确保模块已导入、缓存已注册
+        db: Any = DB_CONNECTIONS[f"{fn.__module__}:{fn.__qualname__}"]
+        if isinstance(db, ShardedHistoryDB):
+            db = db.shard_for(key_fields)
+        if not isinstance(db, HistoryDB):
+            raise TypeError(f"{registry_key} 不是 history_cache 缓存，不支持 put")
+        key_fields = normalize_arguments(dict(key_fields), db.normalizers)
+        common_fields = normalize_arguments(dict(common_fields), db.normalizers)
+        # 与本地补数一致：空数据不记为已缓存，下次仍会重新请求
+        if not data.empty:
+            db._store_download(data, key_fields, common_fields, start, end)
+        CACHE_SERVER_REQUESTS.inc(endpoint="put", result="executed")
+        return len(data)
+
+    def handle_put(self, header: Dict[str, Any], frames: List[Frame]) -> List[Frame]:
+        items = header["items"]
+        assert len(items) == len(frames), "put 请求的数据帧数量与条目数量不一致"
+        out: List[Frame] = []
+        for item, frame in zip(items, frames):
+            try:
+                rows = self.put(item["registry_key"], loads_arguments(item["key_fields"]), loads_arguments(item["common_fields"]),
+                                datetime.fromisoformat(item["start"]), datetime.fromisoformat(item["end"]), decode_payload(frame))
+                out.append(_json_frame({"rows": rows}))
+            except Exception as e:
+                logger.exception(f"[CacheServer]: 写入 {item['registry_key']} 失败")
+                CACHE_SERVER_REQUESTS.inc(endpoint="put", result="error")
+                out.append(_error_frame(e))
+        return out
+
+    # -------------------------------- 生命周期 --------------------------------
+
+    def serve_forever(self) -> None:
+        logger.info(f"[CacheServer]: 监听 {self.url}")
+        self._httpd.serve_forever()
+
+    def start(self) -> "CacheServer":
+        """在后台线程中运行，便于嵌入其他进程或测试。"""
+        self._thread = threading.Thread(target=self.serve_forever, name="fintools-cache-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        # 关闭仍处于 keep-alive 状态的连接，客户端随后重连失败，退回直接调用原函数
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._executor.shutdown(wait=True)
+        if self._socket_path and os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
+
+
+# ----------------------------------------------------------------------------------------------------
+# 客户端
+# ----------------------------------------------------------------------------------------------------
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+class CacheClient:
+    """缓存服务的客户端，每个线程持有一个 keep-alive 连接。"""
+    def __init__(self, url: str = os.getenv("FINTOOLS_CACHE_URL", DEFAULT_URL),
+                 timeout: float = float(os.getenv("FINTOOLS_CACHE_TIMEOUT", "600"))):
+        """
+        参数：
+            url: 服务地址，http://host:port 或 unix:///path/to.sock
+            timeout: 单次请求的超时时间（秒），需要覆盖服务端补数的耗时
+        """
+        self.url = url
+        self.timeout = timeout
+        self._kind, self._address = _parse_url(url)
+        self._local = threading.local()
+        self._server_arrow = False
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self._kind == "unix":
+                conn = _UnixHTTPConnection(self._address, self.timeout)
+            else:
+                conn = http.client.HTTPConnection(*self._address, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _post(self, path: str, frames: List[Frame]) -> List[Frame]:
+        body = pack_frames(frames)
+        headers = {"Content-Type": FRAMES, "Accept": f"{FRAMES}, {ARROW_STREAM}" if pa is not None else FRAMES}
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                break
+            except ConnectionError:
+                # 服务端关闭了空闲的 keep-alive 连接时重连一次
+                conn.close()
+                self._local.conn = None
+                if attempt: raise
+        if resp.status != 200:
+            raise CacheServerError(f"缓存服务 {self.url}{path} 返回 HTTP {resp.status}")
+        self._server_arrow = ARROW_STREAM in (resp.getheader("Accept") or "")
+        return unpack_frames(data)
+
+    def get(self, requests: List[Tuple[str, str, Dict[str, Any]]]) -> List[Any]:
+        """
+        批量读取，requests 为 (registry_key, "call" / "many", 调用参数) 的列表，按顺序返回结果；
+        任意一条在服务端失败时抛出 CacheServerError。
+        """
+        header = {"requests": [{"registry_key": k, "method": m, "arguments": dumps_arguments(a)} for k, m, a in requests]}
+        return [decode_payload(f) for f in self._post("/v1/get", [_json_frame(header)])]
+
+    def put(self, items: List[Tuple[str, Fields, Fields, datetime, datetime, pd.DataFrame]]) -> int:
+        """批量写入 (registry_key, key_fields, common_fields, start, end, data)，返回写入的总行数。"""
+        header = {"items": [{"registry_key": k, "key_fields": dumps_arguments(kf), "common_fields": dumps_arguments(cf),
+                             "start": s.isoformat(), "end": e.isoformat()} for k, kf, cf, s, e, _ in items]}
+        frames = [_json_frame(header)] + [encode_payload(item[-1], self._server_arrow) for item in items]
+        return sum(decode_payload(f)["rows"] for f in self._post("/v1/put", frames))
+
+
+_CLIENTS: Dict[str, CacheClient] = {}
+
+def get_client(url: str) -> CacheClient:
+    if url not in _CLIENTS:
+        _CLIENTS[url] = CacheClient(url)
+    return _CLIENTS[url]
+
+
+class RemoteHistoryDB:
+    """history_cache 的客户端后端，接口与 HistoryDB 相同，读取和补数都交给缓存服务完成。"""
+    def __init__(self, table_basename: str, url: str, registry_key: str):
+        self.table_basename = table_basename
+        self.registry_key = registry_key
+        self.client = get_client(url)
+
+    def history(self, key_fields: Fields = {}, common_fields: Fields = {}, except_fields: Fields = {},
+                start: Optional[datetime] = None,
+                end: Optional[datetime] = None,
+                callback: Optional[Callable[..., pd.DataFrame]] = None,
+                field_map: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+        arguments = {**key_fields, **common_fields, **except_fields, "start": start, "end": end}
+        try:
+            return self.client.get([(self.registry_key, "call", arguments)])[0]
+        except OSError as e:
+            if callback is None: raise
+            logger.warning(f"[RemoteHistoryDB]: 缓存服务 {self.client.url} 不可用（{e}），直接调用原函数，本次结果不缓存。")
+            return callback(**arguments)
+
+    def history_many(self, key_fields_list: List[Fields], common_fields: Fields = {}, except_fields: Fields = {},
+                     start: Optional[datetime] = None,
+                     end: Optional[datetime] = None,
+                     callback: Optional[Callable[..., pd.DataFrame]] = None,
+                     field_map: Optional[Dict[str, str]] = None,
+                     batch_callback: Optional[Callable[..., pd.DataFrame]] = None) -> pd.DataFrame:
+        """缺失数据由服务端补齐（服务端使用自己的下载方式），batch_callback 只在服务不可用时使用。"""
+        if not key_fields_list:
+            return pd.DataFrame([])
+        keys = {k: [kf[k] for kf in key_fields_list] for k in key_fields_list[0]}
+        arguments = {**keys, **common_fields, **except_fields, "start": start, "end": end}
+        try:
+            return self.client.get([(self.registry_key, "many", arguments)])[0]
+        except OSError as e:
+            if callback is None and batch_callback is None: raise
+            logger.warning(f"[RemoteHistoryDB]: 缓存服务 {self.client.url} 不可用（{e}），直接调用原函数，本次结果不缓存。")
+            if batch_callback is not None:
+                return batch_callback(**arguments)
+            assert callback is not None
+            frames = []
+            for kf in key_fields_list:
+                df = callback(**{**kf, **common_fields, **except_fields, "start": start, "end": end})
+                for k in reversed(list(kf.keys())):
+                    df.insert(0, k, kf[k])
+                frames.append(df)
+            return pd.concat(frames, ignore_index=True)
+
+    def iter_history(self, key_fields: Fields = {}, common_fields: Fields = {}, except_fields: Fields = {},
+                     start: Optional[datetime] = None,
+                     end: Optional[datetime] = None,
+                     callback: Optional[Callable[..., pd.DataFrame]] = None,
+                     field_map: Optional[Dict[str, str]] = None,
+                     chunk_rows: int = 100_000) -> Iterator[pd.DataFrame]:
+        """服务端一次返回整段数据，在本地按时间升序切块；分块只控制调用方每次处理的行数。"""
+        assert chunk_rows > 0, "chunk_rows 必须大于 0"
+        df = self.history(key_fields=key_fields, common_fields=common_fields, except_fields=except_fields,
+                          start=start, end=end, callback=callback, field_map=field_map)
+        if df.empty:
+            return
+        df = df.sort_values("date", kind="stable").reset_index(drop=True)
+        for i in range(0, len(df), chunk_rows):
+            yield df.iloc[i:i + chunk_rows].reset_index(drop=True)
+
+    def bulk_insert(self, data: pd.DataFrame, key_columns: List[str], common_fields: Fields,
+                    start: datetime, end: datetime, key_fields_list: Optional[List[Fields]] = None) -> UpsertResult:
+        """
+        拆成每个 key 一条 put 请求、一次发给服务端。
+
+        服务端不登记空数据的区间，因此 key_fields_list 中当天没有数据的 key 不会被记为已缓存；
+        服务端只返回行数，全部计入 inserted。
+        """
+        if data.empty:
+            return UpsertResult()
+        items = []
+        for k, part in data.groupby(key_columns, sort=False):
+            kf = dict(zip(key_columns, k if isinstance(k, tuple) else (k,)))
+            items.append((self.registry_key, kf, common_fields, start, end, part.drop(columns=key_columns).reset_index(drop=True)))
+        return UpsertResult(inserted=self.client.put(items))
+
+
+class RemoteCommonDB:
+    """common_cache 的客户端后端，接口与 CommonDB.fetch 相同。"""
+    def __init__(self, table_basename: str, url: str, registry_key: str):
+        self.table_basename = table_basename
+        self.registry_key = registry_key
+        self.client = get_client(url)
+
+    def fetch(self, key_fields: Fields = {}, common_fields: Fields = {}, except_fields: Fields = {},
+              callback: Optional[Callable[..., Any]] = None) -> Any:
+        arguments = {**key_fields, **common_fields, **except_fields}
+        try:
+            return self.client.get([(self.registry_key, "call", arguments)])[0]
+        except OSError as e:
+            if callback is None: raise
+            logger.warning(f"[RemoteCommonDB]: 缓存服务 {self.client.url} 不可用（{e}），直接调用原函数，本次结果不缓存。")
+            return callback(**arguments)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m fintools.databases.cache_server", description="本机共享缓存服务")
+    parser.add_argument("--db", default=os.getenv("FINTOOLS_DB", "history.db"), help="缓存库路径")
+    parser.add_argument("--listen", default=os.getenv("FINTOOLS_CACHE_URL", DEFAULT_URL),
+                        help="监听地址，http://host:port 或 unix:///path/to.sock，默认与客户端的 FINTOOLS_CACHE_URL 相同")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("FINTOOLS_CACHE_WORKERS", "8")), help="批量请求的并发线程数")
+    args = parser.parse_args(argv)
+
+    # 数据源模块在导入时读取这两个环境变量：服务进程自己直接读写缓存库，而不是再作为客户端连接自己
+    os.environ["FINTOOLS_DB"] = args.db
+    os.environ.pop("FINTOOLS_CACHE_URL", None)
+    server = CacheServer(args.listen, max_workers=args.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+__all__ = [
+    "CacheServer", "CacheClient", "CacheServerError", "RemoteHistoryDB", "RemoteCommonDB",
+    "get_client", "pack_frames", "unpack_frames", "encode_payload", "decode_payload",
+]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
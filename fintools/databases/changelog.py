@@ -0,0 +1,292 @@
+import os
+import json
+import time
+import uuid
+import argparse
+import pandas as pd
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .base import BaseDB, Fields
+from .refresh_queue import dumps_arguments, loads_arguments
+from .utils import _pandas_value_to_sqlite_value, _sqlite_value_to_pandas_value, _python_value_to_sqlite_value, \
+    _sqlite_value_to_python_value, _datetime_to_timestamp, _timestamp_to_datetime
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def encode_data(data: Any) -> str:
+    """把写入缓存的数据编码成 JSON：DataFrame 按入库时的取值（时间为微秒整数）加 dtype 保存，其他值按类型名保存。"""
+    if isinstance(data, pd.DataFrame):
+        dtypes = {col: str(dtype) for col, dtype in data.dtypes.items()}
+        raw = _pandas_value_to_sqlite_value(data.copy())
+        rows = [[None if pd.isna(x) else x for x in row] for row in raw.itertuples(index=False)]
+        return json.dumps({"columns": list(raw.columns), "dtypes": dtypes, "rows": rows}, default=_json_default, ensure_ascii=False)
+    return json.dumps({"type": type(data).__name__, "value": _python_value_to_sqlite_value(data)}, ensure_ascii=False)
+
+
+def decode_data(text: str) -> Any:
+    obj = json.loads(text)
+    if "columns" in obj:
+        df = pd.DataFrame(obj["rows"], columns=obj["columns"])
+        return _sqlite_value_to_pandas_value(df, type_dict=obj["dtypes"])
+    return _sqlite_value_to_python_value(obj["value"], type_s=obj["type"])
+
+
+def _json_default(value: Any) -> Any:
+    # numpy 标量
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"无法序列化：{value!r}")
+
+
+class Changelog(BaseDB):
+    """
+    缓存库的变更日志（CDC）：记录每次下载写入的数据和新增/删除的已缓存区间，按 seq 递增。
+
+    日志与缓存数据存放在同一个 SQLite 文件中，由 HistoryDB / CommonDB 在写入后追加；
+    其他节点用 sync 按 seq 增量拉取并重放，从而不必重新下载。
+    每条日志记录缓存的类型（history / common）、table_basename 和存储选项，重放时据此在目标库上构造对应的缓存对象。
+    """
+    def __init__(self, db_path: str = os.getenv("FINTOOLS_DB", "history.db")):
+        self.db_path = db_path
+        self.table_basename = "cache_changelog"
+        self.tables = {}
+
+    def _init_schema(self) -> None:
+        cur = self._get_cursor()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS cache_changelog(
+            seq            INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind           TEXT NOT NULL,     -- history / common
+            table_basename TEXT NOT NULL,
+            options        TEXT NOT NULL,     -- 构造缓存对象的参数（JSON）
+            op             TEXT NOT NULL,     -- upsert / add_interval / remove_interval
+            key_fields     TEXT NOT NULL,
+            common_fields  TEXT NOT NULL,
+            payload        TEXT,
+            created_at     REAL NOT NULL
+        );
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS cache_node(
+            id   INTEGER PRIMARY KEY CHECK (id = 0),
+            node TEXT NOT NULL
+        );
+        """)
+        cur.execute("INSERT OR IGNORE INTO cache_node(id, node) VALUES (0, ?);", (uuid.uuid4().hex,))
+        self._connect().commit()
+        self.tables[self.table_basename] = True
+
+    @property
+    def node_id(self) -> str:
+        """本库的节点 id，目标库按来源节点分别记录已同步到的 seq。"""
+        if self.table_basename not in self.tables:
+            self._init_schema()
+        cur = self._get_cursor()
+        cur.execute("SELECT node FROM cache_node WHERE id = 0;")
+        return cur.fetchone()["node"]
+
+    def append(self, kind: str, table_basename: str, options: Dict[str, Any], op: str,
+               key_fields: Fields, common_fields: Fields, payload: Optional[str] = None) -> None:
+        """追加一条日志。不开启事务，由调用方放在自己的写入事务中（或紧随其后）。"""
+        if self.table_basename not in self.tables:
+            self._init_schema()
+        self._get_cursor().execute("""
+            INSERT INTO cache_changelog(kind, table_basename, options, op, key_fields, common_fields, payload, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (kind, table_basename, json.dumps(options, sort_keys=True), op,
+              dumps_arguments(key_fields), dumps_arguments(common_fields), payload, time.time()))
+
+    def since(self, seq: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按顺序读出 seq 之后的日志（原始行，参数仍为 JSON 文本）。"""
+        if self.table_basename not in self.tables:
+            self._init_schema()
+        cur = self._get_cursor()
+        cur.execute(f"""
+            SELECT seq, kind, table_basename, options, op, key_fields, common_fields, payload
+            FROM cache_changelog WHERE seq > ? ORDER BY seq {f'LIMIT {int(limit)}' if limit else ''}
+        """, (seq,))
+        return [dict(r) for r in cur.fetchall()]
+
+    def prune(self, upto_seq: int) -> int:
+        """删除 seq 不超过 upto_seq 的日志（所有节点都已同步过的部分），返回删除的条数。"""
+        if self.table_basename not in self.tables:
+            self._init_schema()
+        with self._tx():
+            cur = self._get_cursor()
+            cur.execute("DELETE FROM cache_changelog WHERE seq <= ?;", (upto_seq,))
+            return cur.rowcount
+
+    def _set_table_info(self, data: Any, common_fields: Fields) -> bool:
+        return self._get_table_info(common_fields=common_fields)
+
+    def _get_table_info(self, common_fields: Fields) -> bool:
+        return bool(self.tables.get(self.table_basename))
+
+
+class Replica(BaseDB):
+    """
+    在目标库上重放变更日志，并按来源节点记录已应用到的 seq（cache_sync_state 表）。
+
+    重放时构造的缓存对象不再写日志，因此变更不会在节点之间来回传播；多个节点互相同步时，每个节点分别从其他节点拉取。
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.table_basename = "cache_sync_state"
+        self.tables = {}
+        self._caches: Dict[Tuple[str, str, str], Any] = {}
+
+    def _init_schema(self) -> None:
+        cur = self._get_cursor()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS cache_sync_state(
+            source     TEXT PRIMARY KEY,
+            last_seq   INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        """)
+        self._connect().commit()
+        self.tables[self.table_basename] = True
+
+    def last_seq(self, source: str) -> int:
+        if self.table_basename not in self.tables:
+            self._init_schema()
+        cur = self._get_cursor()
+        cur.execute("SELECT last_seq FROM cache_sync_state WHERE source = ?;", (source,))
+        row = cur.fetchone()
+        return row["last_seq"] if row else 0
+
+    def _cache(self, kind: str, table_basename: str, options: str) -> Any:
+        key = (kind, table_basename, options)
+        if key not in self._caches:
+            if kind == "history":
+                from .history_db import HistoryDB
+                self._caches[key] = HistoryDB(table_basename, db_path=self.db_path, changelog=False, **json.loads(options))
+            else:
+                from .common_db import CommonDB
+                self._caches[key] = CommonDB(table_basename, db_path=self.db_path, changelog=False)
+        return self._caches[key]
+
+    def apply(self, source: str, changes: Iterable[Dict[str, Any]]) -> int:
+        """按顺序重放一批日志，跳过已经应用过的 seq，返回实际应用的条数。"""
+        applied = 0
+        last = self.last_seq(source)
+        for change in changes:
+            if change["seq"] <= last:
+                continue
+            db = self._cache(change["kind"], change["table_basename"], change["options"])
+            key_fields = loads_arguments(change["key_fields"])
+            common_fields = loads_arguments(change["common_fields"])
+            if change["op"] == "upsert":
+                db._insert_data(decode_data(change["payload"]), key_fields=key_fields, common_fields=common_fields)
+            elif change["op"] in ("add_interval", "remove_interval"):
+                start_ts, end_ts = json.loads(change["payload"])
+                start, end = _timestamp_to_datetime(start_ts), _timestamp_to_datetime(end_ts)
+                if change["op"] == "add_interval":
+                    db._interval_db.add_interval(key_fields=key_fields, common_fields=common_fields, start=start, end=end)
+                else:
+                    db._interval_db.remove_interval(common_fields=common_fields, start=start, end=end, key_fields=key_fields or None)
+            else:
+                raise ValueError(f"未知的变更类型：{change['op']}")
+            last = change["seq"]
+            applied += 1
+            with self._tx():
+                self._get_cursor().execute("""
+                    INSERT INTO cache_sync_state(source, last_seq, updated_at) VALUES (?, ?, ?)
+                    ON CONFLICT(source) DO UPDATE SET last_seq = excluded.last_seq, updated_at = excluded.updated_at
+                """, (source, last, time.time()))
+        return applied
+
+    def _set_table_info(self, data: Any, common_fields: Fields) -> bool:
+        return self._get_table_info(common_fields=common_fields)
+
+    def _get_table_info(self, common_fields: Fields) -> bool:
+        return bool(self.tables.get(self.table_basename))
+
+
+def interval_payload(start: Any, end: Any) -> str:
+    return json.dumps([_datetime_to_timestamp(start), _datetime_to_timestamp(end)])
+
+
+def sync(source_path: str, target_path: str, batch: int = 1000) -> int:
+    """把 source 库中 target 尚未应用的日志增量重放到 target 库，返回应用的条数。"""
+    source, replica = Changelog(source_path), Replica(target_path)
+    node = source.node_id
+    total = 0
+    while True:
+        changes = source.since(replica.last_seq(node), limit=batch)
+        if not changes:
+            break
+        total += replica.apply(node, changes)
+    return total
+
+
+def export_changes(source_path: str, since: int = 0) -> Iterator[str]:
+    """把 since 之后的日志导出为 JSON Lines，便于拷贝到无法直接访问源库文件的节点上再 apply。"""
+    source = Changelog(source_path)
+    node = source.node_id
+    while True:
+        changes = source.since(since, limit=1000)
+        if not changes:
+            break
+        for change in changes:
+            yield json.dumps({"source": node, **change}, ensure_ascii=False)
+        since = changes[-1]["seq"]
+
+
+def apply_lines(target_path: str, lines: Iterable[str]) -> int:
+    replica = Replica(target_path)
+    applied = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        change = json.loads(line)
+        applied += replica.apply(change.pop("source"), [change])
+    return applied
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m fintools.databases.changelog", description="缓存库变更日志的同步工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("sync", help="把源库的增量变更重放到一个或多个目标库")
+    p.add_argument("--source", default=os.getenv("FINTOOLS_DB", "history.db"), help="源缓存库路径")
+    p.add_argument("--target", action="append", required=True, help="目标缓存库路径，可重复")
+
+    p = sub.add_parser("export", help="把变更日志导出为 JSON Lines（输出到标准输出）")
+    p.add_argument("--source", default=os.getenv("FINTOOLS_DB", "history.db"), help="源缓存库路径")
+    p.add_argument("--since", type=int, default=0, help="只导出该 seq 之后的变更")
+
+    p = sub.add_parser("apply", help="把 export 导出的 JSON Lines 重放到目标库")
+    p.add_argument("file", help="JSON Lines 文件路径，- 表示标准输入")
+    p.add_argument("--target", default=os.getenv("FINTOOLS_DB", "history.db"), help="目标缓存库路径")
+
+    p = sub.add_parser("prune", help="删除已同步到所有节点的旧日志")
+    p.add_argument("--source", default=os.getenv("FINTOOLS_DB", "history.db"), help="源缓存库路径")
+    p.add_argument("--upto", type=int, required=True, help="删除 seq 不超过该值的日志")
+
+    args = parser.parse_args(argv)
+    if args.command == "sync":
+        for target in args.target:
+            print(f"{target}: applied {sync(args.source, target)} change(s)")
+    elif args.command == "export":
+        for line in export_changes(args.source, since=args.since):
+            print(line)
+    elif args.command == "apply":
+        import sys
+        f = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+        try:
+            print(f"applied {apply_lines(args.target, f)} change(s)")
+        finally:
+            if f is not sys.stdin: f.close()
+    elif args.command == "prune":
+        print(f"pruned {Changelog(args.source).prune(args.upto)} change(s)")
+
+
+__all__ = ["Changelog", "Replica", "sync", "export_changes", "apply_lines", "encode_data", "decode_data"]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -6,19 +6,31 @@ from typing import Optional, Tuple, List, Callable, Dict, Any, Union
 from dataclasses import dataclass
 import inspect
 
-from pyparsing import wraps
+from functools import wraps
 
 from . import BaseDB, Fields, DB_CONNECTIONS
 from .utils import *
+from .keys import Normalizer, default_normalizers, normalize_arguments
+from fintools.utils.metrics import (
+    CACHE_REQUESTS, CACHE_CALLBACK_SECONDS,
+    DB_READ_SECONDS, DB_WRITE_SECONDS, DB_CONVERT_SECONDS,
+)
 
 import logging
 logger = logging.getLogger(__name__)
 
 
 class CommonDB(BaseDB):
-    def __init__(self, table_basename: str, db_path: str = os.getenv("FINTOOLS_DB", "history.db")):
+    def __init__(self, table_basename: str, db_path: str = os.getenv("FINTOOLS_DB", "history.db"),
+                 changelog: bool = os.getenv("FINTOOLS_CHANGELOG", "0") == "1"):
+        """
+        参数：
+            changelog: 把每次下载写入的数据追加到同一文件的变更日志（见 changelog.py），供其他节点增量同步
+        """
         self.db_path = db_path
         self.table_basename = table_basename
+        self.changelog = changelog
+        self._changelog: Any = None
         self.tables = {}
     
     def fetch(self, key_fields: Fields = {}, common_fields: Fields = {}, except_fields: Fields = {},
@@ -44,19 +56,32 @@ class CommonDB(BaseDB):
         rows = []
         if self.tables.get(table_name):
             cond = f"WHERE {' AND '.join([f'{k} = ?' for k in key_fields.keys()])}" if key_fields else ""
-            cur.execute(f"""
-                SELECT * FROM {table_name}
-                {cond}
-            """, (*[_python_value_to_sqlite_value(v) for v in key_fields.values()], ))
-            rows = cur.fetchall()
+            with DB_READ_SECONDS.time(table=self.table_basename):
+                cur.execute(f"""
+                    SELECT * FROM {table_name}
+                    {cond}
+                """, (*[_python_value_to_sqlite_value(v) for v in key_fields.values()], ))
+                rows = cur.fetchall()
+        CACHE_REQUESTS.inc(table=self.table_basename, result="miss" if len(rows) == 0 else "hit")
         
         if len(rows) == 0:
             assert callback is not None, f"数据库表 {table_name} 不存在，且未提供回调函数以获取数据。"
             # 调用回调函数获取数据
-            data = callback(**key_fields, **common_fields, **except_fields)
+            with CACHE_CALLBACK_SECONDS.time(table=self.table_basename):
+                data = callback(**key_fields, **common_fields, **except_fields)
             if isinstance(data, pd.DataFrame):
                 assert "data" not in data.columns, "DataFrame 不应包含名为 'data' 的列"
-            self._insert_data(data, key_fields=key_fields, common_fields=common_fields)
+            payload = self._encode_change(data)
+            # 数据和变更日志在同一个事务中写入，避免数据已写入却没有记入日志
+            self._ensure_changelog()
+            try:
+                with self._tx():
+                    self._insert_data(data, key_fields=key_fields, common_fields=common_fields)
+                    self._journal_upsert(payload, key_fields=key_fields, common_fields=common_fields)
+            except Exception:
+                # 事务回滚后，进程内缓存的表结构可能已经失效
+                self.tables.clear()
+                raise
         
         cur = self._get_cursor()
         if not self.tables.get(table_name): self.tables[table_name] = self._get_table_info(common_fields=common_fields)
@@ -64,16 +89,18 @@ class CommonDB(BaseDB):
 
         cond = f"WHERE {' AND '.join([f'{k} = ?' for k in key_fields.keys()])}" if key_fields else ""
 
-        cur.execute(f"""
-            SELECT * FROM {table_name}
-            {cond}
-        """, (*[_python_value_to_sqlite_value(v) for v in key_fields.values()], ))
-        rows = cur.fetchall()
+        with DB_READ_SECONDS.time(table=self.table_basename):
+            cur.execute(f"""
+                SELECT * FROM {table_name}
+                {cond}
+            """, (*[_python_value_to_sqlite_value(v) for v in key_fields.values()], ))
+            rows = cur.fetchall()
 
         if isinstance(self.tables[table_name], dict):
             df = pd.DataFrame(rows, columns=rows[0].keys() if rows else [])
             if not df.empty:
-                return _sqlite_value_to_pandas_value(df, type_dict=self.tables[table_name])
+                with DB_CONVERT_SECONDS.time(table=self.table_basename):
+                    return _sqlite_value_to_pandas_value(df, type_dict=self.tables[table_name])
             else:
                 return df
         else:
@@ -81,6 +108,28 @@ class CommonDB(BaseDB):
             return _sqlite_value_to_python_value(data, type_s=self.tables[table_name])
     
 
+    def _encode_change(self, data: Any) -> Optional[str]:
+        # 写入前编码：_insert_data 会在 DataFrame 上插入 key 列
+        if not self.changelog:
+            return None
+        from .changelog import encode_data
+        return encode_data(data)
+
+    def _ensure_changelog(self) -> None:
+        # 变更日志表的建表语句会单独提交，必须在写数据的事务之前完成
+        if not self.changelog or self._changelog is not None:
+            return
+        from .changelog import Changelog
+        self._changelog = Changelog(self.db_path)
+        self._changelog._init_schema()
+
+    def _journal_upsert(self, payload: Optional[str], key_fields: Fields, common_fields: Fields) -> None:
+        if payload is None:
+            return
+        self._ensure_changelog()
+        with self._tx():
+            self._changelog.append("common", self.table_basename, {}, "upsert", key_fields, common_fields, payload)
+
     def _insert_data(self, data: Any, key_fields: Fields, common_fields: Fields):
         """
         将数据插入到数据库表中。
@@ -97,7 +146,7 @@ class CommonDB(BaseDB):
             sql = f'INSERT OR REPLACE INTO "{table_name}" ({columns}) VALUES ({placeholders});'
 
             cur = self._get_cursor()
-            with self._tx():
+            with DB_WRITE_SECONDS.time(table=self.table_basename), self._tx():
                 cur.execute(sql, (*[_python_value_to_sqlite_value(v) for v in key_fields.values()],
                                 _python_value_to_sqlite_value(data)))
         else:
@@ -120,7 +169,7 @@ class CommonDB(BaseDB):
                 data_tuples.append(tuple(x if not pd.isna(x) else None for x in tuple(row)))
 
             cur = self._get_cursor()
-            with self._tx():
+            with DB_WRITE_SECONDS.time(table=self.table_basename), self._tx():
                 cur.executemany(sql, data_tuples)
     
     def _check_data(self, data: Any, key_fields: Fields, common_fields: Fields) -> None:
@@ -253,6 +302,8 @@ class CacheConfig:
     key_fields: Tuple[str, ...]
     common_fields: Tuple[str, ...]
     except_fields: Tuple[str, ...]
+    normalizers: Tuple[Tuple[str, Normalizer], ...]
+    cache_url: str
 
 def common_cache(
     table_basename: str = "",
@@ -260,6 +311,8 @@ def common_cache(
     key_fields: Tuple[str, ...] = (),
     common_fields: Tuple[str, ...] = (),
     except_fields: Tuple[str, ...] = (),
+    normalizers: Dict[str, Normalizer] = {},
+    cache_url: str = os.getenv("FINTOOLS_CACHE_URL", ""),
 ) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
     """
     - 自动识别参数：bind(*args, **kwargs)
@@ -267,25 +320,33 @@ def common_cache(
     - except_fields 从 common_fields 里剔除（同时也不参与 hash）
     - 表名：{table_basename}_{sha1(common_fields + func_id)}_{data/ranges}
     - 注册：DB_CONNECTIONS["模块名:BaseDB"] = BaseDB(db_path)
+    - 规范化：同 history_cache，调用前按 normalizers 及枚举类型注解规范化参数
+    - 共享缓存：同 history_cache，cache_url 非空时把请求交给本机的缓存服务
     """
     cfg = CacheConfig(
         table_basename=table_basename,
         db_path=db_path,
         key_fields=key_fields,
         common_fields=common_fields,
-        except_fields=except_fields
+        except_fields=except_fields,
+        normalizers=tuple(normalizers.items()),
+        cache_url=cache_url,
     )
 
-    if not cfg.db_path:
+    if not cfg.db_path and not cfg.cache_url:
         return lambda func: func  # 不启用缓存，直接返回原函数
 
     def deco(func: Callable[..., pd.DataFrame]) -> Callable[..., pd.DataFrame]:
         # 注册 DB（按 模块名:BaseDB）
         reg_key = f"{func.__module__}:{func.__qualname__}"
         sig = inspect.signature(func)
+        arg_normalizers = {**default_normalizers(sig), **dict(cfg.normalizers)}
 
         table_basename = cfg.table_basename if cfg.table_basename else func.__name__
-        if reg_key not in DB_CONNECTIONS:
+        if reg_key not in DB_CONNECTIONS and cfg.cache_url:
+            from .cache_server import RemoteCommonDB
+            DB_CONNECTIONS[reg_key] = RemoteCommonDB(table_basename, cfg.cache_url, reg_key)  # type: ignore
+        elif reg_key not in DB_CONNECTIONS:
             DB_CONNECTIONS[reg_key] = CommonDB(
                 table_basename=table_basename,
                 db_path=cfg.db_path
@@ -296,7 +357,7 @@ def common_cache(
         def wrapper(*args, **kwargs) -> Any:
             bound = sig.bind(*args, **kwargs)
             bound.apply_defaults()
-            argmap: Dict[str, Any] = dict(bound.arguments)
+            argmap: Dict[str, Any] = normalize_arguments(dict(bound.arguments), arg_normalizers)
 
             if not cfg.common_fields:
                 common_fields = {}
@@ -319,9 +380,10 @@ def common_cache(
             else:
                 func_dec = func
 
+            from .cache_server import RemoteCommonDB
             db = DB_CONNECTIONS[reg_key]
-            if not isinstance(db, CommonDB):
-                raise TypeError(f"DB_CONNECTIONS[{reg_key}] 必须是 CommonDB 类型")
+            if not isinstance(db, (CommonDB, RemoteCommonDB)):
+                raise TypeError(f"DB_CONNECTIONS[{reg_key}] 必须是 CommonDB 或 RemoteCommonDB 类型")
             return db.fetch(
                 key_fields={k: argmap[k] for k in cfg.key_fields},
                 common_fields=common_fields,
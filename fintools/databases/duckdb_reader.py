@@ -0,0 +1,97 @@
+import os
+import importlib
+import pandas as pd
+from threading import Lock
+from typing import Dict, Any, Sequence
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _import_duckdb() -> Any:
+    try:
+        return importlib.import_module("duckdb")
+    except ModuleNotFoundError as e:
+        raise ImportError("duckdb module is not installed. Please install it (pip install fintools[duckdb]) to use the DuckDB read engine.") from e
+
+
+class DuckDBReader:
+    """
+    以只读方式把 SQLite 缓存文件挂载到 DuckDB 上，用于向量化、多线程的分析查询。
+
+    写入仍然只走 SQLite（HistoryDB / IntervalDB），因此覆盖区间元数据和
+    history_cache 的行为保持不变；DuckDB 只负责读。
+    """
+
+    _readers: Dict[str, "DuckDBReader"] = {}
+    _readers_lock = Lock()
+
+    def __init__(self, db_path: str, threads: int = int(os.getenv("FINTOOLS_DUCKDB_THREADS", "0"))):
+        duckdb = _import_duckdb()
+        self.db_path = db_path
+        self._catalog_error = duckdb.CatalogException
+        self._conn = duckdb.connect(":memory:", config={"threads": threads or (os.cpu_count() or 1)})
+        self._load_sqlite_extension(duckdb)
+        self._lock = Lock()
+        self._attach()
+
+    def _load_sqlite_extension(self, duckdb: Any) -> None:
+        # 扩展已安装时直接加载；只有缺失时才 INSTALL（需要联网下载）
+        try:
+            self._conn.execute("LOAD sqlite;")
+            return
+        except duckdb.Error:
+            pass
+        try:
+            self._conn.execute("INSTALL sqlite;")
+            self._conn.execute("LOAD sqlite;")
+        except duckdb.Error as e:
+            raise ImportError("DuckDB 的 sqlite 扩展未安装且无法下载。请在可以联网的环境中预先安装："
+                              "python -c \"import duckdb; duckdb.sql('INSTALL sqlite')\"，"
+                              "或把 FINTOOLS_READ_ENGINE 设为 sqlite。") from e
+
+    @classmethod
+    def for_path(cls, db_path: str) -> "DuckDBReader":
+        """按数据库路径复用同一个 DuckDB 实例。"""
+        with cls._readers_lock:
+            if db_path not in cls._readers:
+                cls._readers[db_path] = cls(db_path)
+            return cls._readers[db_path]
+
+    def _attach(self) -> None:
+        path = self.db_path.replace("'", "''")
+        self._conn.execute(f"ATTACH '{path}' AS cache (TYPE SQLITE, READ_ONLY);")
+
+    def _reattach(self) -> None:
+        # SQLite 中新建的表在挂载之后才出现时，需要重新挂载才能看到
+        with self._lock:
+            self._conn.execute("DETACH cache;")
+            self._attach()
+
+    def query(self, sql: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+        """
+        执行只读查询，直接返回列式结果构建的 DataFrame。
+
+        SQL 中的表名与 SQLite 中一致（默认库为挂载的缓存文件）。
+        """
+        for attempt in range(2):
+            cur = self._conn.cursor()  # 每次查询一个游标，可在多线程下并发使用
+            try:
+                cur.execute("USE cache;")
+                return cur.execute(sql, list(params)).df()
+            except self._catalog_error:
+                if attempt: raise
+                logger.debug(f"[DuckDBReader]: 未找到表，重新挂载 {self.db_path}")
+                self._reattach()
+            finally:
+                cur.close()
+        raise RuntimeError("unreachable")
+
+    def close(self) -> None:
+        self._conn.close()
+        with self._readers_lock:
+            if self._readers.get(self.db_path) is self:
+                del self._readers[self.db_path]
+
+
+__all__ = ["DuckDBReader"]
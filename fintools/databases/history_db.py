@@ -1,29 +1,49 @@
 import json
 import sqlite3
 import os
+import numpy as np
 import pandas as pd
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 import tzlocal
-from typing import Optional, Tuple, List, Callable, Dict, Any, Union
+from typing import Optional, Tuple, List, Callable, Dict, Any, Union, Iterator
 from hashlib import sha1
 from dataclasses import dataclass
 import inspect
 
-from pyparsing import wraps
+from functools import wraps
 
-from . import BaseDB, Fields, DB_CONNECTIONS
+from . import BaseDB, Fields, UpsertResult, CacheMissError, DB_CONNECTIONS
+from fintools.utils.metrics import (
+    CACHE_REQUESTS, CACHE_DOWNLOADED_ROWS, CACHE_DOWNLOADED_BYTES, CACHE_CALLBACK_SECONDS,
+    DB_READ_SECONDS, DB_WRITE_SECONDS, DB_UPSERTED_ROWS, DB_CONVERT_SECONDS,
+)
 
 import logging
 logger = logging.getLogger(__name__)
 
 from .utils import *
+from .keys import Normalizer, default_normalizers, normalize_arguments
+from .blocks import encode_block, decode_block, decode_blocks, bucket_start, bucket_end
 
 class IntervalDB(BaseDB):
-    def __init__(self, table_basename: str, db_path: str = os.getenv("FINTOOLS_DB", "history.db")):
+    def __init__(self, table_basename: str, db_path: str = os.getenv("FINTOOLS_DB", "history.db"), read_only: bool = False):
         self.db_path = db_path
         self.table_basename = table_basename + "_intervals"
+        self.read_only = read_only
         self.tables = {}
 
+    def _ensure_schema(self, key_fields: Fields, common_fields: Fields) -> bool:
+        """确保区间表存在；只读模式下不建表，表不存在时返回 False。"""
+        table_name = self._get_table_name(common_fields=common_fields)
+        if table_name not in self.tables:
+            if self.read_only:
+                if not self._get_table_info(common_fields=common_fields):
+                    return False
+                self.tables[table_name] = True
+            else:
+                self._init_schema(key_fields=key_fields, common_fields=common_fields)
+        return True
+
 
     def _init_schema(self, key_fields: Fields, common_fields: Fields) -> None:
         cur = self._get_cursor()
@@ -117,6 +137,44 @@ class IntervalDB(BaseDB):
                 VALUES ({", ".join(["?"] * (len(key_fields) + 2))})
             """, (*[_python_value_to_sqlite_value(v) for v in key_fields.values()], S, E))
 
+    def remove_interval(self, common_fields: Fields, start: datetime, end: datetime,
+                        key_fields: Optional[Fields] = None) -> None:
+        """
+        从已缓存区间中扣掉 [start, end)，被截断的区间保留两侧剩余部分。
+
+        key_fields 为 None 时作用于表中所有 key。
+        """
+        if end <= start:
+            return
+        start_ts = _datetime_to_timestamp(start)
+        end_ts = _datetime_to_timestamp(end)
+
+        table_name = self._get_table_name(common_fields=common_fields)
+        if table_name not in self.tables:
+            if not self._get_table_info(common_fields=common_fields):
+                return
+            self.tables[table_name] = True
+
+        key_fields = key_fields or {}
+        with self._tx():
+            cur = self._get_cursor()
+            cond = " AND ".join([f"{k} = ?" for k in key_fields.keys()]) + " AND " if key_fields else ""
+            cur.execute(f"""
+                SELECT * FROM {table_name}
+                WHERE {cond}
+                    end_ts   > ?
+                    AND start_ts < ?
+            """, (*[_python_value_to_sqlite_value(v) for v in key_fields.values()], start_ts, end_ts))
+            for r in cur.fetchall():
+                keys = [k for k in r.keys() if k not in ("id", "start_ts", "end_ts")]
+                cur.execute(f"DELETE FROM {table_name} WHERE id = ?", (r["id"],))
+                for s, e in ((r["start_ts"], start_ts), (end_ts, r["end_ts"])):
+                    if s < e:
+                        cur.execute(f"""
+                            INSERT INTO {table_name}({", ".join(keys)}, start_ts, end_ts)
+                            VALUES ({", ".join(["?"] * (len(keys) + 2))})
+                        """, (*[r[k] for k in keys], s, e))
+
     # ------------------- 读缓存：查缺失区间 -------------------
 
     def get_missing(self, key_fields: Fields, common_fields: Fields,
@@ -135,8 +193,8 @@ class IntervalDB(BaseDB):
         end_ts = _datetime_to_timestamp(end)
 
         table_name = self._get_table_name(common_fields=common_fields)
-        if table_name not in self.tables:
-            self._init_schema(key_fields=key_fields, common_fields=common_fields)
+        if not self._ensure_schema(key_fields=key_fields, common_fields=common_fields):
+            return [(start, end)]
 
         cur = self._get_cursor()
 
@@ -185,8 +243,8 @@ class IntervalDB(BaseDB):
              (cached_start_2, cached_end_2), ...]
         """
         table_name = self._get_table_name(common_fields=common_fields)
-        if table_name not in self.tables:
-            self._init_schema(key_fields=key_fields, common_fields=common_fields)
+        if not self._ensure_schema(key_fields=key_fields, common_fields=common_fields):
+            return []
 
         cur = self._get_cursor()
 
@@ -221,16 +279,75 @@ class IntervalDB(BaseDB):
             return True
 
 class HistoryDB(BaseDB):
-    def __init__(self, table_basename: str, db_path: str = os.getenv("FINTOOLS_DB", "history.db"), missing_threshold: int = 1):
+    def __init__(self, table_basename: str, db_path: str = os.getenv("FINTOOLS_DB", "history.db"), missing_threshold: int = 1,
+                 read_engine: str = os.getenv("FINTOOLS_READ_ENGINE", "sqlite"),
+                 storage: str = os.getenv("FINTOOLS_HISTORY_STORAGE", "rows"),
+                 block_period: str = os.getenv("FINTOOLS_BLOCK_PERIOD", "day"),
+                 read_only: bool = os.getenv("FINTOOLS_DB_READONLY", "0") == "1",
+                 on_miss: str = os.getenv("FINTOOLS_ON_MISS", "fail"),
+                 registry_key: Optional[str] = None,
+                 refresh_queue: str = os.getenv("FINTOOLS_REFRESH_QUEUE", "refresh_queue.db"),
+                 dict_encode: bool = os.getenv("FINTOOLS_DICT_ENCODE", "1") == "1",
+                 without_rowid: bool = True,
+                 partition: str = os.getenv("FINTOOLS_HISTORY_PARTITION", "none"),
+                 normalizers: Optional[Dict[str, Normalizer]] = None,
+                 common_field_names: Tuple[str, ...] = (),
+                 changelog: bool = os.getenv("FINTOOLS_CHANGELOG", "0") == "1"):
+        """
+        参数：
+            read_engine: 读取引擎，sqlite 或 duckdb
+            storage: 存储方式，rows 为一行一根 bar；blocks 为按 (key, block_period) 打包压缩成一行 BLOB，适合分钟线
+            block_period: blocks 模式下的分块周期，day 或 month
+            read_only: 只读服务模式，以 mode=ro 打开数据库，不建表、不下载、不写入
+            on_miss: 只读模式下遇到缺失区间的处理方式：fail 直接抛出 CacheMissError；
+                queue 把请求交给刷新任务（见 refresh_queue），并返回已缓存的部分
+            registry_key: 在 DB_CONNECTIONS 中的注册名，queue 模式下刷新任务据此找到被缓存的函数
+            refresh_queue: queue 模式下刷新请求队列所在的 SQLite 文件
+            dict_encode: 新建的数据表中，字符串类型的 key 列（如 symbol）通过 symbol_dict 表编码为整数 id 存储；
+                已有的 TEXT 列保持不变，读写时按表结构自动识别
+            without_rowid: 新建的数据表使用 WITHOUT ROWID，行按主键顺序聚簇存储，范围查询无需回表；
+                已有的表可以用 `python -m fintools.databases.migrate without-rowid` 迁移
+            partition: 按时间分区存储（none / year / month，UTC），每个分区是一张物理表 `<表名>_p<YYYY[MM]>`，
+                查询只访问与区间相交的分区，旧分区可以整体 drop / archive / compact；仅支持 rows 存储方式
+            normalizers: 各参数的规范化函数（见 keys.py），由 history_cache 在调用前应用；
+                这里只记录下来，供 `python -m fintools.databases.migrate canonical-keys` 合并历史上分叉的表和 key
+            common_field_names: 参与表名哈希的参数名（按顺序），同样只供迁移工具使用
+            changelog: 把每次下载写入的数据和已缓存区间的变化追加到同一文件的变更日志（见 changelog.py），
+                供其他节点用 `python -m fintools.databases.changelog sync` 增量同步
+        """
+        assert read_engine in ("sqlite", "duckdb"), f"不支持的读取引擎：{read_engine}"
+        assert storage in ("rows", "blocks"), f"不支持的存储方式：{storage}"
+        assert block_period in ("day", "month"), f"不支持的分块周期：{block_period}"
+        assert on_miss in ("fail", "queue"), f"不支持的缺失处理方式：{on_miss}"
+        assert partition in ("none", "year", "month"), f"不支持的分区方式：{partition}"
+        assert partition == "none" or storage == "rows", "blocks 存储方式本身已按时间分块，不支持再分区"
+        assert on_miss != "queue" or registry_key, "queue 模式需要提供 registry_key"
         self.db_path = db_path
-        self.table_basename = table_basename
+        # blocks 模式使用独立的数据表和区间表，避免与 rows 模式的已缓存区间混用
+        self.table_basename = table_basename if storage == "rows" else table_basename + "_blocks"
         self.missing_threshold = missing_threshold
-        self._interval_db = IntervalDB(table_basename, db_path)
+        self.read_engine = read_engine
+        self.storage = storage
+        self.block_period = block_period
+        self.read_only = read_only
+        self.on_miss = on_miss
+        self.registry_key = registry_key
+        self.refresh_queue = refresh_queue
+        self.dict_encode = dict_encode
+        self.without_rowid = without_rowid
+        self.partition = partition
+        self.normalizers = dict(normalizers or {})
+        self.common_field_names = tuple(common_field_names)
+        self.changelog = changelog and not read_only
+        self._changelog: Any = None
+        self._symbol_ids: Dict[str, int] = {}
+        self._encoded_columns: Dict[str, set] = {}
+        self._interval_db = IntervalDB(self.table_basename, db_path, read_only=read_only)
         self.tables = {}
     
     def history(self, key_fields: Fields = {}, common_fields: Fields = {}, except_fields: Fields = {},
-                start: datetime = (datetime.now() - timedelta(days=30)).astimezone(),
-                end: datetime = datetime.now().astimezone(),
+                start: Optional[datetime] = None,
+                end: Optional[datetime] = None,
                 callback: Optional[Callable[..., pd.DataFrame]] = None,
                 field_map: Optional[Dict[str, str]] = None) -> pd.DataFrame:
         """
@@ -239,8 +356,8 @@ class HistoryDB(BaseDB):
         参数：
             key_fields: 关键字段，如 symbol 等
             common_fields: 公共字段，如 type、 freq 等
-            start: 起始时间（包含）, datetime 类型
-            end: 结束时间（不包含）, datetime 类型
+            start: 起始时间（包含）, datetime 类型，默认为 end 前 30 天
+            end: 结束时间（不包含）, datetime 类型，默认为调用时刻
             callback: 当发现缺失区间时，用于下载数据的回调函数，函数签名类似：
                 callback(symbol: str, type: str, freq: str, start: datetime, end: datetime) -> pd.DataFrame
             field_map: 函数调用时用于字段映射的字典，键为回调函数返回的字段名，值为数据库中的字段名。
@@ -249,11 +366,275 @@ class HistoryDB(BaseDB):
         """
         table_name = self._get_table_name(common_fields=common_fields)
 
-        start = start.astimezone()
-        end = end.astimezone()
+        end = end.astimezone() if end is not None else datetime.now().astimezone()
+        start = start.astimezone() if start is not None else end - timedelta(days=30)
+
+        self._fill_missing(key_fields=key_fields, common_fields=common_fields, except_fields=except_fields,
+                           start=start, end=end, callback=callback, field_map=field_map)
+
+        # 最后，返回完整数据
+        if not self.tables.get(table_name): self.tables[table_name] = self._get_table_info(common_fields=common_fields)
+        if not self.tables.get(table_name): return pd.DataFrame([])  # 表不存在，且本次也没数据，直接返回空表
+        df = self._select_range(table_name, key_fields_list=[self._stored_key_fields(table_name, key_fields)],
+                                start=start, end=end, descending=True)
+        if not df.empty:
+            with DB_CONVERT_SECONDS.time(table=self.table_basename):
+                return _sqlite_value_to_pandas_value(df, type_dict=self.tables[table_name])
+        else:
+            return df
+
+    def history_many(self, key_fields_list: List[Fields], common_fields: Fields = {}, except_fields: Fields = {},
+                     start: Optional[datetime] = None,
+                     end: Optional[datetime] = None,
+                     callback: Optional[Callable[..., pd.DataFrame]] = None,
+                     field_map: Optional[Dict[str, str]] = None,
+                     batch_callback: Optional[Callable[..., pd.DataFrame]] = None) -> pd.DataFrame:
+        """
+        一次性获取多个 key（如多个 symbol）的历史数据。
+
+        先补齐缺失区间，再用一条 SQL 读出全部数据（长表格式，带 key 列）。
+
+        参数：
+            key_fields_list: 关键字段列表，每个元素为一组 key_fields，且字段名相同
+            batch_callback: 可选的批量下载函数，参数与 callback 相同但 key 字段为列表，返回带 key 列的长表；
+                            给出时缺失区间相同的 key 合并为一次下载，否则逐个调用 callback
+            其余参数同 history
+        返回值：
+            按 (key, date) 升序排列的长表，类型为 pd.DataFrame。
+        """
+        if not key_fields_list:
+            return pd.DataFrame([])
+        table_name = self._get_table_name(common_fields=common_fields)
+
+        end = end.astimezone() if end is not None else datetime.now().astimezone()
+        start = start.astimezone() if start is not None else end - timedelta(days=30)
+
+        handled: List[Fields] = []
+        if batch_callback is not None and not self.read_only:
+            handled = self._fill_missing_batch(key_fields_list, common_fields=common_fields, except_fields=except_fields,
+                                               start=start, end=end, batch_callback=batch_callback)
+        for key_fields in key_fields_list:
+            if key_fields in handled:
+                continue
+            self._fill_missing(key_fields=key_fields, common_fields=common_fields, except_fields=except_fields,
+                               start=start, end=end, callback=callback, field_map=field_map)
+
+        if not self.tables.get(table_name): self.tables[table_name] = self._get_table_info(common_fields=common_fields)
+        if not self.tables.get(table_name): return pd.DataFrame([])
+        stored_list = [self._stored_key_fields(table_name, kf) for kf in key_fields_list]
+        df = self._select_range(table_name, key_fields_list=stored_list, start=start, end=end, with_keys=True)
+        if df.empty:
+            return df
+        with DB_CONVERT_SECONDS.time(table=self.table_basename):
+            key_df = df[list(key_fields_list[0].keys())]
+            df = _sqlite_value_to_pandas_value(df, type_dict=self.tables[table_name])
+            for k in reversed(list(key_fields_list[0].keys())):
+                # 把数据库中存储的 key 值（可能是字典编码后的 id）映射回调用方传入的原始值
+                stored = {_python_value_to_sqlite_value(skf[k]): kf[k] for skf, kf in zip(stored_list, key_fields_list)}
+                df.insert(0, k, key_df[k].map(stored).values)
+        return df
+
+    def iter_history(self, key_fields: Fields = {}, common_fields: Fields = {}, except_fields: Fields = {},
+                     start: Optional[datetime] = None,
+                     end: Optional[datetime] = None,
+                     callback: Optional[Callable[..., pd.DataFrame]] = None,
+                     field_map: Optional[Dict[str, str]] = None,
+                     chunk_rows: int = 100_000) -> Iterator[pd.DataFrame]:
+        """
+        与 history 相同，但按时间升序分块返回，除最后一块外每块正好 chunk_rows 行。
+
+        先补齐缺失区间，再用游标逐块 fetchmany 并转换类型，内存占用只与 chunk_rows 有关，与总行数无关；
+        分区表按时间顺序逐个分区读取，blocks 模式逐个 block 解码。
+        """
+        assert chunk_rows > 0, "chunk_rows 必须大于 0"
+        table_name = self._get_table_name(common_fields=common_fields)
+        end = end.astimezone() if end is not None else datetime.now().astimezone()
+        start = start.astimezone() if start is not None else end - timedelta(days=30)
+
+        self._fill_missing(key_fields=key_fields, common_fields=common_fields, except_fields=except_fields,
+                           start=start, end=end, callback=callback, field_map=field_map)
+
+        if not self.tables.get(table_name): self.tables[table_name] = self._get_table_info(common_fields=common_fields)
+        if not self.tables.get(table_name): return
+        stored = self._stored_key_fields(table_name, key_fields)
+        buffer: List[pd.DataFrame] = []
+        buffered = 0
+        for raw in self._iter_raw(table_name, stored, start, end, chunk_rows):
+            buffer.append(raw)
+            buffered += len(raw)
+            while buffered >= chunk_rows:
+                df = pd.concat(buffer, ignore_index=True) if len(buffer) > 1 else buffer[0]
+                head, rest = df.iloc[:chunk_rows].reset_index(drop=True), df.iloc[chunk_rows:].reset_index(drop=True)
+                buffer, buffered = [rest], len(rest)
+                # 只计转换的耗时，不包括调用方处理上一块的时间
+                with DB_CONVERT_SECONDS.time(table=self.table_basename):
+                    chunk = _sqlite_value_to_pandas_value(head, type_dict=self.tables[table_name])
+                yield chunk
+        if buffered:
+            df = pd.concat(buffer, ignore_index=True)
+            with DB_CONVERT_SECONDS.time(table=self.table_basename):
+                chunk = _sqlite_value_to_pandas_value(df, type_dict=self.tables[table_name])
+            yield chunk
+
+    def _iter_raw(self, table_name: str, key_fields: Fields, start: datetime, end: datetime, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        """按时间升序逐批读出一个 key 在 [start, end) 内的原始数据行，每批行数不固定。"""
+        start_ts, end_ts = _datetime_to_timestamp(start), _datetime_to_timestamp(end)
+        cond = "".join([f" AND {k} = ?" for k in key_fields.keys()])
+        params = (start_ts, end_ts, *[_python_value_to_sqlite_value(v) for v in key_fields.values()])
+        # 每个生成器使用独立的游标，迭代过程中其他查询不会打断它
+        cur = self._get_cursor()
+        if self.storage == "blocks":
+            cur.execute(f"""
+                SELECT payload FROM "{table_name}"
+                WHERE block_end > ? AND block_start < ? {cond}
+                ORDER BY block_start;
+            """, params)
+            while rows := cur.fetchmany(16):
+                df = decode_blocks([r["payload"] for r in rows])
+                if not df.empty:
+                    df = df[(df["date"] >= start_ts) & (df["date"] < end_ts)]
+                    yield df.sort_values("date", kind="stable").reset_index(drop=True)
+            return
+        if self.partition != "none":
+            tables = [self._partition_table(table_name, p) for p in self._partitions_between(table_name, start, end)]
+        else:
+            tables = [table_name]
+        for table in tables:
+            cur.execute(f"""
+                SELECT * FROM "{table}"
+                WHERE date >= ? AND date < ? {cond}
+                ORDER BY date ASC;
+            """, params)
+            columns = [c[0] for c in cur.description]
+            while rows := cur.fetchmany(chunk_rows):
+                yield pd.DataFrame(rows, columns=columns)
+
+    def query(self, sql: str, params: Tuple[Any, ...] = ()) -> pd.DataFrame:
+        """
+        在缓存库上执行只读的分析查询，返回原始值（未做类型转换）的 DataFrame。
+
+        read_engine 为 duckdb 时走 DuckDB（向量化、多线程），否则走 SQLite。
+        """
+        if self.read_engine == "duckdb":
+            from .duckdb_reader import DuckDBReader
+            return DuckDBReader.for_path(self.db_path).query(sql, params)
+        cur = self._get_cursor()
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+        return pd.DataFrame(rows, columns=[c[0] for c in cur.description] if cur.description else [])
+
+    def list_all_cached(self, common_fields: Fields = {}) -> List[Any]:
+        """同 BaseDB.list_all_cached，字典编码的 key 列返回原始字符串。"""
+        table_name = self._get_table_name(common_fields=common_fields)
+
+        if not self.tables.get(table_name): self.tables[table_name] = self._get_table_info(common_fields=common_fields)
+        if not self.tables.get(table_name):
+            return []
+
+        primary_keys = self._get_primary_keys(common_fields=common_fields)
+        cur = self._get_cursor()
+        with DB_READ_SECONDS.time(table=self.table_basename):
+            cur.execute(f'SELECT {self._decoded_select(table_name, primary_keys)} FROM "{table_name}" AS t;')
+            return cur.fetchall()
+
+    def select_by_primary_keys(self, keys: List[Dict[str, Any]], common_fields: Fields = {}) -> List[Any]:
+        """同 BaseDB.select_by_primary_keys：传入原始的 key 值，查询时编码，返回的 key 列解码为原始字符串。"""
+        table_name = self._get_table_name(common_fields=common_fields)
+
+        if not self.tables.get(table_name): self.tables[table_name] = self._get_table_info(common_fields=common_fields)
+        if not self.tables.get(table_name):
+            return []
+
+        primary_keys = self._get_primary_keys(common_fields=common_fields)
+        for each in primary_keys:
+            assert each in keys[0].keys(), f"主键字段 {each} 不在提供的 keys 中。"
+
+        # 未登记到 symbol_dict 的字符串编码为 None，不可能匹配任何行
+        stored = [self._stored_key_fields(table_name, {pk: each[pk] for pk in primary_keys}) for each in keys]
+        stored = [kf for kf in stored if all(v is not None for v in kf.values())]
+        if not stored:
+            return []
+        cur = self._get_cursor()
+        cur.execute(f'PRAGMA table_info("{table_name}");')
+        columns = [r["name"] for r in cur.fetchall()]
+        values = ", ".join([f"({', '.join(['?'] * len(primary_keys))})"] * len(stored))
+        params = [_python_value_to_sqlite_value(kf[pk]) for kf in stored for pk in primary_keys]
+        sql = f"""
+            WITH temp_keys({", ".join(primary_keys)}) AS ( VALUES {values} )
+            SELECT {self._decoded_select(table_name, columns)} FROM "{table_name}" AS t JOIN temp_keys USING ({", ".join(primary_keys)});
+        """
+        with DB_READ_SECONDS.time(table=self.table_basename):
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def missing(self, key_fields: Fields, common_fields: Fields, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """[start, end) 中尚未缓存的区间，按时间升序。"""
+        if not self._interval_db._ensure_schema(key_fields=key_fields, common_fields=common_fields):
+            return [(start, end)]
+        return self._interval_db.get_missing(key_fields=key_fields, common_fields=common_fields, start=start, end=end)
+
+    def bulk_insert(self, data: pd.DataFrame, key_columns: List[str], common_fields: Fields,
+                    start: datetime, end: datetime, key_fields_list: Optional[List[Fields]] = None) -> UpsertResult:
+        """
+        把一张含多个 key 的长表一次性写入缓存，并把这些 key 的 [start, end) 登记为已缓存。
+
+        用于按交易日横截面批量拉取的场景（一次请求返回当天全部 symbol），
+        所有 key 的数据和区间在同一个事务中写入，只提交一次。
+
+        参数：
+            data: 长表，key_columns 指定的列区分不同的 key，其余列与 history 返回的列一致
+            key_columns: 作为 key_fields 的列名，如 ["symbol"]
+            start, end: 本次数据覆盖的区间
+            key_fields_list: 需要登记区间的 key，默认为 data 中出现过的 key；
+                             显式给出时可以包含当天没有数据的 key（如停牌），避免之后逐个回源
+        """
+        assert not self.read_only, f"只读模式下不能写入数据库 {self.db_path}"
+        groups: List[Tuple[Fields, pd.DataFrame]] = []
+        if not data.empty:
+            for k, part in data.groupby(key_columns, sort=False):
+                values = k if isinstance(k, tuple) else (k,)
+                groups.append((dict(zip(key_columns, values)), part.drop(columns=key_columns).reset_index(drop=True)))
+        covered = key_fields_list if key_fields_list is not None else [kf for kf, _ in groups]
+        if not groups and not covered:
+            return UpsertResult()
+
+        # 区间表和变更日志表的建表语句会单独提交，必须在事务外完成
+        if covered:
+            self._interval_db._ensure_schema(key_fields=covered[0], common_fields=common_fields)
+        self._ensure_changelog()
+        result = UpsertResult()
+        try:
+            with self._tx():
+                for kf, part in groups:
+                    result += self._insert_data(part, key_fields=kf, common_fields=common_fields)
+                for kf in covered:
+                    self._interval_db.add_interval(key_fields=kf, common_fields=common_fields, start=start, end=end)
+                if self.changelog:
+                    from .changelog import encode_data, interval_payload
+                    self._journal([("upsert", kf, common_fields, encode_data(part)) for kf, part in groups] +
+                                  [("add_interval", kf, common_fields, interval_payload(start, end)) for kf in covered])
+        except Exception:
+            # 事务回滚后，进程内缓存的表结构和 symbol id 可能已经失效
+            self.tables.clear()
+            self._symbol_ids.clear()
+            raise
+        logger.debug(f"[HistoryDB]: 批量写入 {len(groups)} 个 key 共 {len(data)} 行，登记 {len(covered)} 个 key 的区间 [{start} - {end})。")
+        return result
+
+    def _fill_missing(self, key_fields: Fields, common_fields: Fields, except_fields: Fields,
+                      start: datetime, end: datetime,
+                      callback: Optional[Callable[..., pd.DataFrame]] = None,
+                      field_map: Optional[Dict[str, str]] = None) -> None:
+        """
+        查出 [start, end) 内尚未缓存的区间，调用 callback 下载并写入缓存。
+        """
+        table_name = self._get_table_name(common_fields=common_fields)
 
         missing = self._interval_db.get_missing(key_fields=key_fields, common_fields=common_fields, start=start, end=end)
-        if len(missing) > self.missing_threshold:
+        CACHE_REQUESTS.inc(table=self.table_basename, result="miss" if missing else "hit")
+        if missing and self.read_only:
+            self._handle_read_only_miss(table_name, key_fields, common_fields, except_fields, missing)
+        elif len(missing) > self.missing_threshold:
             logger.debug(f"[HistoryDB]: 发现表 {table_name} 中有 {len(missing)} 个缺失区间，超过阈值 {self.missing_threshold}，采用整块下载。")
             assert callback is not None, "需要提供 callback 函数以下载缺失数据"
             arguments: Dict[str, Any] = {}
@@ -266,11 +647,10 @@ class HistoryDB(BaseDB):
                 for k, v in field_map.items():
                     call_args[k] = arguments.get(v)
             else: call_args = arguments
-            data = callback(**call_args)
+            data = self._run_callback(callback, call_args)
             if not data.empty:
-                self._insert_data(data, key_fields=key_fields, common_fields=common_fields)
-                self._interval_db.add_interval(key_fields=key_fields, common_fields=common_fields,
-                                               start=missing[0][0], end=(data["date"].max() + pd.Timedelta(microseconds=1)).to_pydatetime())
+                covered_end = (data["date"].max() + pd.Timedelta(microseconds=1)).to_pydatetime()
+                self._store_download(data, key_fields, common_fields, missing[0][0], covered_end)
         elif len(missing) > 0:
             for (ms, me) in missing:
                 logger.debug(f"[HistoryDB]: 发现表 {table_name} 中缺失区间 [{ms} - {me})，采用分块下载。")
@@ -286,57 +666,315 @@ class HistoryDB(BaseDB):
                         call_args[k] = arguments.get(v)
                 else:
                     call_args = arguments
-                data = callback(**call_args)
+                data = self._run_callback(callback, call_args)
                 if not data.empty:
-                    self._insert_data(data, key_fields=key_fields, common_fields=common_fields)
-                    self._interval_db.add_interval(key_fields=key_fields, common_fields=common_fields, 
-                                                   start=ms, end=(data["date"].max() + pd.Timedelta(microseconds=1)).to_pydatetime())
+                    covered_end = (data["date"].max() + pd.Timedelta(microseconds=1)).to_pydatetime()
+                    self._store_download(data, key_fields, common_fields, ms, covered_end)
 
-        # 最后，返回完整数据
-        cur = self._get_cursor()
-        if not self.tables.get(table_name): self.tables[table_name] = self._get_table_info(common_fields=common_fields)
-        if not self.tables.get(table_name): return pd.DataFrame([])  # 表不存在，且本次也没数据，直接返回空表
-        cond = f"AND {' AND '.join([f'{k} = ?' for k in key_fields.keys()])}" if key_fields else ""
-        cur.execute(f"""
-            SELECT * FROM {table_name}
+    def _fill_missing_batch(self, key_fields_list: List[Fields], common_fields: Fields, except_fields: Fields,
+                            start: datetime, end: datetime, batch_callback: Callable[..., pd.DataFrame]) -> List[Fields]:
+        """
+        按缺失区间 [第一个缺口起点, 最后一个缺口终点) 把 key 分组，每组调用一次 batch_callback 并逐个写入缓存。
+
+        返回值：
+            本次已经处理过的 key；其中没有返回数据的 key 与 _fill_missing 一样不登记区间，但本次不再逐个回源。
+        """
+        groups: Dict[Tuple[datetime, datetime], List[Fields]] = {}
+        for key_fields in key_fields_list:
+            missing = self._interval_db.get_missing(key_fields=key_fields, common_fields=common_fields, start=start, end=end)
+            if missing:
+                groups.setdefault((missing[0][0], missing[-1][1]), []).append(key_fields)
+        handled: List[Fields] = []
+        for (ms, me), keys in groups.items():
+            logger.debug(f"[HistoryDB]: 批量下载 {len(keys)} 个 key 的缺失区间 [{ms} - {me})。")
+            CACHE_REQUESTS.inc(len(keys), table=self.table_basename, result="miss")
+            key_columns = list(keys[0].keys())
+            arguments: Dict[str, Any] = {k: [kf[k] for kf in keys] for k in key_columns}
+            arguments.update(common_fields)
+            arguments.update(except_fields)
+            arguments.update({"start": ms, "end": me})
+            data = self._run_callback(batch_callback, arguments)
+            parts: Dict[Tuple[Any, ...], pd.DataFrame] = {}
+            if not data.empty:
+                for k, part in data.groupby(key_columns, sort=False):
+                    parts[k if isinstance(k, tuple) else (k,)] = part.drop(columns=key_columns).reset_index(drop=True)
+            for key_fields in keys:
+                part = parts.get(tuple(key_fields[k] for k in key_columns))
+                if part is not None and not part.empty:
+                    covered_end = (part["date"].max() + pd.Timedelta(microseconds=1)).to_pydatetime()
+                    self._store_download(part, key_fields, common_fields, ms, covered_end)
+                handled.append(key_fields)
+        return handled
+
+    def _journal(self, changes: List[Tuple[str, Fields, Fields, str]]) -> None:
+        """changelog 开启时，在一个事务中追加若干条 (op, key_fields, common_fields, payload) 变更日志。"""
+        if not self.changelog:
+            return
+        self._ensure_changelog()
+        # 日志中记录用户给出的 table_basename，重放时由 HistoryDB 按 storage 重新加上后缀
+        basename = self.table_basename[:-len("_blocks")] if self.storage == "blocks" else self.table_basename
+        options = {"storage": self.storage, "block_period": self.block_period, "partition": self.partition}
+        with self._tx():
+            for op, key_fields, common_fields, payload in changes:
+                self._changelog.append("history", basename, options, op, key_fields, common_fields, payload)
+
+    def _ensure_changelog(self) -> None:
+        # 变更日志表的建表语句会单独提交，必须在写数据的事务之前完成
+        if not self.changelog or self._changelog is not None:
+            return
+        from .changelog import Changelog
+        self._changelog = Changelog(self.db_path)
+        self._changelog._init_schema()
+
+    def _store_download(self, data: pd.DataFrame, key_fields: Fields, common_fields: Fields, start: datetime, end: datetime) -> None:
+        """
+        在同一个事务中写入一次下载的数据、登记 [start, end) 为已缓存，并追加对应的变更日志，
+        避免写入了数据却没有记入日志，使其他节点同步后的缓存与本地不一致。
+        """
+        # 区间表和变更日志表的建表语句会单独提交，必须在事务外完成
+        self._interval_db._ensure_schema(key_fields=key_fields, common_fields=common_fields)
+        self._ensure_changelog()
+        try:
+            with self._tx():
+                self._insert_data(data, key_fields=key_fields, common_fields=common_fields)
+                self._interval_db.add_interval(key_fields=key_fields, common_fields=common_fields, start=start, end=end)
+                self._journal_download(data, key_fields, common_fields, start, end)
+        except Exception:
+            # 事务回滚后，进程内缓存的表结构和 symbol id 可能已经失效
+            self.tables.clear()
+            self._symbol_ids.clear()
+            raise
+
+    def _journal_download(self, data: pd.DataFrame, key_fields: Fields, common_fields: Fields, start: datetime, end: datetime) -> None:
+        if not self.changelog:
+            return
+        from .changelog import encode_data, interval_payload
+        self._journal([("upsert", key_fields, common_fields, encode_data(data)),
+                       ("add_interval", key_fields, common_fields, interval_payload(start, end))])
+
+    def _handle_read_only_miss(self, table_name: str, key_fields: Fields, common_fields: Fields, except_fields: Fields,
+                               missing: List[Tuple[datetime, datetime]]) -> None:
+        if self.on_miss == "fail":
+            raise CacheMissError(table_name, key_fields, missing)
+        from .refresh_queue import RefreshQueue
+        arguments: Dict[str, Any] = {}
+        arguments.update(key_fields)
+        arguments.update(common_fields)
+        arguments.update(except_fields)
+        arguments.update({"start": missing[0][0], "end": missing[-1][1]})
+        assert self.registry_key is not None
+        RefreshQueue(self.refresh_queue).put(self.registry_key, arguments)
+        logger.warning(f"[HistoryDB]: 表 {table_name} 中 {key_fields} 缺少 {len(missing)} 个区间，已提交刷新请求，本次只返回已缓存的数据。")
+
+    def _run_callback(self, callback: Callable[..., pd.DataFrame], call_args: Dict[str, Any]) -> pd.DataFrame:
+        with CACHE_CALLBACK_SECONDS.time(table=self.table_basename):
+            data = callback(**call_args)
+        CACHE_DOWNLOADED_ROWS.inc(len(data), table=self.table_basename)
+        CACHE_DOWNLOADED_BYTES.inc(int(data.memory_usage(deep=True).sum()), table=self.table_basename)
+        return data
+
+    def _select_range(self, table_name: str, key_fields_list: List[Fields], start: datetime, end: datetime,
+                      descending: bool = False, with_keys: bool = False) -> pd.DataFrame:
+        """
+        读出一组 key 在 [start, end) 内的原始数据行。
+
+        多个 key 时通过 VALUES 临时表做 JOIN，保证只执行一条 SQL。
+        """
+        if self.storage == "blocks":
+            return self._select_blocks(table_name, key_fields_list, start, end, descending=descending, with_keys=with_keys)
+        if self.partition != "none":
+            # 只查询与 [start, end) 相交且存在的分区，按时间顺序拼接
+            tables = [self._partition_table(table_name, p) for p in self._partitions_between(table_name, start, end)]
+            if descending: tables.reverse()
+            frames = [self._select_range_table(t, key_fields_list, start, end, descending=descending, with_keys=with_keys) for t in tables]
+            frames = [f for f in frames if not f.empty]
+            if len(frames) <= 1:
+                return frames[0] if frames else pd.DataFrame([])
+            df = pd.concat(frames, ignore_index=True)
+            if with_keys and key_fields_list[0]:
+                df = df.sort_values(list(key_fields_list[0].keys()), kind="stable", ignore_index=True)
+            return df
+        return self._select_range_table(table_name, key_fields_list, start, end, descending=descending, with_keys=with_keys)
+
+    def _select_range_table(self, table_name: str, key_fields_list: List[Fields], start: datetime, end: datetime,
+                            descending: bool = False, with_keys: bool = False) -> pd.DataFrame:
+        keys = list(key_fields_list[0].keys())
+        params: List[Any] = []
+        if len(key_fields_list) == 1 or not keys:
+            cte = ""
+            cond = f"AND {' AND '.join([f'{k} = ?' for k in keys])}" if keys else ""
+            join = ""
+            params.extend([_datetime_to_timestamp(start), _datetime_to_timestamp(end)])
+            params.extend([_python_value_to_sqlite_value(v) for v in key_fields_list[0].values()])
+        else:
+            values = ", ".join([f"({', '.join(['?'] * len(keys))})"] * len(key_fields_list))
+            cte = f"WITH temp_keys({', '.join(keys)}) AS ( VALUES {values} )"
+            cond = ""
+            join = f"JOIN temp_keys USING ({', '.join(keys)})"
+            for kf in key_fields_list:
+                params.extend([_python_value_to_sqlite_value(kf[k]) for k in keys])
+            params.extend([_datetime_to_timestamp(start), _datetime_to_timestamp(end)])
+        order = f"{', '.join(keys)}, date" if with_keys and keys else "date"
+        sql = f"""
+            {cte}
+            SELECT * FROM "{table_name}" {join}
             WHERE date >= ? AND date < ?
             {cond}
-            ORDER BY date DESC;
-        """, (_datetime_to_timestamp(start), _datetime_to_timestamp(end), *[_python_value_to_sqlite_value(v) for v in key_fields.values()]))
-        rows = cur.fetchall()
-        df = pd.DataFrame(rows, columns=rows[0].keys() if rows else [])
-        if not df.empty:
-            return _sqlite_value_to_pandas_value(df, type_dict=self.tables[table_name])
+            ORDER BY {order} {"DESC" if descending else "ASC"};
+        """
+        with DB_READ_SECONDS.time(table=self.table_basename):
+            if self.read_engine == "duckdb":
+                return self.query(sql, tuple(params))
+            cur = self._get_cursor()
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+            return pd.DataFrame(rows, columns=rows[0].keys() if rows else [])
+
+    def _select_blocks(self, table_name: str, key_fields_list: List[Fields], start: datetime, end: datetime,
+                       descending: bool = False, with_keys: bool = False) -> pd.DataFrame:
+        """
+        blocks 模式下读出一组 key 在 [start, end) 内的原始数据行：先取出相交的 block，再批量解码、按时间过滤。
+        """
+        keys = list(key_fields_list[0].keys())
+        start_ts, end_ts = _datetime_to_timestamp(start), _datetime_to_timestamp(end)
+        params: List[Any] = []
+        if len(key_fields_list) == 1 or not keys:
+            cte = ""
+            cond = f"AND {' AND '.join([f'{k} = ?' for k in keys])}" if keys else ""
+            join = ""
+            params.extend([start_ts, end_ts])
+            params.extend([_python_value_to_sqlite_value(v) for v in key_fields_list[0].values()])
         else:
+            values = ", ".join([f"({', '.join(['?'] * len(keys))})"] * len(key_fields_list))
+            cte = f"WITH temp_keys({', '.join(keys)}) AS ( VALUES {values} )"
+            cond = ""
+            join = f"JOIN temp_keys USING ({', '.join(keys)})"
+            for kf in key_fields_list:
+                params.extend([_python_value_to_sqlite_value(kf[k]) for k in keys])
+            params.extend([start_ts, end_ts])
+        sql = f"""
+            {cte}
+            SELECT {''.join([f'{k}, ' for k in keys])}payload FROM "{table_name}" {join}
+            WHERE block_end > ? AND block_start < ?
+            {cond}
+            ORDER BY {''.join([f'{k}, ' for k in keys])}block_start;
+        """
+        with DB_READ_SECONDS.time(table=self.table_basename):
+            cur = self._get_cursor()
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+            df = decode_blocks([r["payload"] for r in rows], keys=[{k: r[k] for k in keys} for r in rows])
+        if df.empty:
             return df
-       
+        df = df[(df["date"] >= start_ts) & (df["date"] < end_ts)]
+        order = keys + ["date"] if with_keys else ["date"]
+        return df.sort_values(order, ascending=not descending, kind="stable").reset_index(drop=True)
 
-    def _insert_data(self, df: pd.DataFrame, key_fields: Fields, common_fields: Fields):
+    def _insert_data(self, df: pd.DataFrame, key_fields: Fields, common_fields: Fields) -> UpsertResult:
         """
-        将 DataFrame 中的数据插入到数据库表中。
+        将 DataFrame 中的数据写入数据库表（UPSERT，只改写内容有变化的行）。
+
+        返回值：
+            UpsertResult，包含新增、修改、未变化的行数；修改行数大于 0 通常说明上游修订了历史数据。
         """
+        if self.storage == "blocks":
+            return self._insert_blocks(df, key_fields=key_fields, common_fields=common_fields)
         table_name = self._get_table_name(common_fields=common_fields)
         if table_name not in self.tables:
             self._create_table_from_df(df, key_fields=key_fields, common_fields=common_fields)
+        key_fields = self._stored_key_fields(table_name, key_fields, create=True)
+        df = df.drop_duplicates(subset=["date"], keep="last")
         for i, k in enumerate(key_fields.keys()):
             df.insert(i, k, _python_value_to_sqlite_value(key_fields[k]))
             if isinstance(key_fields[k], str):
                 df[k] = df[k].astype("string")
         # self._check_df(df, key_fields=key_fields, common_fields=common_fields)
 
-        placeholders = ",".join("?" * len(df.columns))
-        columns = ",".join([f'"{col}"' for col in df.columns])
-
-        sql = f'INSERT OR REPLACE INTO "{table_name}" ({columns}) VALUES ({placeholders});'
+        sql = self._upsert_sql(table_name, columns=list(df.columns), primary_keys=list(key_fields.keys()) + ["date"])
 
         df = _pandas_value_to_sqlite_value(df.copy())
-        data_tuples = []
-        for row in df.itertuples(index=False):
-            data_tuples.append(tuple(x if not pd.isna(x) else None for x in tuple(row)))
+        if df.empty:
+            return UpsertResult()
+        if self.partition == "none":
+            targets = [(table_name, df)]
+        else:
+            targets = [(self._ensure_partition(table_name, self._partition_name(int(p))), part)
+                       for p, part in df.groupby(bucket_start(df["date"].to_numpy(dtype="int64"), self.partition))]
 
+        conn = self._connect()
         cur = self._get_cursor()
-        with self._tx():
-            cur.executemany(sql, data_tuples)
+        existing, changed, total = 0, 0, 0
+        with DB_WRITE_SECONDS.time(table=self.table_basename), self._tx():
+            for target, part in targets:
+                data_tuples = []
+                for row in part.itertuples(index=False):
+                    data_tuples.append(tuple(x if not pd.isna(x) else None for x in tuple(row)))
+                # 先数出本批次中已存在的主键，再用 total_changes 区分新增和修改
+                cond = f"AND {' AND '.join([f'{k} = ?' for k in key_fields.keys()])}" if key_fields else ""
+                cur.execute(f"""
+                    SELECT date FROM "{target}"
+                    WHERE date >= ? AND date <= ? {cond}
+                """, (int(part["date"].min()), int(part["date"].max()), *[_python_value_to_sqlite_value(v) for v in key_fields.values()]))
+                existing += len(set(r[0] for r in cur.fetchall()) & set(part["date"].tolist()))
+                before = conn.total_changes
+                cur.executemany(sql.replace(f'INTO "{table_name}"', f'INTO "{target}"', 1), data_tuples)
+                changed += conn.total_changes - before
+                total += len(data_tuples)
+
+        inserted = total - existing
+        result = UpsertResult(inserted=inserted, updated=changed - inserted, unchanged=existing - (changed - inserted))
+        DB_UPSERTED_ROWS.inc(result.inserted, table=self.table_basename, result="inserted")
+        DB_UPSERTED_ROWS.inc(result.updated, table=self.table_basename, result="updated")
+        DB_UPSERTED_ROWS.inc(result.unchanged, table=self.table_basename, result="unchanged")
+        if result.updated:
+            logger.info(f"[HistoryDB]: 表 {table_name} 中 {key_fields} 有 {result.updated} 行数据被上游修订。")
+        return result
+
+    def _insert_blocks(self, df: pd.DataFrame, key_fields: Fields, common_fields: Fields) -> UpsertResult:
+        """
+        blocks 模式的写入：按 block_period 分桶，与已有 block 合并后重新编码，只改写内容有变化的 block。
+        """
+        table_name = self._get_table_name(common_fields=common_fields)
+        if table_name not in self.tables:
+            self._create_block_table(df, key_fields=key_fields, common_fields=common_fields)
+        key_fields = self._stored_key_fields(table_name, key_fields, create=True)
+        df = _pandas_value_to_sqlite_value(df.drop_duplicates(subset=["date"], keep="last").copy())
+        if df.empty:
+            return UpsertResult()
+        key_values = [_python_value_to_sqlite_value(v) for v in key_fields.values()]
+        cond = f"AND {' AND '.join([f'{k} = ?' for k in key_fields.keys()])}" if key_fields else ""
+        sql = self._upsert_sql(table_name, columns=list(key_fields.keys()) + ["block_start", "block_end", "n", "payload"],
+                               primary_keys=list(key_fields.keys()) + ["block_start"])
+
+        result = UpsertResult()
+        cur = self._get_cursor()
+        with DB_WRITE_SECONDS.time(table=self.table_basename), self._tx():
+            for block_start, part in df.groupby(bucket_start(df["date"].to_numpy(dtype="int64"), self.block_period)):
+                cur.execute(f'SELECT payload FROM "{table_name}" WHERE block_start = ? {cond}', (int(block_start), *key_values))
+                row = cur.fetchone()
+                if row is None:
+                    merged = part
+                    result += UpsertResult(inserted=len(part))
+                else:
+                    old = pd.DataFrame(decode_block(row["payload"])[1])
+                    common = old.merge(part[["date"]], on="date")
+                    new = part.set_index("date").loc[common["date"]]
+                    old_values = common.set_index("date").reindex(columns=new.columns)
+                    same = (old_values.eq(new) | (old_values.isna() & new.isna())).all(axis=1)
+                    block_result = UpsertResult(inserted=len(part) - len(common), updated=int((~same).sum()), unchanged=int(same.sum()))
+                    result += block_result
+                    if not block_result.inserted and not block_result.updated:
+                        continue
+                    merged = pd.concat([old, part], ignore_index=True).drop_duplicates(subset=["date"], keep="last")
+                cur.execute(sql, (*key_values, int(block_start), bucket_end(int(block_start), self.block_period),
+                                  len(merged), encode_block(merged)))
+
+        DB_UPSERTED_ROWS.inc(result.inserted, table=self.table_basename, result="inserted")
+        DB_UPSERTED_ROWS.inc(result.updated, table=self.table_basename, result="updated")
+        DB_UPSERTED_ROWS.inc(result.unchanged, table=self.table_basename, result="unchanged")
+        if result.updated:
+            logger.info(f"[HistoryDB]: 表 {table_name} 中 {key_fields} 有 {result.updated} 行数据被上游修订。")
+        return result
     
     def _check_df(self, df: pd.DataFrame, key_fields: Fields, common_fields: Fields) -> None:
         """
@@ -371,7 +1009,7 @@ class HistoryDB(BaseDB):
         table_name = self._get_table_name(common_fields=common_fields)
 
         assert "date" in data.columns, "DataFrame 必须包含 'date' 列作为主键"
-        cols = set([f'"{k}" {_python_type_to_sqlite_type(type(v).__name__)}' for k, v in key_fields.items()])
+        cols = set([f'"{k}" {self._key_sqlite_type(v)}' for k, v in key_fields.items()])
         for col, dtype in data.dtypes.items():
             sql_type = _pandas_dtype_to_sqlite_type(dtype)
             cols.add(f'"{col}" {sql_type}')
@@ -379,7 +1017,7 @@ class HistoryDB(BaseDB):
 
         col_definitions = ",\n".join(cols)
 
-        sql = f'CREATE TABLE IF NOT EXISTS "{table_name}" (\n{col_definitions},\n PRIMARY KEY ({primary_keys}));'
+        sql = f'CREATE TABLE IF NOT EXISTS "{table_name}" (\n{col_definitions},\n PRIMARY KEY ({primary_keys})){" WITHOUT ROWID" if self.without_rowid else ""};'
 
         logger.debug("Generated SQL:")
         logger.debug(sql)
@@ -389,6 +1027,192 @@ class HistoryDB(BaseDB):
             curr.execute(sql)
             self.tables[table_name] = self._set_table_info(data, common_fields=common_fields)
 
+    def _key_sqlite_type(self, value: Any) -> str:
+        sql_type = _python_type_to_sqlite_type(type(value).__name__)
+        return "INTEGER" if self.dict_encode and sql_type == "TEXT" else sql_type
+
+    def _stored_key_fields(self, table_name: str, key_fields: Fields, create: bool = False) -> Fields:
+        """
+        把 key_fields 转换成数据表中实际存储的值：字典编码的列用 symbol_dict 中的 id 替换字符串（含枚举等以字符串存储的值）。
+
+        create 为 False 时不分配新 id，未登记的字符串映射为 None（查询时匹配不到任何行）。
+        """
+        encoded = self._encoded_key_columns(table_name)
+        if encoded is None:
+            return key_fields  # 表还不存在，无需转换
+        ret: Fields = {}
+        for k, v in key_fields.items():
+            stored = _python_value_to_sqlite_value(v)
+            ret[k] = self._symbol_id(stored, create=create) if k in encoded and isinstance(stored, str) else v  # type: ignore
+        return ret
+
+    def _encoded_key_columns(self, table_name: str) -> Optional[set]:
+        """可能经过字典编码的列（INTEGER 类型）；表不存在时返回 None。"""
+        if table_name not in self._encoded_columns:
+            cur = self._get_cursor()
+            cur.execute(f'PRAGMA table_info("{table_name}");')
+            rows = cur.fetchall()
+            if not rows:
+                return None
+            self._encoded_columns[table_name] = {r["name"] for r in rows if r["type"].upper() == "INTEGER"}
+        return self._encoded_columns[table_name]
+
+    def _decoded_select(self, table_name: str, columns: List[str]) -> str:
+        """SELECT 列表：字典编码的 key 列通过 symbol_dict 还原为字符串，列名不变。"""
+        cur = self._get_cursor()
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'symbol_dict';")
+        encoded = (self._encoded_key_columns(table_name) or set()) - {"date"} if cur.fetchone() else set()
+        return ", ".join([
+            f'COALESCE((SELECT value FROM symbol_dict WHERE id = t."{c}"), t."{c}") AS "{c}"' if c in encoded else f't."{c}"'
+            for c in columns
+        ])
+
+    def _symbol_id(self, value: str, create: bool = False) -> Optional[int]:
+        """
+        查询（必要时登记）字符串在 symbol_dict 中的 id。id 一旦分配不会改变，因此可以在进程内缓存。
+        """
+        if value in self._symbol_ids:
+            return self._symbol_ids[value]
+        cur = self._get_cursor()
+        if create:
+            with self._tx():
+                cur.execute("""
+                CREATE TABLE IF NOT EXISTS symbol_dict (
+                    id    INTEGER PRIMARY KEY AUTOINCREMENT,
+                    value TEXT NOT NULL UNIQUE
+                );
+                """)
+                cur.execute("INSERT OR IGNORE INTO symbol_dict (value) VALUES (?);", (value,))
+        try:
+            cur.execute("SELECT id FROM symbol_dict WHERE value = ?;", (value,))
+        except sqlite3.OperationalError:
+            return None
+        row = cur.fetchone()
+        if row is None:
+            return None
+        self._symbol_ids[value] = row["id"]
+        return row["id"]
+
+    # ------------------- 时间分区 -------------------
+
+    def _partition_name(self, bucket_start_ts: int) -> str:
+        dt = _timestamp_to_datetime(bucket_start_ts).astimezone(timezone.utc)
+        return f"{dt.year:04d}" if self.partition == "year" else f"{dt.year:04d}{dt.month:02d}"
+
+    def _partition_bounds(self, partition: str) -> Tuple[datetime, datetime]:
+        year, month = int(partition[:4]), int(partition[4:6] or 1)
+        start_ts = _datetime_to_timestamp(datetime(year, month, 1, tzinfo=timezone.utc))
+        return _timestamp_to_datetime(start_ts), _timestamp_to_datetime(bucket_end(start_ts, self.partition))
+
+    @staticmethod
+    def _partition_table(table_name: str, partition: str) -> str:
+        return f"{table_name}_p{partition}"
+
+    def _ensure_partition(self, table_name: str, partition: str) -> str:
+        """确保分区表存在，表结构复制自逻辑表（逻辑表本身只作为模板，不存数据）。"""
+        target = self._partition_table(table_name, partition)
+        if target in self.tables:
+            return target
+        cur = self._get_cursor()
+        cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?;", (table_name,))
+        template = cur.fetchone()["sql"]
+        # sqlite_master 中保存的建表语句已去掉 IF NOT EXISTS
+        ddl = template.replace(f'"{table_name}"', f'"{target}"', 1).replace("CREATE TABLE ", "CREATE TABLE IF NOT EXISTS ", 1)
+        cur.execute(ddl)
+        self.tables[target] = True
+        return target
+
+    def list_partitions(self, common_fields: Fields = {}) -> List[str]:
+        """列出某个逻辑表已有的分区名（如 "2024" 或 "202401"），按时间升序。"""
+        table_name = self._get_table_name(common_fields=common_fields)
+        cur = self._get_cursor()
+        cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?;", (f"{table_name}_p[0-9]*",))
+        return sorted(r["name"][len(table_name) + 2:] for r in cur.fetchall())
+
+    def _partitions_between(self, table_name: str, start: datetime, end: datetime) -> List[str]:
+        cur = self._get_cursor()
+        cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?;", (f"{table_name}_p[0-9]*",))
+        existing = sorted(r["name"][len(table_name) + 2:] for r in cur.fetchall())
+        first = self._partition_name(int(bucket_start(np.array([_datetime_to_timestamp(start)]), self.partition)[0]))
+        last = self._partition_name(int(bucket_start(np.array([_datetime_to_timestamp(end) - 1]), self.partition)[0]))
+        return [p for p in existing if first <= p <= last]
+
+    def drop_partition(self, common_fields: Fields, partition: str) -> None:
+        """整体删除一个分区，同时从已缓存区间中扣掉该分区的时间段（之后再查询会重新下载）。"""
+        table_name = self._get_table_name(common_fields=common_fields)
+        target = self._partition_table(table_name, partition)
+        start, end = self._partition_bounds(partition)
+        self._ensure_changelog()
+        with self._tx():
+            self._get_cursor().execute(f'DROP TABLE IF EXISTS "{target}";')
+            self._interval_db.remove_interval(common_fields=common_fields, start=start, end=end)
+            if self.changelog:
+                from .changelog import interval_payload
+                self._journal([("remove_interval", {}, common_fields, interval_payload(start, end))])
+        self.tables.pop(target, None)
+
+    def archive_partition(self, common_fields: Fields, partition: str, archive_path: str) -> None:
+        """
+        把一个分区连同 symbol_dict 复制到单独的归档库文件，再从当前库中删除该分区。
+        """
+        table_name = self._get_table_name(common_fields=common_fields)
+        target = self._partition_table(table_name, partition)
+        cur = self._get_cursor()
+        cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name IN (?, 'symbol_dict', 'DataFrame_infos');", (target,))
+        ddls = [r["sql"] for r in cur.fetchall()]
+        cur.execute("ATTACH DATABASE ? AS archive;", (archive_path,))
+        try:
+            with self._tx():
+                for ddl in ddls:
+                    cur.execute(ddl.replace("CREATE TABLE ", "CREATE TABLE IF NOT EXISTS archive.", 1))
+                cur.execute(f'INSERT OR REPLACE INTO archive."{target}" SELECT * FROM main."{target}";')
+                if any("symbol_dict" in ddl for ddl in ddls):
+                    cur.execute("INSERT OR IGNORE INTO archive.symbol_dict SELECT * FROM main.symbol_dict;")
+                cur.execute("INSERT OR REPLACE INTO archive.DataFrame_infos (table_name, column_name, data_type) "
+                            "SELECT ?, column_name, data_type FROM main.DataFrame_infos WHERE table_name = ?;", (target, table_name))
+        finally:
+            cur.execute("DETACH DATABASE archive;")
+        self.drop_partition(common_fields, partition)
+
+    def compact_partition(self, common_fields: Fields, partition: str) -> None:
+        """按主键顺序重建一个分区，消除反复修订留下的碎片。"""
+        table_name = self._get_table_name(common_fields=common_fields)
+        target = self._partition_table(table_name, partition)
+        tmp = f"{target}__compact"
+        cur = self._get_cursor()
+        cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?;", (target,))
+        row = cur.fetchone()
+        if row is None:
+            return
+        cur.execute(f'PRAGMA table_info("{target}");')
+        primary_keys = ", ".join([f'"{r["name"]}"' for r in sorted([r for r in cur.fetchall() if r["pk"]], key=lambda r: r["pk"])])
+        with self._tx():
+            cur.execute(f'DROP TABLE IF EXISTS "{tmp}";')
+            cur.execute(row["sql"].replace(f'"{target}"', f'"{tmp}"', 1))
+            cur.execute(f'INSERT INTO "{tmp}" SELECT * FROM "{target}" ORDER BY {primary_keys};')
+            cur.execute(f'DROP TABLE "{target}";')
+            cur.execute(f'ALTER TABLE "{tmp}" RENAME TO "{target}";')
+
+    def _create_block_table(self, data: pd.DataFrame, key_fields: Fields, common_fields: Fields) -> None:
+        """
+        创建 blocks 模式的数据表，每行是一个 (key, block_start) 的压缩 block；列类型仍记录在 DataFrame_infos 中。
+        """
+        table_name = self._get_table_name(common_fields=common_fields)
+
+        assert "date" in data.columns, "DataFrame 必须包含 'date' 列作为主键"
+        cols = [f'"{k}" {self._key_sqlite_type(v)}' for k, v in key_fields.items()]
+        primary_keys = ", ".join([f'"{k}"' for k in key_fields.keys()] + ['"block_start"'])
+        col_definitions = ",\n".join(cols + ["block_start INTEGER NOT NULL", "block_end INTEGER NOT NULL",
+                                             "n INTEGER NOT NULL", "payload BLOB NOT NULL"])
+
+        # block 行较大，不适合 WITHOUT ROWID，保持普通表
+        sql = f'CREATE TABLE IF NOT EXISTS "{table_name}" (\n{col_definitions},\n PRIMARY KEY ({primary_keys}));'
+
+        curr = self._get_cursor()
+        with self._tx():
+            curr.execute(sql)
+            self.tables[table_name] = self._set_table_info(data, common_fields=common_fields)
+
     def _set_table_info(self, data: pd.DataFrame, common_fields: Fields) -> Dict[str, str]:
         """
         把 DataFrame 的表结构信息存储起来。
@@ -411,7 +1235,7 @@ class HistoryDB(BaseDB):
             INSERT OR REPLACE INTO DataFrame_infos (table_name, column_name, data_type)
             VALUES (?, ?, ?);
             """, (table_name, col, str(dtype)))
-            if col not in [c["name"] for c in cols]:
+            if self.storage == "rows" and col not in [c["name"] for c in cols]:
                 logger.warning(f"Column '{col}' not found in table '{table_name}' during _set_table_info.")
                 cur.execute(f"""
                 ALTER TABLE {table_name}
@@ -447,6 +1271,13 @@ class CacheConfig:
     start_col: str
     end_col: str
     missing_threshold: int
+    storage: str
+    block_period: str
+    read_only: bool
+    on_miss: str
+    shards: int
+    normalizers: Tuple[Tuple[str, Normalizer], ...]
+    cache_url: str
 
 def history_cache(
     table_basename: str = "",
@@ -457,7 +1288,14 @@ def history_cache(
     date_col: str = "date",
     start_col: str = "start",
     end_col: str = "end",
-    missing_threshold: int = 1
+    missing_threshold: int = 1,
+    storage: str = os.getenv("FINTOOLS_HISTORY_STORAGE", "rows"),
+    block_period: str = os.getenv("FINTOOLS_BLOCK_PERIOD", "day"),
+    read_only: bool = os.getenv("FINTOOLS_DB_READONLY", "0") == "1",
+    on_miss: str = os.getenv("FINTOOLS_ON_MISS", "fail"),
+    shards: int = int(os.getenv("FINTOOLS_DB_SHARDS", "1")),
+    normalizers: Dict[str, Normalizer] = {},
+    cache_url: str = os.getenv("FINTOOLS_CACHE_URL", ""),
 ) -> Callable[[Callable[..., pd.DataFrame]], Callable[..., pd.DataFrame]]:
     """
     - 自动识别参数：bind(*args, **kwargs)
@@ -465,6 +1303,9 @@ def history_cache(
     - except_fields 从 common_fields 里剔除（同时也不参与 hash）
     - 表名：{table_basename}_{sha1(common_fields + func_id)}_{data/ranges}
     - 注册：DB_CONNECTIONS["模块名:BaseDB"] = BaseDB(db_path)
+    - 规范化：调用前按 normalizers 规范化参数（如 symbol 大小写）；以枚举类型注解的参数默认接受成员、值或名字，
+      统一转换为枚举成员，保证同一个逻辑请求总是落在同一张表、同一个 key 下
+    - 共享缓存：cache_url 非空时不在本进程打开数据库，而是把请求交给本机的缓存服务（见 cache_server.py）
     """
     cfg = CacheConfig(
         table_basename=table_basename,
@@ -475,10 +1316,17 @@ def history_cache(
         date_col=date_col,
         start_col=start_col,
         end_col=end_col,
-        missing_threshold=missing_threshold
+        missing_threshold=missing_threshold,
+        storage=storage,
+        block_period=block_period,
+        read_only=read_only,
+        on_miss=on_miss,
+        shards=shards,
+        normalizers=tuple(normalizers.items()),
+        cache_url=cache_url,
     )
 
-    if not cfg.db_path:
+    if not cfg.db_path and not cfg.cache_url:
         return lambda func: func  # 不启用缓存，直接返回原函数
 
     assert date_col == "date", NotImplementedError("暂不支持自定义 date_col")
@@ -487,28 +1335,44 @@ def history_cache(
         # 注册 DB（按 模块名:BaseDB）
         reg_key = f"{func.__module__}:{func.__qualname__}"
         sig = inspect.signature(func)
+        arg_normalizers = {**default_normalizers(sig), **dict(cfg.normalizers)}
 
         table_basename = cfg.table_basename if cfg.table_basename else func.__name__
         if reg_key not in DB_CONNECTIONS:
-            DB_CONNECTIONS[reg_key] = HistoryDB(
+            common_field_names = cfg.common_fields or tuple(
+                k for k in sig.parameters
+                if k not in cfg.key_fields and k not in cfg.except_fields and k not in (cfg.start_col, cfg.end_col, "self")
+            )
+            db_kwargs = dict(
                 table_basename=table_basename,
                 db_path=cfg.db_path,
-                missing_threshold=cfg.missing_threshold
+                missing_threshold=cfg.missing_threshold,
+                storage=cfg.storage,
+                block_period=cfg.block_period,
+                read_only=cfg.read_only,
+                on_miss=cfg.on_miss,
+                registry_key=reg_key,
+                normalizers=arg_normalizers,
+                common_field_names=tuple(k for k in common_field_names if k not in cfg.except_fields),
             )
+            if cfg.cache_url:
+                from .cache_server import RemoteHistoryDB
+                DB_CONNECTIONS[reg_key] = RemoteHistoryDB(table_basename, cfg.cache_url, reg_key)  # type: ignore
+            elif cfg.shards > 1:
+                from .sharded_db import ShardedHistoryDB
+                DB_CONNECTIONS[reg_key] = ShardedHistoryDB(shards=cfg.shards, **db_kwargs)  # type: ignore
+            else:
+                DB_CONNECTIONS[reg_key] = HistoryDB(**db_kwargs)  # type: ignore
 
 
-        @wraps(func)
-        def wrapper(*args, **kwargs) -> pd.DataFrame:
-            bound = sig.bind(*args, **kwargs)
-            bound.apply_defaults()
-            argmap: Dict[str, Any] = dict(bound.arguments)
-
+        def _split_fields(argmap: Dict[str, Any]) -> Tuple[Fields, Fields, datetime, datetime, Callable[..., pd.DataFrame]]:
             # start/end 必须存在（你也可以改成自动找 datetime 参数）
             if cfg.start_col not in argmap or cfg.end_col not in argmap:
                 raise TypeError(f"Decorated function must accept parameters named '{cfg.start_col}' and '{cfg.end_col}'.")
 
             start_dt = parse_datetime(argmap[cfg.start_col])
-            end_dt = parse_datetime(argmap[cfg.end_col])
+            # end 为 None 表示截止到调用时刻（不能用导入时求值的 datetime.now() 作为默认值）
+            end_dt = parse_datetime(argmap[cfg.end_col]) if argmap[cfg.end_col] is not None else datetime.now().astimezone()
             
             if not cfg.common_fields:
                 common_fields = {}
@@ -530,11 +1394,25 @@ def history_cache(
                 func_dec = lambda *args, **fkwargs: func(argmap["self"], *args, **fkwargs)
             else:
                 func_dec = func
+            return common_fields, except_fields, start_dt, end_dt, func_dec
 
+        def _get_db() -> HistoryDB:
+            from .sharded_db import ShardedHistoryDB
+            from .cache_server import RemoteHistoryDB
             db = DB_CONNECTIONS[reg_key]
-            if not isinstance(db, HistoryDB):
-                raise TypeError(f"DB_CONNECTIONS[{reg_key}] 必须是 HistoryDB 类型")
-            return db.history(
+            if not isinstance(db, (HistoryDB, ShardedHistoryDB, RemoteHistoryDB)):
+                raise TypeError(f"DB_CONNECTIONS[{reg_key}] 必须是 HistoryDB、ShardedHistoryDB 或 RemoteHistoryDB 类型")
+            return db  # type: ignore
+
+        @wraps(func)
+        def wrapper(*args, **kwargs) -> pd.DataFrame:
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            argmap: Dict[str, Any] = normalize_arguments(dict(bound.arguments), arg_normalizers)
+
+            common_fields, except_fields, start_dt, end_dt, func_dec = _split_fields(argmap)
+
+            return _get_db().history(
                 key_fields={k: argmap[k] for k in cfg.key_fields},
                 common_fields=common_fields,
                 except_fields=except_fields,
@@ -543,6 +1421,69 @@ def history_cache(
                 callback=func_dec
             )
 
+        def many(*args, batch: Optional[Callable[..., pd.DataFrame]] = None, **kwargs) -> pd.DataFrame:
+            """
+            与被装饰函数参数相同，但 key_fields 可以传入列表（标量会被广播），
+            一次返回所有 key 的长表数据，带 key 列。
+
+            batch 为数据源的批量下载函数（见 HistoryDB.history_many 的 batch_callback），缺失的区间尽量合并下载。
+            返回的 key 列沿用调用方传入的写法（如小写的 symbol），规范化只用于缓存键。
+            """
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            argmap: Dict[str, Any] = normalize_arguments(dict(bound.arguments), arg_normalizers)
+
+            key_values = {k: argmap[k] if isinstance(argmap[k], (list, tuple)) else None for k in cfg.key_fields}
+            n = max([len(v) for v in key_values.values() if v is not None], default=1)
+            key_fields_list: List[Fields] = []
+            for i in range(n):
+                key_fields_list.append({k: (v[i] if v is not None else argmap[k]) for k, v in key_values.items()})
+
+            common_fields, except_fields, start_dt, end_dt, func_dec = _split_fields(argmap)
+
+            df = _get_db().history_many(
+                key_fields_list=key_fields_list,
+                common_fields=common_fields,
+                except_fields=except_fields,
+                start=start_dt,
+                end=end_dt,
+                callback=func_dec,
+                batch_callback=batch
+            )
+            # 把规范化后的 key 映射回调用方的写法，调用方可以直接用自己的列表按列对齐
+            for k, values in key_values.items():
+                if values is None or k not in df.columns:
+                    continue
+                spelling: Dict[Any, Any] = {}
+                for raw, norm in zip(bound.arguments[k], values):
+                    if raw != norm:
+                        spelling.setdefault(norm, raw)
+                if spelling:
+                    df[k] = df[k].map(lambda v: spelling.get(v, v))
+            return df
+
+        def iter_chunks(*args, chunk_rows: int = 100_000, **kwargs) -> Iterator[pd.DataFrame]:
+            """
+            与被装饰函数参数相同，按时间升序分块返回数据，每块最多 chunk_rows 行（见 HistoryDB.iter_history）。
+            """
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            argmap: Dict[str, Any] = normalize_arguments(dict(bound.arguments), arg_normalizers)
+
+            common_fields, except_fields, start_dt, end_dt, func_dec = _split_fields(argmap)
+
+            return _get_db().iter_history(
+                key_fields={k: argmap[k] for k in cfg.key_fields},
+                common_fields=common_fields,
+                except_fields=except_fields,
+                start=start_dt,
+                end=end_dt,
+                callback=func_dec,
+                chunk_rows=chunk_rows
+            )
+
+        setattr(wrapper, "many", many)
+        setattr(wrapper, "iter_chunks", iter_chunks)
         return wrapper
 
     return deco
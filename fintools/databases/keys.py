@@ -0,0 +1,78 @@
+"""
+缓存键的规范化。
+
+同一个逻辑请求可能以不同形式传入（枚举成员 / 枚举值 / 枚举名、大小写不同的 symbol），
+在计算表名和写入 key 列之前先统一成规范形式，避免同一份数据落在不同的表或 key 下。
+
+表名仍按 str(公共字段) 计算哈希，已有的表名保持不变；时间类型的 key 列以时间戳存储，本身与时区无关。
+"""
+import inspect
+from enum import Enum
+from typing import Any, Callable, Dict, List, Type
+
+Normalizer = Callable[[Any], Any]
+
+
+def enum_normalizer(enum_cls: Type[Enum]) -> Normalizer:
+    """
+    把枚举成员、枚举值（"daily"）、枚举名（"DAILY"）以及 str(成员)（"DataFrequency.DAILY"）统一成枚举成员。
+    """
+    def normalize(value: Any) -> Any:
+        if isinstance(value, enum_cls):
+            return value
+        if isinstance(value, str):
+            s = value.strip()
+            if s.startswith(enum_cls.__name__ + "."):
+                s = s[len(enum_cls.__name__) + 1:]
+            for member in enum_cls:
+                if s == member.name or s.upper() == member.name or s.lower() == str(member.value).lower():
+                    return member
+        try:
+            return enum_cls(value)
+        except ValueError:
+            raise ValueError(f"无法把 {value!r} 转换为 {enum_cls.__name__}")
+    setattr(normalize, "enum_cls", enum_cls)
+    return normalize
+
+
+def upper_symbol(value: Any) -> Any:
+    return value.strip().upper() if isinstance(value, str) else value
+
+
+def lower_symbol(value: Any) -> Any:
+    return value.strip().lower() if isinstance(value, str) else value
+
+
+def strip_symbol(value: Any) -> Any:
+    return value.strip() if isinstance(value, str) else value
+
+
+def enum_variants(member: Enum) -> List[Any]:
+    """一个枚举成员在旧缓存中可能出现的各种写法。"""
+    return [member, member.value, member.name]
+
+
+def default_normalizers(sig: inspect.Signature) -> Dict[str, Normalizer]:
+    """按函数签名的类型注解，为枚举类型的参数自动生成规范化函数。"""
+    ret: Dict[str, Normalizer] = {}
+    for name, param in sig.parameters.items():
+        # 字符串形式的注解（from __future__ import annotations）不做解析
+        if isinstance(param.annotation, type) and issubclass(param.annotation, Enum):
+            ret[name] = enum_normalizer(param.annotation)
+    return ret
+
+
+def normalize_arguments(argmap: Dict[str, Any], normalizers: Dict[str, Normalizer]) -> Dict[str, Any]:
+    """就地规范化参数；列表类型的参数（如 many 中的 symbol 列表）逐个元素规范化。"""
+    for name, fn in normalizers.items():
+        value = argmap.get(name)
+        if value is None:
+            continue
+        argmap[name] = [fn(v) for v in value] if isinstance(value, (list, tuple)) else fn(value)
+    return argmap
+
+
+__all__ = [
+    "Normalizer", "enum_normalizer", "upper_symbol", "lower_symbol", "strip_symbol",
+    "enum_variants", "default_normalizers", "normalize_arguments",
+]
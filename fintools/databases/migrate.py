@@ -0,0 +1,291 @@
+import os
+import sqlite3
+import argparse
+import importlib
+import pkgutil
+from itertools import product
+from typing import Any, List, Optional
+
+import pandas as pd
+
+from . import Fields, DB_CONNECTIONS
+from .keys import enum_variants, normalize_arguments
+from .utils import _python_value_to_sqlite_value, _sqlite_value_to_pandas_value
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    return conn
+
+
+def _data_tables(conn: sqlite3.Connection) -> List[str]:
+    """
+    列出 HistoryDB 的行存数据表（在 DataFrame_infos 中登记过、主键包含 date 列的表），
+    以及这些表按时间分区后的分区表（{表名}_pYYYY[MM]，表结构与逻辑表相同，但不在 DataFrame_infos 中登记）。
+    """
+    try:
+        names = [r[0] for r in conn.execute("SELECT DISTINCT table_name FROM DataFrame_infos;").fetchall()]
+    except sqlite3.OperationalError:
+        return []
+    tables = []
+    for name in names:
+        info = conn.execute(f'PRAGMA table_info("{name}");').fetchall()
+        if any(r[1] == "date" and r[5] for r in info):
+            tables.append(name)
+            partitions = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?;", (f"{name}_p[0-9]*",)).fetchall()
+            tables.extend(sorted(r[0] for r in partitions))
+    return list(dict.fromkeys(tables))
+
+
+def is_without_rowid(conn: sqlite3.Connection, table_name: str) -> bool:
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?;", (table_name,)).fetchone()
+    return row is not None and "WITHOUT ROWID" in row[0].upper()
+
+
+def rebuild_without_rowid(conn: sqlite3.Connection, table_name: str) -> None:
+    """
+    把一张表重建为 WITHOUT ROWID 表，列、类型和主键保持不变。
+
+    整个重建在一个事务中完成：其他进程在 WAL 模式下可以继续读旧表，写入会等待这张表重建完成。
+    """
+    info = conn.execute(f'PRAGMA table_info("{table_name}");').fetchall()
+    cols = [f'"{r[1]}" {r[2]}' for r in info]
+    primary_keys = ", ".join([f'"{r[1]}"' for r in sorted([r for r in info if r[5]], key=lambda r: r[5])])
+    col_names = ", ".join([f'"{r[1]}"' for r in info])
+    tmp = f"{table_name}__migrate"
+    conn.execute("BEGIN IMMEDIATE;")
+    try:
+        conn.execute(f'DROP TABLE IF EXISTS "{tmp}";')
+        conn.execute(f'CREATE TABLE "{tmp}" (\n{",".join(cols)},\n PRIMARY KEY ({primary_keys})) WITHOUT ROWID;')
+        conn.execute(f'INSERT INTO "{tmp}" ({col_names}) SELECT {col_names} FROM "{table_name}" ORDER BY {primary_keys};')
+        conn.execute(f'DROP TABLE "{table_name}";')
+        conn.execute(f'ALTER TABLE "{tmp}" RENAME TO "{table_name}";')
+        conn.execute("COMMIT;")
+    except Exception:
+        conn.execute("ROLLBACK;")
+        raise
+
+
+def migrate_without_rowid(db_path: str, tables: Optional[List[str]] = None, vacuum: bool = False) -> List[str]:
+    """
+    逐表把已有的 HistoryDB 数据表迁移为 WITHOUT ROWID 聚簇存储，返回实际迁移了的表名。
+
+    每张表单独一个事务，迁移过程中缓存可以继续使用；已经是 WITHOUT ROWID 的表会被跳过。
+    """
+    conn = _connect(db_path)
+    migrated = []
+    try:
+        for table_name in (tables or _data_tables(conn)):
+            if is_without_rowid(conn, table_name):
+                continue
+            logger.info(f"[migrate]: 重建表 {table_name} 为 WITHOUT ROWID")
+            rebuild_without_rowid(conn, table_name)
+            migrated.append(table_name)
+        if vacuum and migrated:
+            conn.execute("VACUUM;")
+    finally:
+        conn.close()
+    return migrated
+
+
+def _table_exists(db: Any, table_name: str) -> bool:
+    cur = db._get_cursor()
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;", (table_name,))
+    return cur.fetchone() is not None
+
+
+def _physical_tables(db: Any, table_name: str) -> List[str]:
+    """逻辑表实际存放数据的表：未分区时是它本身，分区时是各个分区表（逻辑表只作为模板）。"""
+    if db.partition == "none":
+        return [table_name] if _table_exists(db, table_name) else []
+    cur = db._get_cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?;", (f"{table_name}_p[0-9]*",))
+    return sorted(r["name"] for r in cur.fetchall())
+
+
+def _cached_keys(db: Any, common_fields: Fields) -> List[Fields]:
+    """列出某张表中有缓存区间的全部 key（区间表中保存的是未编码的原始值）。"""
+    table_name = db._interval_db._get_table_name(common_fields=common_fields)
+    if not _table_exists(db, table_name):
+        return []
+    cur = db._get_cursor()
+    cur.execute(f'PRAGMA table_info("{table_name}");')
+    cols = [r["name"] for r in cur.fetchall() if r["name"] not in ("id", "start_ts", "end_ts")]
+    if not cols:
+        return [{}]
+    cur.execute(f'SELECT DISTINCT {", ".join(cols)} FROM "{table_name}";')
+    return [dict(zip(cols, tuple(r))) for r in cur.fetchall()]
+
+
+def merge_cache_key(db: Any, src_common: Fields, src_key: Fields, dst_common: Fields, dst_key: Fields) -> int:
+    """
+    把 (src_common, src_key) 下的数据和已缓存区间并入 (dst_common, dst_key)，再删除源数据，返回并入的行数。
+
+    目标中已有的行保持不动，只补入目标中没有的日期；仅支持 rows 存储方式，分区表逐个处理。
+    """
+    assert db.storage == "rows", "只支持 rows 存储方式"
+    src_table = db._get_table_name(common_fields=src_common)
+    dst_table = db._get_table_name(common_fields=dst_common)
+    cur = db._get_cursor()
+    moved = 0
+    type_dict = db._get_table_info(common_fields=src_common)
+    src_stored = db._stored_key_fields(src_table, src_key)
+    src_cond = " AND ".join([f"{k} = ?" for k in src_stored.keys()]) or "1"
+    src_params = tuple(_python_value_to_sqlite_value(v) for v in src_stored.values())
+
+    src_tables = _physical_tables(db, src_table)
+    if type_dict and src_tables:
+        rows = []
+        for table in src_tables:
+            cur.execute(f'SELECT * FROM "{table}" WHERE {src_cond};', src_params)
+            rows.extend(dict(r) for r in cur.fetchall())
+        df = pd.DataFrame(rows)
+        dst_tables = _physical_tables(db, dst_table)
+        if not df.empty and dst_tables:
+            dst_stored = db._stored_key_fields(dst_table, dst_key)
+            dst_cond = " AND ".join([f"{k} = ?" for k in dst_stored.keys()]) or "1"
+            dst_dates = set()
+            for table in dst_tables:
+                cur.execute(f'SELECT date FROM "{table}" WHERE {dst_cond};',
+                            tuple(_python_value_to_sqlite_value(v) for v in dst_stored.values()))
+                dst_dates.update(r[0] for r in cur.fetchall())
+            df = df[~df["date"].isin(dst_dates)]
+        if not df.empty:
+            df = _sqlite_value_to_pandas_value(df.drop(columns=list(src_stored.keys())), type_dict=type_dict)
+            moved = db._insert_data(df, key_fields=dst_key, common_fields=dst_common).inserted
+
+    for start, end in db._interval_db.get_all(key_fields=src_key, common_fields=src_common):
+        db._interval_db.add_interval(key_fields=dst_key, common_fields=dst_common, start=start, end=end)
+
+    interval_table = db._interval_db._get_table_name(common_fields=src_common)
+    interval_cond = " AND ".join([f"{k} = ?" for k in src_key.keys()]) or "1"
+    with db._tx():
+        for table in src_tables:
+            cur.execute(f'DELETE FROM "{table}" WHERE {src_cond};', src_params)
+        cur.execute(f'DELETE FROM "{interval_table}" WHERE {interval_cond};',
+                    tuple(_python_value_to_sqlite_value(v) for v in src_key.values()))
+    return moved
+
+
+def _drop_if_empty(db: Any, common_fields: Fields) -> bool:
+    table_name = db._get_table_name(common_fields=common_fields)
+    interval_table = db._interval_db._get_table_name(common_fields=common_fields)
+    partitions = _physical_tables(db, table_name) if db.partition != "none" else []
+    cur = db._get_cursor()
+    for name in [table_name, interval_table] + partitions:
+        if _table_exists(db, name):
+            cur.execute(f'SELECT 1 FROM "{name}" LIMIT 1;')
+            if cur.fetchone() is not None:
+                return False
+    with db._tx():
+        for name in partitions:
+            cur.execute(f'DROP TABLE IF EXISTS "{name}";')
+        cur.execute(f'DROP TABLE IF EXISTS "{table_name}";')
+        cur.execute(f'DROP TABLE IF EXISTS "{interval_table}";')
+        if _table_exists(db, "DataFrame_infos"):
+            cur.execute("DELETE FROM DataFrame_infos WHERE table_name = ?;", (table_name,))
+    for name in partitions:
+        db.tables.pop(name, None)
+    db.tables.pop(table_name, None)
+    db._encoded_columns.pop(table_name, None)
+    db._interval_db.tables.pop(interval_table, None)
+    return True
+
+
+def canonicalize_history_db(db: Any) -> int:
+    """
+    按 db.normalizers 合并历史上因参数写法不同而分叉的表和 key，返回合并的 key 数量。
+
+    - 表：公共字段全部是枚举时，枚举出每个成员的各种旧写法（成员 / 值 / 名字）对应的表，并入规范表；
+    - key：规范表中规范化后与原值不同的 key（如大小写不同的 symbol）并入规范 key。
+    公共字段中有非枚举类型时无法枚举出旧表名，只做 key 级别的合并（无公共字段的表同样适用）。
+    """
+    if hasattr(db, "shards"):
+        return sum(canonicalize_history_db(shard) for shard in db.shards)
+    names = db.common_field_names
+    fns = [db.normalizers.get(k) for k in names]
+    if not all(getattr(fn, "enum_cls", None) for fn in fns):
+        logger.warning(f"[migrate]: {db.table_basename} 的公共字段 {names} 不全是枚举，跳过")
+        return 0
+
+    merged = 0
+    for members in product(*[list(fn.enum_cls) for fn in fns]):  # type: ignore
+        dst_common = dict(zip(names, members))
+        dst_table = db._get_table_name(common_fields=dst_common)
+        for variant in product(*[enum_variants(m) for m in members]):
+            src_common = dict(zip(names, variant))
+            if db._get_table_name(common_fields=src_common) == dst_table:
+                continue
+            keys = _cached_keys(db, src_common)
+            for key in keys:
+                dst_key = normalize_arguments(dict(key), db.normalizers)
+                logger.info(f"[migrate]: {db._get_table_name(common_fields=src_common)} {key} -> {dst_table} {dst_key}")
+                merge_cache_key(db, src_common, key, dst_common, dst_key)
+                merged += 1
+            if keys:
+                _drop_if_empty(db, src_common)
+
+        for key in _cached_keys(db, dst_common):
+            dst_key = normalize_arguments(dict(key), db.normalizers)
+            if all(_python_value_to_sqlite_value(dst_key[k]) == key[k] for k in key):
+                continue
+            logger.info(f"[migrate]: {dst_table} {key} -> {dst_key}")
+            merge_cache_key(db, dst_common, key, dst_common, dst_key)
+            merged += 1
+    return merged
+
+
+def _register_data_sources(db_path: str) -> None:
+    """导入全部数据源模块，使其中的 history_cache 装饰器在 DB_CONNECTIONS 中登记（缺少依赖的模块跳过）。"""
+    os.environ["FINTOOLS_DB"] = db_path  # 装饰器在导入时读取 FINTOOLS_DB
+    import fintools.data_sources as data_sources
+    for info in pkgutil.walk_packages(data_sources.__path__, prefix=data_sources.__name__ + "."):
+        try:
+            importlib.import_module(info.name)
+        except Exception as e:
+            logger.warning(f"[migrate]: 跳过 {info.name}：{e}")
+
+
+def migrate_canonical_keys(db_path: str) -> int:
+    from .history_db import HistoryDB
+    from .sharded_db import ShardedHistoryDB
+    _register_data_sources(db_path)
+    merged = 0
+    for reg_key, db in list(DB_CONNECTIONS.items()):
+        if isinstance(db, (HistoryDB, ShardedHistoryDB)) and db.db_path == db_path:
+            merged += canonicalize_history_db(db)
+    return merged
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m fintools.databases.migrate", description="HistoryDB 缓存库迁移工具")
+    parser.add_argument("--db", default=os.getenv("FINTOOLS_DB", "history.db"), help="缓存数据库路径")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("without-rowid", help="把已有数据表逐表重建为 WITHOUT ROWID")
+    p.add_argument("--table", action="append", help="只迁移指定的表，可重复")
+    p.add_argument("--vacuum", action="store_true", help="迁移完成后 VACUUM 回收空间")
+
+    sub.add_parser("canonical-keys", help="合并因 symbol 大小写、枚举写法不同而分叉的表和 key")
+
+    args = parser.parse_args(argv)
+    if args.command == "without-rowid":
+        migrated = migrate_without_rowid(args.db, tables=args.table, vacuum=args.vacuum)
+        print(f"migrated {len(migrated)} table(s)")
+    elif args.command == "canonical-keys":
+        print(f"merged {migrate_canonical_keys(args.db)} key(s)")
+
+
+__all__ = [
+    "migrate_without_rowid", "rebuild_without_rowid", "is_without_rowid",
+    "merge_cache_key", "canonicalize_history_db", "migrate_canonical_keys",
+]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
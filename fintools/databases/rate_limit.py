@@ -0,0 +1,227 @@
+"""
+上游 API 的令牌桶限流。
+
+各数据源的配额在 RATE_LIMITS 中按 `数据源` 或 `数据源:接口` 声明，可用环境变量 FINTOOLS_RATE_LIMITS 覆盖，例如：
+
+    FINTOOLS_RATE_LIMITS="tushare=200/60,tushare:stk_mins=2/60,alphavantage=5/60+25/86400"
+
+`次数/秒数` 表示每个时间窗口内最多请求的次数，多个限制用 + 连接，须同时满足。
+调用 `数据源:接口` 时，接口自己的限制和数据源整体的限制都要拿到令牌。
+
+令牌桶的状态保存在 FINTOOLS_RATE_LIMIT_DB 指定的 SQLite 文件中，同一台机器上的多个 MCP 服务进程共用同一份配额；
+为空时只在本进程内（跨线程）限流。拿不到令牌时调用方先预定令牌再按顺序等待，而不是请求失败后交给 RetryProxy 重试。
+"""
+import os
+import time
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar, cast
+from functools import wraps
+
+import wrapt
+
+from .base import BaseDB, Fields
+from fintools.utils.metrics import RATE_LIMIT_WAIT_SECONDS
+
+import logging
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """每 per 秒最多 count 次请求；burst 为桶容量（允许的突发请求数），默认等于 count。"""
+    count: float
+    per: float
+    burst: Optional[float] = None
+
+    @property
+    def rate(self) -> float:
+        return self.count / self.per
+
+    @property
+    def capacity(self) -> float:
+        return self.burst if self.burst is not None else self.count
+
+
+# 默认配额按各服务免费档的公开限制保守设置
+RATE_LIMITS: Dict[str, List[RateLimit]] = {
+    "tushare": [RateLimit(200, 60)],
+    "alphavantage": [RateLimit(5, 60), RateLimit(25, 86400)],
+    "jina": [RateLimit(100, 60)],
+    "eastmoney": [RateLimit(60, 60, burst=10)],
+}
+
+
+def parse_rate_limits(text: str) -> Dict[str, List[RateLimit]]:
+    """解析 "name=count/per+count/per,name2=count/per" 格式的配额声明。"""
+    limits: Dict[str, List[RateLimit]] = {}
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, spec = item.partition("=")
+        assert spec, f"无法解析限流配置：{item}"
+        parsed = []
+        for part in spec.split("+"):
+            count, _, per = part.strip().partition("/")
+            parsed.append(RateLimit(float(count), float(per or 1)))
+        limits[name.strip()] = parsed
+    return limits
+
+RATE_LIMITS.update(parse_rate_limits(os.getenv("FINTOOLS_RATE_LIMITS", "")))
+
+
+class RateLimitTimeout(TimeoutError):
+    """需要等待的时间超过了 timeout，本次请求没有预定令牌。"""
+
+
+class RateLimiter(BaseDB):
+    """
+    多个令牌桶的集合，桶名为 `数据源:接口#序号`。
+
+    acquire 在一个 BEGIN IMMEDIATE 事务中补充令牌并预定本次请求需要的令牌，令牌数可以为负，
+    负数部分就是排在前面的请求已经预定的配额；调用方按预定时计算出的时间等待，因此先到的请求先拿到令牌。
+    """
+    def __init__(self, db_path: str = os.getenv("FINTOOLS_RATE_LIMIT_DB", "rate_limits.db"),
+                 limits: Optional[Dict[str, List[RateLimit]]] = None,
+                 timeout: float = float(os.getenv("FINTOOLS_RATE_LIMIT_TIMEOUT", "300"))):
+        """
+        参数：
+            db_path: 保存令牌桶状态的 SQLite 文件，多个进程共用；为空时只在本进程内限流
+            limits: 配额声明，默认使用模块级的 RATE_LIMITS（之后对 RATE_LIMITS 的修改同样生效）
+            timeout: 需要等待的时间超过该秒数时抛出 RateLimitTimeout
+        """
+        self.db_path = db_path
+        self.table_basename = "rate_limits"
+        self.tables = {}
+        self.limits = limits if limits is not None else RATE_LIMITS
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._memory: Dict[str, Tuple[float, float]] = {}
+
+    def _init_schema(self) -> None:
+        cur = self._get_cursor()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS rate_limits(
+            bucket      TEXT PRIMARY KEY,
+            tokens      REAL NOT NULL,
+            updated_at  REAL NOT NULL
+        );
+        """)
+        self._connect().commit()
+        self.tables[self.table_basename] = True
+
+    def buckets(self, source: str, endpoint: Optional[str] = None) -> List[Tuple[str, RateLimit]]:
+        """本次请求需要拿令牌的桶：数据源整体的限制，以及（如果声明了）接口自己的限制。"""
+        names = [source] + ([f"{source}:{endpoint}"] if endpoint else [])
+        return [(f"{name}#{i}", limit) for name in names for i, limit in enumerate(self.limits.get(name, []))]
+
+    def acquire(self, source: str, endpoint: Optional[str] = None, tokens: float = 1, timeout: Optional[float] = None) -> float:
+        """
+        预定 tokens 个令牌并等待到可以发出请求，返回等待的秒数。没有声明配额的数据源直接返回 0。
+        """
+        buckets = self.buckets(source, endpoint)
+        if not buckets:
+            return 0.0
+        timeout = self.timeout if timeout is None else timeout
+        wait = self._reserve(buckets, tokens, timeout)
+        RATE_LIMIT_WAIT_SECONDS.observe(wait, source=source)
+        if wait > 0:
+            logger.debug(f"[RateLimiter]: {source}{':' + endpoint if endpoint else ''} 超出配额，等待 {wait:.2f} 秒。")
+            time.sleep(wait)
+        return wait
+
+    def _reserve(self, buckets: List[Tuple[str, RateLimit]], tokens: float, timeout: float) -> float:
+        if not self.db_path:
+            with self._lock:
+                return self._take(buckets, tokens, timeout, self._memory.get, self._memory.__setitem__)
+        if self.table_basename not in self.tables:
+            self._init_schema()
+        cur = self._get_cursor()
+
+        def load(bucket: str) -> Optional[Tuple[float, float]]:
+            cur.execute("SELECT tokens, updated_at FROM rate_limits WHERE bucket = ?", (bucket,))
+            row = cur.fetchone()
+            return (row["tokens"], row["updated_at"]) if row is not None else None
+
+        def store(bucket: str, state: Tuple[float, float]) -> None:
+            cur.execute("INSERT OR REPLACE INTO rate_limits(bucket, tokens, updated_at) VALUES (?, ?, ?)", (bucket, *state))
+
+        with self._tx():
+            return self._take(buckets, tokens, timeout, load, store)
+
+    @staticmethod
+    def _take(buckets: List[Tuple[str, RateLimit]], tokens: float, timeout: float,
+              load: Callable[[str], Optional[Tuple[float, float]]], store: Callable[[str, Tuple[float, float]], None]) -> float:
+        now = time.time()
+        levels = []
+        for bucket, limit in buckets:
+            state = load(bucket)
+            level = limit.capacity if state is None else min(limit.capacity, state[0] + (now - state[1]) * limit.rate)
+            levels.append(level)
+        wait = max(max(0.0, (tokens - level) / limit.rate) for level, (_, limit) in zip(levels, buckets))
+        if wait > timeout:
+            raise RateLimitTimeout(f"等待 {[b for b, _ in buckets]} 的令牌需要 {wait:.1f} 秒，超过了 {timeout} 秒")
+        for level, (bucket, _) in zip(levels, buckets):
+            store(bucket, (level - tokens, now))
+        return wait
+
+    def _set_table_info(self, data: Any, common_fields: Fields) -> bool:
+        return self._get_table_info(common_fields=common_fields)
+
+    def _get_table_info(self, common_fields: Fields) -> bool:
+        return bool(self.tables.get(self.table_basename))
+
+
+_LIMITER: Optional[RateLimiter] = None
+
+def get_rate_limiter() -> RateLimiter:
+    """进程内共用的 RateLimiter。"""
+    global _LIMITER
+    if _LIMITER is None:
+        _LIMITER = RateLimiter()
+    return _LIMITER
+
+
+def acquire(source: str, endpoint: Optional[str] = None, tokens: float = 1) -> float:
+    return get_rate_limiter().acquire(source, endpoint, tokens)
+
+
+def rate_limited(source: str, endpoint: Optional[str] = None) -> Callable[[F], F]:
+    """装饰器：每次调用前先拿到 source（和 endpoint）的令牌。"""
+    def deco(func: F) -> F:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            acquire(source, endpoint)
+            return func(*args, **kwargs)
+        return cast(F, wrapper)
+    return deco
+
+
+class RateLimitProxy(wrapt.ObjectProxy):
+    """
+    SDK 客户端的代理：调用客户端的任意方法前，以方法名作为接口名拿令牌。
+
+    例如 RateLimitProxy(ts.pro_api(token), "tushare").daily(...) 会使用 tushare 和 tushare:daily 的配额。
+    """
+    def __init__(self, wrapped: Any, source: str):
+        super().__init__(wrapped)
+        self._self_source = source
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.__wrapped__, name)
+        if callable(attr) and not name.startswith("_"):
+            source = self._self_source
+
+            @wraps(attr)
+            def call(*args, **kwargs):
+                acquire(source, name)
+                return attr(*args, **kwargs)
+            return call
+        return attr
+
+
+__all__ = ["RateLimit", "RATE_LIMITS", "RateLimiter", "RateLimitTimeout", "RateLimitProxy",
+           "parse_rate_limits", "get_rate_limiter", "acquire", "rate_limited"]
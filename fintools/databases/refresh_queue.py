@@ -0,0 +1,167 @@
+import json
+import os
+import time
+import importlib
+from enum import Enum
+from datetime import date, datetime
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from .base import BaseDB, Fields
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _encode_arg(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return {"__enum__": f"{type(value).__module__}:{type(value).__qualname__}", "name": value.name}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    raise TypeError(f"无法序列化参数：{value!r}")
+
+
+def _decode_arg(obj: Dict[str, Any]) -> Any:
+    if "__enum__" in obj:
+        module, qualname = obj["__enum__"].split(":")
+        cls: Any = importlib.import_module(module)
+        for part in qualname.split("."):
+            cls = getattr(cls, part)
+        return cls[obj["name"]]
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"])
+    return obj
+
+
+def dumps_arguments(arguments: Dict[str, Any]) -> str:
+    return json.dumps(arguments, default=_encode_arg, sort_keys=True, ensure_ascii=False)
+
+
+def loads_arguments(text: str) -> Dict[str, Any]:
+    return json.loads(text, object_hook=_decode_arg)
+
+
+_INSTANCES: Dict[type, Any] = {}
+
+def resolve_registry_key(registry_key: str) -> Callable[..., Any]:
+    """
+    把 DB_CONNECTIONS 中的注册名（"模块名:qualname"）解析回被缓存装饰的函数。
+
+    qualname 指向类方法时，用无参构造的类实例调用（同一个类只构造一次）。
+    """
+    module, qualname = registry_key.split(":")
+    parent: Any = None
+    obj: Any = importlib.import_module(module)
+    for part in qualname.split("."):
+        parent, obj = obj, getattr(obj, part)
+    if isinstance(parent, type):
+        if parent not in _INSTANCES:
+            _INSTANCES[parent] = parent()
+        return getattr(_INSTANCES[parent], qualname.split(".")[-1])
+    return obj
+
+
+@dataclass(frozen=True)
+class RefreshRequest:
+    id: int
+    registry_key: str
+    arguments: Dict[str, Any]
+    created_at: float
+
+
+class RefreshQueue(BaseDB):
+    """
+    只读服务进程与刷新任务之间的请求队列，单独存放在一个可写的 SQLite 文件中。
+
+    服务进程遇到缓存缺失时 put 一条请求（相同的待处理请求只保留一条），
+    刷新任务以读写方式打开缓存，调用 drain 逐条执行被缓存装饰的函数来补齐数据。
+    """
+    def __init__(self, db_path: str = os.getenv("FINTOOLS_REFRESH_QUEUE", "refresh_queue.db")):
+        self.db_path = db_path
+        self.table_basename = "refresh_requests"
+        self.tables = {}
+
+    def _init_schema(self) -> None:
+        cur = self._get_cursor()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS refresh_requests(
+            id            INTEGER PRIMARY KEY AUTOINCREMENT,
+            registry_key  TEXT NOT NULL,
+            arguments     TEXT NOT NULL,
+            status        TEXT NOT NULL DEFAULT 'pending',  -- pending / done / failed
+            error         TEXT,
+            created_at    REAL NOT NULL,
+            finished_at   REAL
+        );
+        """)
+        cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_refresh_pending
+        ON refresh_requests(registry_key, arguments) WHERE status = 'pending';
+        """)
+        self._connect().commit()
+        self.tables[self.table_basename] = True
+
+    def put(self, registry_key: str, arguments: Dict[str, Any]) -> None:
+        """登记一次刷新请求，arguments 为调用被装饰函数时使用的关键字参数。"""
+        if self.table_basename not in self.tables:
+            self._init_schema()
+        with self._tx():
+            self._get_cursor().execute("""
+                INSERT OR IGNORE INTO refresh_requests(registry_key, arguments, created_at)
+                VALUES (?, ?, ?)
+            """, (registry_key, dumps_arguments(arguments), time.time()))
+
+    def pending(self, limit: Optional[int] = None) -> List[RefreshRequest]:
+        if self.table_basename not in self.tables:
+            self._init_schema()
+        cur = self._get_cursor()
+        cur.execute(f"""
+            SELECT id, registry_key, arguments, created_at FROM refresh_requests
+            WHERE status = 'pending' ORDER BY id {f'LIMIT {int(limit)}' if limit else ''}
+        """)
+        return [RefreshRequest(r["id"], r["registry_key"], loads_arguments(r["arguments"]), r["created_at"]) for r in cur.fetchall()]
+
+    def drain(self, resolver: Callable[[str], Callable[..., Any]] = resolve_registry_key, limit: Optional[int] = None) -> int:
+        """
+        执行所有待处理的请求，返回成功的条数。失败的请求标记为 failed 并记录错误信息。
+        """
+        done = 0
+        for req in self.pending(limit=limit):
+            try:
+                resolver(req.registry_key)(**req.arguments)
+                status, error = "done", None
+                done += 1
+            except Exception as e:
+                logger.error(f"[RefreshQueue]: 刷新 {req.registry_key} {req.arguments} 失败：{e}")
+                status, error = "failed", repr(e)
+            with self._tx():
+                self._get_cursor().execute("""
+                    UPDATE refresh_requests SET status = ?, error = ?, finished_at = ? WHERE id = ?
+                """, (status, error, time.time(), req.id))
+        return done
+
+    def _set_table_info(self, data: Any, common_fields: Fields) -> bool:
+        return self._get_table_info(common_fields=common_fields)
+
+    def _get_table_info(self, common_fields: Fields) -> bool:
+        return bool(self.tables.get(self.table_basename))
+
+
+__all__ = ["RefreshQueue", "RefreshRequest", "resolve_registry_key", "dumps_arguments", "loads_arguments"]
+
+
+if __name__ == "__main__":
+    # 刷新任务：python -m fintools.databases.refresh_queue [轮询间隔秒数]
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    interval = float(sys.argv[1]) if len(sys.argv) > 1 else 0
+    queue = RefreshQueue()
+    while True:
+        n = queue.drain()
+        if n: logger.info(f"[RefreshQueue]: 完成 {n} 条刷新请求。")
+        if not interval: break
+        time.sleep(interval)
@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import pandas as pd
+from hashlib import sha1
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, List, Callable, Dict, Any, Iterator
+
+from . import Fields
+from .base import UpsertResult
+from .history_db import HistoryDB
+from .utils import _python_value_to_sqlite_value
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def shard_paths(db_path: str, shards: int) -> List[str]:
+    """history.db -> history.shard0.db, history.shard1.db, ..."""
+    base, ext = os.path.splitext(db_path)
+    return [f"{base}.shard{i}{ext or '.db'}" for i in range(shards)]
+
+
+class ShardedHistoryDB:
+    """
+    把同一个缓存按 symbol 哈希拆分到 K 个 SQLite 文件中，每个分片有自己的写锁。
+
+    接口与 HistoryDB 相同：history 直接路由到对应分片；history_many / query 并发地在各分片上执行再合并。
+    连接按 (线程, 文件) 各自持有，因此不同分片的补数和写入可以在多个线程中同时进行。
+    """
+    def __init__(self, table_basename: str, db_path: str = os.getenv("FINTOOLS_DB", "history.db"),
+                 shards: int = int(os.getenv("FINTOOLS_DB_SHARDS", "1")), max_workers: Optional[int] = None, **kwargs: Any):
+        """
+        参数：
+            shards: 分片数量，分片文件为 `<db_path 去扩展名>.shard<i><扩展名>`；分片数确定后不能再修改
+            max_workers: 并发执行的线程数，默认等于分片数
+            其余参数原样传给每个分片的 HistoryDB
+        """
+        assert shards >= 1, "分片数量必须大于 0"
+        self.db_path = db_path
+        self.shards = [HistoryDB(table_basename, db_path=path, **kwargs) for path in shard_paths(db_path, shards)]
+        self.table_basename = self.shards[0].table_basename
+        self.max_workers = max_workers or shards
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def shard_for(self, key_fields: Fields) -> HistoryDB:
+        # 有 symbol 时只按 symbol 哈希，同一个 symbol 的各频率数据落在同一个文件里
+        values = [key_fields["symbol"]] if "symbol" in key_fields else list(key_fields.values())
+        digest = sha1("-".join(str(_python_value_to_sqlite_value(v)) for v in values).encode()).hexdigest()
+        return self.shards[int(digest, 16) % len(self.shards)]
+
+    def _map(self, fn: Callable[..., Any], items: List[Any]) -> List[Any]:
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fintools-shard")
+        return list(self._executor.map(fn, items))
+
+    def history(self, key_fields: Fields = {}, common_fields: Fields = {}, except_fields: Fields = {},
+                start: Optional[datetime] = None,
+                end: Optional[datetime] = None,
+                callback: Optional[Callable[..., pd.DataFrame]] = None,
+                field_map: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+        return self.shard_for(key_fields).history(key_fields=key_fields, common_fields=common_fields, except_fields=except_fields,
+                                                  start=start, end=end, callback=callback, field_map=field_map)
+
+    def history_many(self, key_fields_list: List[Fields], common_fields: Fields = {}, except_fields: Fields = {},
+                     start: Optional[datetime] = None,
+                     end: Optional[datetime] = None,
+                     callback: Optional[Callable[..., pd.DataFrame]] = None,
+                     field_map: Optional[Dict[str, str]] = None,
+                     batch_callback: Optional[Callable[..., pd.DataFrame]] = None) -> pd.DataFrame:
+        """
+        按分片分组后并发执行各分片的 history_many，结果按 key_fields_list 的顺序拼接。
+        """
+        if not key_fields_list:
+            return pd.DataFrame([])
+        groups: Dict[int, List[Fields]] = {}
+        for kf in key_fields_list:
+            groups.setdefault(self.shards.index(self.shard_for(kf)), []).append(kf)
+
+        frames = self._map(lambda item: self.shards[item[0]].history_many(
+            key_fields_list=item[1], common_fields=common_fields, except_fields=except_fields,
+            start=start, end=end, callback=callback, field_map=field_map, batch_callback=batch_callback), list(groups.items()))
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame([])
+
+        keys = list(key_fields_list[0].keys())
+        if not keys:
+            return pd.concat(frames, ignore_index=True)
+        parts: Dict[Tuple[Any, ...], pd.DataFrame] = {}
+        for f in frames:
+            for k, part in f.groupby(keys, sort=False):
+                parts[k if isinstance(k, tuple) else (k,)] = part
+        ordered = [parts[tuple(kf[k] for k in keys)] for kf in key_fields_list if tuple(kf[k] for k in keys) in parts]
+        return pd.concat(ordered, ignore_index=True)
+
+    def iter_history(self, key_fields: Fields = {}, common_fields: Fields = {}, except_fields: Fields = {},
+                     start: Optional[datetime] = None,
+                     end: Optional[datetime] = None,
+                     callback: Optional[Callable[..., pd.DataFrame]] = None,
+                     field_map: Optional[Dict[str, str]] = None,
+                     chunk_rows: int = 100_000) -> Iterator[pd.DataFrame]:
+        return self.shard_for(key_fields).iter_history(key_fields=key_fields, common_fields=common_fields, except_fields=except_fields,
+                                                       start=start, end=end, callback=callback, field_map=field_map, chunk_rows=chunk_rows)
+
+    def missing(self, key_fields: Fields, common_fields: Fields, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        return self.shard_for(key_fields).missing(key_fields=key_fields, common_fields=common_fields, start=start, end=end)
+
+    def bulk_insert(self, data: pd.DataFrame, key_columns: List[str], common_fields: Fields,
+                    start: datetime, end: datetime, key_fields_list: Optional[List[Fields]] = None) -> UpsertResult:
+        """按分片拆分长表后并发写入，每个分片各自在一个事务中完成。参数同 HistoryDB.bulk_insert。"""
+        if key_fields_list is None:
+            key_fields_list = [] if data.empty else [
+                dict(zip(key_columns, k if isinstance(k, tuple) else (k,))) for k in data.groupby(key_columns, sort=False).groups]
+        groups: Dict[int, List[Fields]] = {}
+        for kf in key_fields_list:
+            groups.setdefault(self.shards.index(self.shard_for(kf)), []).append(kf)
+        index = pd.MultiIndex.from_frame(data[key_columns]) if not data.empty else None
+
+        def run(item: Tuple[int, List[Fields]]) -> UpsertResult:
+            i, kfs = item
+            part = data[index.isin([tuple(kf[k] for k in key_columns) for kf in kfs])] if index is not None else data
+            return self.shards[i].bulk_insert(part, key_columns=key_columns, common_fields=common_fields,
+                                              start=start, end=end, key_fields_list=kfs)
+        return sum(self._map(run, list(groups.items())), UpsertResult())
+
+    def query(self, sql: str, params: Tuple[Any, ...] = ()) -> pd.DataFrame:
+        """在每个分片上执行同一条只读查询，结果纵向拼接。"""
+        def run(shard: HistoryDB) -> pd.DataFrame:
+            try:
+                return shard.query(sql, params)
+            except sqlite3.OperationalError as e:
+                if "no such table" not in str(e): raise
+                return pd.DataFrame([])  # 该分片还没有写入过这张表
+        frames = self._map(run, self.shards)
+        return pd.concat([f for f in frames if not f.empty] or [frames[0]], ignore_index=True)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for shard in self.shards:
+            shard.close()
+
+
+__all__ = ["ShardedHistoryDB", "shard_paths"]
@@ -21,7 +21,9 @@ def _python_type_to_sqlite_type(py_type: str) -> str:
         return "TEXT"
 
 def _python_value_to_sqlite_value(value: Any) -> Any:
-    if isinstance(value, datetime):
+    if value is None:
+        return None
+    elif isinstance(value, datetime):
         return _datetime_to_timestamp(value)
     elif isinstance(value, bool):
         return int(value)
@@ -0,0 +1,190 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, List, Tuple, Any, Iterator, Optional
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = [(k, v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for k, v in items]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Counter:
+    """单调递增计数器，按标签分组。"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = Lock()
+
+    def inc(self, value: float = 1.0, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def get(self, **labels: Any) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def samples(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{"labels": dict(k), "value": v} for k, v in self._values.items()]
+
+    def exposition(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(k)} {v:g}" for k, v in sorted(self._values.items())]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """按标签分组的延迟直方图（单位：秒）。"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelKey, Tuple[List[int], float, int]] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            counts, total, n = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            i = bisect_left(self.buckets, value)
+            if i < len(counts):
+                counts[i] += 1
+            self._values[key] = (counts, total + value, n + 1)
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def get(self, **labels: Any) -> Dict[str, float]:
+        _, total, n = self._values.get(_label_key(labels), ([], 0.0, 0))
+        return {"count": n, "sum": total}
+
+    def samples(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            ret = []
+            for k, (counts, total, n) in self._values.items():
+                cumulative, acc = {}, 0
+                for b, c in zip(self.buckets, counts):
+                    acc += c
+                    cumulative[f"{b:g}"] = acc
+                ret.append({"labels": dict(k), "count": n, "sum": total, "buckets": cumulative})
+            return ret
+
+    def exposition(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for k, (counts, total, n) in sorted(self._values.items()):
+                acc = 0
+                for b, c in zip(self.buckets, counts):
+                    acc += c
+                    lines.append(f"{self.name}_bucket{_format_labels(k, ('le', f'{b:g}'))} {acc}")
+                lines.append(f"{self.name}_bucket{_format_labels(k, ('le', '+Inf'))} {n}")
+                lines.append(f"{self.name}_sum{_format_labels(k)} {total:g}")
+                lines.append(f"{self.name}_count{_format_labels(k)} {n}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class MetricsRegistry:
+    """
+    进程内的指标注册表。
+
+    同名指标只注册一次，重复调用 counter / histogram 返回同一个实例。
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Counter | Histogram] = {}
+        self._lock = Lock()
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help)
+            metric = self._metrics[name]
+        assert isinstance(metric, Counter), f"指标 {name} 已注册为其他类型"
+        return metric
+
+    def histogram(self, name: str, help: str = "", buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help, buckets)
+            metric = self._metrics[name]
+        assert isinstance(metric, Histogram), f"指标 {name} 已注册为其他类型"
+        return metric
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """以字典形式返回所有指标的当前值。"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: {"type": m.type_name, "help": m.help, "samples": m.samples()} for m in metrics}
+
+    def to_prometheus(self) -> str:
+        """导出为 Prometheus 文本格式。"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for m in metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.type_name}")
+            lines.extend(m.exposition())
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for m in metrics:
+            m.reset()
+
+
+REGISTRY = MetricsRegistry()
+
+CACHE_REQUESTS = REGISTRY.counter("fintools_cache_requests_total", "Cache lookups by table and result (hit / miss).")
+CACHE_DOWNLOADED_ROWS = REGISTRY.counter("fintools_cache_downloaded_rows_total", "Rows returned by cache callbacks.")
+CACHE_DOWNLOADED_BYTES = REGISTRY.counter("fintools_cache_downloaded_bytes_total", "In-memory bytes of data returned by cache callbacks.")
+CACHE_CALLBACK_SECONDS = REGISTRY.histogram("fintools_cache_callback_seconds", "Time spent in cache callbacks (upstream downloads).")
+DB_READ_SECONDS = REGISTRY.histogram("fintools_db_read_seconds", "Time spent reading rows from the database.")
+DB_WRITE_SECONDS = REGISTRY.histogram("fintools_db_write_seconds", "Time spent writing rows to the database.")
+DB_UPSERTED_ROWS = REGISTRY.counter("fintools_db_upserted_rows_total", "Rows written by upserts, by result (inserted / updated / unchanged).")
+DB_CONVERT_SECONDS = REGISTRY.histogram("fintools_db_convert_seconds", "Time spent converting database rows to DataFrames.")
+SOURCE_REQUESTS = REGISTRY.counter("fintools_source_requests_total", "Data source history calls by source and result (ok / error).")
+SOURCE_SECONDS = REGISTRY.histogram("fintools_source_seconds", "Latency of data source history calls.")
+CACHE_SERVER_REQUESTS = REGISTRY.counter("fintools_cache_server_requests_total", "Cache server requests by endpoint and result (executed / coalesced / error).")
+RATE_LIMIT_WAIT_SECONDS = REGISTRY.histogram("fintools_rate_limit_wait_seconds", "Time spent waiting for upstream API rate limit tokens, by source.")
+
+
+__all__ = [
+    "Counter", "Histogram", "MetricsRegistry", "REGISTRY",
+    "CACHE_REQUESTS", "CACHE_DOWNLOADED_ROWS", "CACHE_DOWNLOADED_BYTES", "CACHE_CALLBACK_SECONDS",
+    "DB_READ_SECONDS", "DB_WRITE_SECONDS", "DB_UPSERTED_ROWS", "DB_CONVERT_SECONDS",
+    "SOURCE_REQUESTS", "SOURCE_SECONDS", "CACHE_SERVER_REQUESTS", "RATE_LIMIT_WAIT_SECONDS",
+]
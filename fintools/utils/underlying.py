@@ -18,6 +18,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 from .types import parse_datetime
+from fintools.databases.rate_limit import RateLimitProxy
 
 
 class RetryProxy(wrapt.ObjectProxy):
@@ -34,7 +35,8 @@ _pro: RetryProxy | None = None
 def pro(api_key: str = os.getenv("TUSHARE_API_KEY", "")) -> RetryProxy:
     global _pro
     if not _pro:
-        _pro = RetryProxy(tushare.pro_api(api_key))
+        # 先按配额排队拿令牌，重试只处理网络等其他错误
+        _pro = RetryProxy(RateLimitProxy(tushare.pro_api(api_key), "tushare"))
     return _pro
 
 _index_basic = None
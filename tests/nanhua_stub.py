@@ -0,0 +1,136 @@
+"""
+Offline stand-in for the NanHua data server (NANHUA_SERVER_URL).
+
+Serves a deterministic series for any ticker in the same JSON shape as the real
+server: a list of {"quoteTime": <ms>, "open", "high", "low", "close", "volume"}.
+It can behave like a server that honours startTime/endTime or one that ignores
+them, answers ETag revalidation with 304, and counts requests and bytes sent.
+
+    with NanHuaStubServer(bars=5000, supports_range=False) as server:
+        os.environ["NANHUA_SERVER_URL"] = server.url
+        ...
+
+    python tests/nanhua_stub.py --port 13200 --bars 20000
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+# bar length in minutes for the NanHua freq codes
+FREQ_MINUTES = {"MIN1": 1, "MIN5": 5, "MIN15": 15, "MIN30": 30, "MIN60": 60, "MIN120": 120, "MIN240": 240,
+                "DAY1": 1440, "WEEK1": 10080, "MONTH1": 43200}
+
+
+class NanHuaStubServer:
+    def __init__(self, bars: int = 2000, supports_range: bool = True, latency: float = 0.0,
+                 end: Optional[datetime] = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        bars: number of bars per (ticker, freq), ending at `end` (default: today 00:00 UTC)
+        supports_range: honour startTime / endTime (ms) query parameters
+        latency: seconds to sleep before answering each request
+        """
+        self.bars = bars
+        self.supports_range = supports_range
+        self.latency = latency
+        self.end = end or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.requests: List[Dict[str, Any]] = []
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._series: Dict[tuple, List[Dict[str, Any]]] = {}
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                stub._handle(self)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def series(self, ticker: str, freq: str) -> List[Dict[str, Any]]:
+        key = (ticker, freq)
+        with self._lock:
+            if key not in self._series:
+                step = timedelta(minutes=FREQ_MINUTES[freq])
+                base = sum(ord(c) for c in ticker)
+                first = self.end - step * self.bars
+                self._series[key] = [{
+                    "quoteTime": int((first + step * i).timestamp() * 1000),
+                    "open": base + i, "high": base + i + 1, "low": base + i - 1, "close": base + i + 0.5, "volume": 100.0 + i,
+                } for i in range(self.bars)]
+            return self._series[key]
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        query = {k: v[0] for k, v in parse_qs(urlsplit(handler.path).query).items()}
+        rows = self.series(query.get("ticker", ""), query.get("freq", "DAY1"))
+        etag = '"' + hashlib.sha1(f"{query.get('ticker')}-{query.get('freq')}-{len(rows)}".encode()).hexdigest() + '"'
+        ranged = self.supports_range and "startTime" in query and "endTime" in query
+        if ranged:
+            lo, hi = int(query["startTime"]), int(query["endTime"])
+            rows = [r for r in rows if lo <= r["quoteTime"] <= hi]
+        with self._lock:
+            self.requests.append({**query, "if_none_match": handler.headers.get("If-None-Match")})
+        if not ranged and handler.headers.get("If-None-Match") == etag:
+            handler.send_response(304)
+            handler.send_header("ETag", etag)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+        body = json.dumps(rows).encode("utf-8")
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        if not ranged:
+            handler.send_header("ETag", etag)
+        handler.end_headers()
+        handler.wfile.write(body)
+        with self._lock:
+            self.bytes_sent += len(body)
+
+    def start(self) -> "NanHuaStubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "NanHuaStubServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=13200)
+    parser.add_argument("--bars", type=int, default=2000)
+    parser.add_argument("--no-range", action="store_true", help="ignore startTime / endTime like an older server")
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    server = NanHuaStubServer(bars=args.bars, supports_range=not args.no_range, latency=args.latency, port=args.port).start()
+    print(f"NANHUA_SERVER_URL={server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -3,8 +3,9 @@ if __name__ == "__main__":
     from pathlib import Path
     sys.path.append(Path(__file__).parent.parent.as_posix())
 
-from fintools.api.F.fin_history import get_data, list_indices, UnderlyingType, DataFrequency
+from fintools.api.F.fin_history import get_data, list_indices, UnderlyingType, DataFrequency, _align_panel, _iter_indicators, _compute_indicators
 from datetime import datetime, date, timedelta
+import pandas as pd
 import dotenv
 dotenv.load_dotenv()
 
@@ -12,6 +13,62 @@ def test_get_data_tushare():
     df_tu = get_data("tushare", "510300.SH", UnderlyingType.FUND, DataFrequency.DAILY, indicators=['macd', 'rsi', 'boll'])
     assert not df_tu.empty
 
+def test_panel_asof_alignment():
+    sh = pd.date_range("2024-01-02", periods=3, freq="D", tz="Asia/Shanghai")
+    ny = pd.date_range("2024-01-02", periods=3, freq="D", tz="America/New_York")
+    df = pd.concat([
+        pd.DataFrame({"symbol": "SH", "date": sh, "close": [1.0, 2.0, 3.0]}),
+        pd.DataFrame({"symbol": "NY", "date": ny, "close": [10.0, 20.0, 30.0]}),
+    ], ignore_index=True)
+    panel = _align_panel(df, symbols=["NY", "SH"], fields=["close"], align="asof")
+    close = panel["close"]
+    assert list(close.columns) == ["NY", "SH"]
+    assert len(close) == 6
+    assert close["SH"].notna().all()
+    assert close["NY"].isna().sum() == 1  # 第一个 NY bar 之前没有值
+    exact = _align_panel(df, symbols=["NY", "SH"], fields=["close"], align="exact")["close"]
+    assert exact.notna().sum().sum() == 6
+    strict = _align_panel(df, symbols=["NY", "SH"], fields=["close"], align="asof", tolerance=timedelta(hours=1))["close"]
+    assert strict.notna().sum().sum() == 6
+
+def test_panel_normalized_symbols():
+    import os
+    import tempfile
+    from fintools.databases.history_db import history_cache
+    from fintools.databases.keys import upper_symbol
+
+    @history_cache(table_basename="panel", db_path=os.path.join(tempfile.mkdtemp(), "history.db"),
+                   key_fields=("symbol",), common_fields=("freq",), normalizers={"symbol": upper_symbol})
+    def history(symbol: str, start: datetime, end: datetime, freq: str = "daily") -> pd.DataFrame:
+        dates = pd.date_range(start, end, freq="D", inclusive="left")
+        return pd.DataFrame({"date": dates, "close": 1.0 if symbol == "AAA" else 2.0})
+
+    start, end = datetime(2024, 1, 1).astimezone(), datetime(2024, 1, 4).astimezone()
+    # 缓存键按规范化后的 symbol，返回的 symbol 列仍是调用方的写法
+    df = history.many(["aaa", "BBB"], start=start, end=end)
+    assert set(df["symbol"]) == {"aaa", "BBB"}
+    close = _align_panel(df, symbols=["aaa", "BBB"], fields=["close"])["close"]
+    assert list(close.columns) == ["aaa", "BBB"] and len(close) == 3
+    assert (close["aaa"] == 1.0).all() and (close["BBB"] == 2.0).all()
+    assert set(history.many(["AAA"], start=start, end=end)["symbol"]) == {"AAA"}
+
+def test_iter_indicators_across_chunks():
+    import numpy as np
+    dates = pd.date_range("2024-01-01", periods=1000, freq="min", tz="UTC")
+    close = 100 + np.sin(np.arange(1000) / 20) + np.arange(1000) * 0.01
+    df = pd.DataFrame({"date": dates, "open": close, "high": close + 0.5, "low": close - 0.5, "close": close, "volume": 1000.0})
+    indicators = ["boll", "close_10_sma", "rsi"]
+    expected = _compute_indicators(df.copy(), indicators).reset_index(drop=True)
+    chunks = [df.iloc[i:i + 128].reset_index(drop=True) for i in range(0, len(df), 128)]
+    got = pd.concat(list(_iter_indicators(chunks, indicators, lookback=200)), ignore_index=True)
+    assert len(got) == len(expected)
+    # 窗口型指标在块边界处与整段计算一致（rsi 为递推指标，预热足够长后误差可以忽略）
+    pd.testing.assert_frame_equal(expected[["date", "boll", "boll_ub", "close_10_sma"]], got[["date", "boll", "boll_ub", "close_10_sma"]])
+    assert (expected["rsi"] - got["rsi"]).abs().max() < 1e-2
+
 
 if __name__ == "__main__":
-    test_get_data_tushare()
\ No newline at end of file
+    test_get_data_tushare()
+    test_panel_asof_alignment()
+    test_panel_normalized_symbols()
+    test_iter_indicators_across_chunks()
\ No newline at end of file
@@ -46,6 +46,7 @@ def test_common_cache():
 def test_select_all():
     from fintools.data_sources.fin_news import DATASOURCES
     from fintools.databases.common_db import DB_CONNECTIONS
+    DATASOURCES["eastmoney"]  # 数据源模块按需导入，导入后才会注册缓存
     assert "fintools.data_sources.fin_news.eastmoney:EastMoneyNewsDataSource.news_details" in DB_CONNECTIONS
     db = DB_CONNECTIONS['fintools.data_sources.fin_news.eastmoney:EastMoneyNewsDataSource.news_details']
     all_keys = db.list_all_cached()
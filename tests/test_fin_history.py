@@ -52,7 +52,490 @@ def test_nanhua_history():
     df_nh = nh.history("PP_NH", type=UnderlyingType.COMMODITY, start=0, end=datetime.now(), freq=DataFrequency.MINUTE60)
     assert len(df_nh)
 
+def test_lazy_registry():
+    import ast
+    import subprocess
+    import sys
+    from pathlib import Path
+    # 导入包和 F API 时不加载任何数据源 SDK，只有用到的那个数据源才会被导入
+    code = (
+        "import sys\n"
+        "import fintools.api.F.fin_history, fintools.api.F.fin_news, fintools.api.F.fin_report\n"
+        "from fintools.data_sources.fin_history import DATASOURCES\n"
+        "sdks = ('yfinance', 'tushare', 'efinance', 'playwright')\n"
+        "assert not [m for m in sdks if m in sys.modules], [m for m in sdks if m in sys.modules]\n"
+        "assert 'nanhua' in DATASOURCES and DATASOURCES.loaded() == []\n"
+        "assert DATASOURCES['nanhua'].name == 'nanhua' and DATASOURCES.loaded() == ['nanhua']\n"
+        "assert not [m for m in sdks if m in sys.modules]\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=Path(__file__).parent.parent)
+
+    # 清单与源码一致：逐个模块找出 name = "..." 的 OHLCDataSource 子类（只解析不导入）
+    package = Path(__file__).parent.parent / "fintools" / "data_sources" / "fin_history"
+    found = {}
+    for path in package.glob("*.py"):
+        for node in ast.parse(path.read_text(encoding="utf-8")).body:
+            if isinstance(node, ast.ClassDef) and any(getattr(b, "id", None) == "OHLCDataSource" for b in node.bases):
+                for stmt in node.body:
+                    if isinstance(stmt, ast.Assign) and getattr(stmt.targets[0], "id", None) == "name":
+                        found[stmt.value.value] = f".{path.stem}:{node.name}"
+    assert found == dict(DATASOURCES._targets)
+
+def test_tushare_minute_windows():
+    import os
+    import sqlite3
+    import tempfile
+    import pandas as pd
+    from zoneinfo import ZoneInfo
+    from fintools.databases import DB_CONNECTIONS
+    from fintools.databases.history_db import HistoryDB
+
+    class FakePro:
+        def __init__(self, fail_after=None):
+            self.calls, self.fail_after = [], fail_after
+
+        def stk_mins(self, ts_code, freq, start_date, end_date):
+            self.calls.append((start_date, end_date))
+            if self.fail_after is not None and len(self.calls) > self.fail_after:
+                raise ConnectionError("interrupted")
+            times = pd.date_range(start_date, end_date, freq="1min")
+            times = times[(times.hour >= 9) & (times.hour < 11)]
+            df = pd.DataFrame({"ts_code": ts_code, "trade_time": times.strftime("%Y-%m-%d %H:%M:%S"),
+                               "open": 1.0, "close": 1.0, "high": 1.0, "low": 1.0, "vol": 1.0})
+            # 与真实接口一样，超过单次上限的部分被静默截断
+            return df.iloc[::-1].head(500).reset_index(drop=True)
+
+    cls = DATASOURCES["tushare"]
+    fn = cls.history
+    reg_key = f"{fn.__module__}:{fn.__qualname__}"
+    saved = (DB_CONNECTIONS.get(reg_key), cls.__dict__.get("pro"), cls.minute_row_limit, cls.minute_workers, cls.session_minutes)
+    db = HistoryDB("tushare", db_path=os.path.join(tempfile.mkdtemp(), "history.db"))
+    DB_CONNECTIONS[reg_key] = db
+    cls.minute_row_limit, cls.minute_workers, cls.session_minutes = 500, 1, {"stk_mins": 60}
+    try:
+        tu = cls.__new__(cls)
+        tz = ZoneInfo("Asia/Shanghai")
+        start, end = datetime(2024, 1, 1, tzinfo=tz), datetime(2024, 1, 29, tzinfo=tz)
+        common_fields = {"type": UnderlyingType.STOCK, "freq": DataFrequency.MINUTE1}
+
+        # 第一个 7 天窗口被截断后拆成两半补齐，随后请求中断：已完成的窗口已经登记
+        cls.pro = FakePro(fail_after=3)
+        try:
+            tu._history_minutes("stk_mins", "600519.SH", UnderlyingType.STOCK, start, end, DataFrequency.MINUTE1)
+            assert False, "expected the interrupted backfill to raise"
+        except ConnectionError:
+            pass
+        assert db.missing({"symbol": "600519.SH"}, common_fields, start, end)[0][0] == datetime(2024, 1, 8, tzinfo=tz)
+
+        # 写入缓存失败的窗口（这里是最后一个）返回给缓存层写入，已经写入的窗口不再返回
+        cls.pro = pro = FakePro()
+        bulk_insert = db.bulk_insert
+        def flaky_insert(data, *args, **kwargs):
+            if kwargs["start"] >= datetime(2024, 1, 22, tzinfo=tz):
+                raise sqlite3.OperationalError("database is locked")
+            return bulk_insert(data, *args, **kwargs)
+        db.bulk_insert = flaky_insert
+        df = tu._history_minutes("stk_mins", "600519.SH", UnderlyingType.STOCK, start, end, DataFrequency.MINUTE1)
+        del db.bulk_insert
+        assert pro.calls[0][0] == "2024-01-08 00:00:00"
+        assert len(df) == 7 * 120 and df["date"].min() == datetime(2024, 1, 22, 9, tzinfo=tz) and df["date"].is_unique
+        assert db.missing({"symbol": "600519.SH"}, common_fields, start, end)[0][0] == datetime(2024, 1, 22, tzinfo=tz)
+        db.bulk_insert(df.assign(symbol="600519.SH"), key_columns=["symbol"], common_fields=common_fields,
+                       start=datetime(2024, 1, 22, tzinfo=tz), end=end)
+        cached = db.history({"symbol": "600519.SH"}, common_fields, start=start, end=datetime(2024, 1, 28, 10, 59, tzinfo=tz))
+        assert len(cached) == 28 * 120 - 1
+    finally:
+        prev_db, prev_pro, cls.minute_row_limit, cls.minute_workers, cls.session_minutes = saved
+        if prev_db is None: DB_CONNECTIONS.pop(reg_key, None)
+        else: DB_CONNECTIONS[reg_key] = prev_db
+        if prev_pro is None:
+            if "pro" in cls.__dict__: del cls.pro
+        else: cls.pro = prev_pro
+
+
+def test_efinance_range_and_batch():
+    import os
+    import tempfile
+    import pandas as pd
+    import inspect
+    import efinance as ef
+    from zoneinfo import ZoneInfo
+    from fintools.databases import DB_CONNECTIONS
+    from fintools.databases.history_db import history_cache
+    from fintools.databases.keys import strip_symbol
+
+    calls = []
+    def fake_quote_history(codes, beg="19000101", end="20500101", klt=101, **kwargs):
+        calls.append((codes, beg, end))
+        days = pd.date_range(beg, end, freq="D").strftime("%Y-%m-%d")
+        def one(code):
+            return pd.DataFrame({"日期": days, "开盘": 1.0, "最高": 1.0, "最低": 1.0, "收盘": 1.0, "成交量": 100})
+        return {c: one(c) for c in codes} if isinstance(codes, list) else one(codes)
+
+    # 与 EFinanceDataSource 相同的缓存配置，但使用临时数据库（FINTOOLS_DB 为空时数据源本身不开启缓存）
+    base = DATASOURCES["efinance"]
+    raw = inspect.unwrap(base.history)
+    reg_key = f"{raw.__module__}:{raw.__qualname__}"
+    saved = (DB_CONNECTIONS.get(reg_key), ef.stock.get_quote_history)
+    class CachedEFinance(base):
+        history = history_cache(table_basename="efinance", db_path=os.path.join(tempfile.mkdtemp(), "history.db"),
+                                key_fields=("symbol", "freq"), except_fields=("type",), normalizers={"symbol": strip_symbol})(raw)
+    ef.stock.get_quote_history = fake_quote_history
+    try:
+        src = CachedEFinance()
+        tz = ZoneInfo("Asia/Shanghai")
+        df = src.history_many(["600519", "000001"], type=UnderlyingType.STOCK, start=datetime(2024, 1, 1, tzinfo=tz),
+                              end=datetime(2024, 1, 11, tzinfo=tz), freq=DataFrequency.DAILY)
+        # 两个 symbol 一次批量下载，且只请求 [start, end) 覆盖的日期（end 不包含在内）
+        assert calls == [(["600519", "000001"], "20240101", "20240110")]
+        assert len(df) == 20 and set(df["symbol"]) == {"600519", "000001"}
+
+        df = src.history_many(["600519", "000001"], type=UnderlyingType.STOCK, start=datetime(2024, 1, 1, tzinfo=tz),
+                              end=datetime(2024, 1, 18, tzinfo=tz), freq=DataFrequency.DAILY)
+        # 只补最后一根 bar 之后的一周
+        assert calls[1] == (["600519", "000001"], "20240110", "20240117") and len(calls) == 2
+        assert len(df) == 34
+
+        src.history("600519", type=UnderlyingType.STOCK, start=datetime(2023, 12, 25, tzinfo=tz), end=datetime(2024, 1, 1, tzinfo=tz))
+        assert calls[2] == ("600519", "20231225", "20231231")
+    finally:
+        if saved[0] is None: DB_CONNECTIONS.pop(reg_key, None)
+        else: DB_CONNECTIONS[reg_key] = saved[0]
+        ef.stock.get_quote_history = saved[1]
+
+
+def test_yahoo_windows_and_batch():
+    import os
+    import tempfile
+    import pandas as pd
+    import inspect
+    import yfinance as yf
+    from fintools.databases import DB_CONNECTIONS
+    from fintools.databases.history_db import history_cache
+    from fintools.databases.keys import upper_symbol
+
+    def bars(start, end):
+        # 稀疏的整点 bar，足够检查窗口和区间
+        index = pd.date_range(pd.Timestamp(start).ceil("h"), end, freq="h", inclusive="left", name="Datetime")
+        return pd.DataFrame({"Open": 1.0, "High": 1.0, "Low": 1.0, "Close": 1.0, "Volume": 100}, index=index)
+
+    calls = []
+    def fake_download(tickers, start=None, end=None, interval="1d", **kwargs):
+        calls.append((tuple(tickers), start, end, interval))
+        return pd.concat({t: bars(start, end) for t in tickers}, axis=1)
+
+    class FakeTicker:
+        def __init__(self, symbol):
+            self.symbol = symbol
+        def history(self, start=None, end=None, interval="1d", **kwargs):
+            calls.append((self.symbol, start, end, interval))
+            return bars(start, end)
+
+    base = DATASOURCES["yahoo_finance"]
+    raw = inspect.unwrap(base.history)
+    reg_key = f"{raw.__module__}:{raw.__qualname__}"
+    saved = (DB_CONNECTIONS.get(reg_key), yf.download, yf.Ticker)
+    class CachedYahoo(base):
+        history = history_cache(table_basename="yahoo_finance", db_path=os.path.join(tempfile.mkdtemp(), "history.db"),
+                                key_fields=("symbol", "freq"), except_fields=("type",), normalizers={"symbol": upper_symbol})(raw)
+    yf.download, yf.Ticker = fake_download, FakeTicker
+    try:
+        src = CachedYahoo()
+        now = datetime.now().astimezone()
+        start, end = now - timedelta(days=45), now - timedelta(days=1)
+        df = src.history_many(["aapl", "msft"], type=UnderlyingType.STOCK, start=start, end=end, freq=DataFrequency.MINUTE1)
+        # 一次请求两个 symbol，窗口不超过 7 天且不早于 30 天前
+        assert all(c[0] == ("AAPL", "MSFT") and c[3] == "1m" for c in calls) and len(calls) == 5
+        assert all(we - ws <= timedelta(days=7) and ws >= now - timedelta(days=30) for _, ws, we, _ in calls)
+        assert set(df["symbol"]) == {"aapl", "msft"} and df["date"].min() >= now - timedelta(days=30)
+
+        # 30 天以前的部分已登记为空，不再回源
+        db = src._history_db()
+        earliest = calls[0][1]
+        assert db.missing({"symbol": "AAPL", "freq": DataFrequency.MINUTE1}, {}, start, earliest) == []
+        calls.clear()
+        src.history_many(["aapl", "msft"], type=UnderlyingType.STOCK, start=start, end=end, freq=DataFrequency.MINUTE1)
+        assert all(ws >= end - timedelta(hours=1) for _, ws, _, _ in calls)
+
+        # 单个 symbol 走 Ticker.history，同样按窗口拆分
+        calls.clear()
+        df = src.history("nvda", type=UnderlyingType.STOCK, start=start, end=end, freq=DataFrequency.MINUTE1)
+        assert [c[0] for c in calls] == ["NVDA"] * 5 and len(df)
+
+        # 远程缓存后端不登记不可取区间，避免一次无用的往返
+        from fintools.databases.cache_server import RemoteHistoryDB
+        remote = RemoteHistoryDB.__new__(RemoteHistoryDB)
+        puts = []
+        remote.bulk_insert = lambda *args, **kwargs: puts.append(kwargs)  # type: ignore
+        DB_CONNECTIONS[reg_key] = remote
+        windows = src._plan_windows(["TSLA"], start, end, DataFrequency.MINUTE1)
+        assert puts == [] and len(windows) == 5 and windows[0][0] >= now - timedelta(days=30)
+    finally:
+        if saved[0] is None: DB_CONNECTIONS.pop(reg_key, None)
+        else: DB_CONNECTIONS[reg_key] = saved[0]
+        yf.download, yf.Ticker = saved[1], saved[2]
+
+
+def test_choice_session_batching():
+    import sys
+    import time
+    import types
+    import inspect
+    import pandas as pd
+    from concurrent.futures import ThreadPoolExecutor
+    from fintools.data_sources.fin_history.choice import ChoiceSession
+
+    class EmQuantData:
+        def __init__(self, code, msg):
+            self.ErrorCode, self.ErrorMsg = code, msg
+
+    class FakeC:
+        def __init__(self):
+            self.EmQuantData = EmQuantData
+            self.calls, self.starts, self.stops, self.healthy = [], 0, 0, True
+        def start(self, options):
+            self.starts += 1
+            return EmQuantData(0, "success")
+        def stop(self):
+            self.stops += 1
+        def tradedates(self, start, end, options):
+            return EmQuantData(0 if self.healthy else 10001011, "ok" if self.healthy else "not logged in")
+        def csd(self, codes, indicators, start, end, options):
+            self.calls.append(codes)
+            time.sleep(0.02)
+            if "BAD.SH" in codes.split(","):
+                return EmQuantData(10000009, "invalid code")
+            days = pd.date_range(start, end, freq="D").strftime("%Y/%m/%d")
+            rows = [{"CODES": c, "DATES": d, "OPEN": 1.0, "CLOSE": 1.0, "HIGH": 1.0, "LOW": 1.0, "VOLUME": 100.0}
+                    for c in codes.split(",") for d in days]
+            return pd.DataFrame(rows).set_index("CODES")
+
+    fake = types.ModuleType("fake_emquant")
+    fake.c = FakeC()  # type: ignore
+    sys.modules["fake_emquant"] = fake
+    cls = DATASOURCES["choice"]
+    history = inspect.unwrap(cls.history)  # 直接测试下载路径，不经过缓存
+    saved = cls._session
+    cls._session = session = ChoiceSession(module="fake_emquant", idle_timeout=0.3, health_interval=60, batch_window=0.1)
+    try:
+        src = cls()
+        codes = ["000001.SZ", "600519.SH", "000300.SH", "510300.SH"]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            frames = list(executor.map(lambda c: history(src, c, start=datetime(2024, 1, 1), end=datetime(2024, 1, 10)), codes))
+        # 并发的 4 个请求合并为一次多代码调用，只登录一次
+        assert sorted(fake.c.calls[0].split(",")) == sorted(codes)
+        assert len(fake.c.calls) == 1 and fake.c.starts == 1
+        assert all(len(df) == 10 and set(df["CODES"]) == {c} for c, df in zip(codes, frames))
+
+        # 多代码调用中有无效代码时退回逐个调用，只有无效代码出错
+        try:
+            session.csd_many(["000001.SZ", "BAD.SH"], cls.fields, "2024-01-01", "2024-01-02", src._options(DataFrequency.DAILY))
+            assert False, "expected the invalid code to raise"
+        except ValueError:
+            assert fake.c.calls[-2:] == ["000001.SZ", "BAD.SH"]
+
+        # 合并后的并发请求中，只有无效代码的请求出错，其余请求正常返回
+        def fetch(code):
+            try:
+                return history(src, code, start=datetime(2024, 1, 1), end=datetime(2024, 1, 10))
+            except ValueError as e:
+                return e
+        calls = len(fake.c.calls)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            results = list(executor.map(fetch, ["BAD.SH", "000001.SZ", "600519.SH"]))
+        assert sorted(fake.c.calls[calls].split(",")) == ["000001.SZ", "600519.SH", "BAD.SH"]
+        assert isinstance(results[0], ValueError)
+        assert all(len(df) == 10 and set(df["CODES"]) == {c} for c, df in zip(["000001.SZ", "600519.SH"], results[1:]))
+
+        df = src.history_many(["000001.SZ", "600519.SH"], type=UnderlyingType.STOCK, start=datetime(2024, 1, 1), end=datetime(2024, 1, 5))
+        assert fake.c.calls[-1] == "000001.SZ,600519.SH" and set(df["symbol"]) == {"000001.SZ", "600519.SH"}
+
+        # 会话不可用时借出前重新登录；空闲超过 idle_timeout 后退出登录
+        fake.c.healthy, session.health_interval = False, 0
+        with cls.borrow_choice(timeout=1):
+            pass
+        assert fake.c.starts == 2 and fake.c.stops == 1
+        time.sleep(0.6)
+        assert not session.running and fake.c.stops == 2
+    finally:
+        session.close()
+        cls._session = saved
+        sys.modules.pop("fake_emquant", None)
+
+
+def test_investing_browser_pool():
+    import sys
+    import json
+    import time
+    import asyncio
+    import subprocess
+    import warnings
+    from pathlib import Path
+    from concurrent.futures import ThreadPoolExecutor
+    from fintools.data_sources.fin_history.investing_com import BrowserPool
+
+    # 导入模块不会导入（更不会启动）Playwright
+    code = "import sys, fintools.data_sources.fin_history.investing_com\nassert 'playwright' not in sys.modules\n"
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=Path(__file__).parent.parent)
+
+    stats = {"launches": 0, "contexts": 0, "active": 0, "peak": 0}
+
+    class FakeResponse:
+        def __init__(self, url):
+            self.url = url
+        async def body(self):
+            return json.dumps({"data": [[1704067200000 + i * 86400000, 1, 1, 1, 1, 100, None] for i in range(3)], "url": self.url}).encode()
+
+    class FakePage:
+        async def goto(self, url, wait_until=None):
+            stats["active"] += 1
+            stats["peak"] = max(stats["peak"], stats["active"])
+            await asyncio.sleep(0.05)
+            stats["active"] -= 1
+            return FakeResponse(url)
+        async def close(self):
+            pass
+
+    class FakeContext:
+        async def route(self, pattern, handler):
+            pass
+        async def new_page(self):
+            return FakePage()
+        async def close(self):
+            pass
+
+    class FakeBrowser:
+        async def new_context(self):
+            stats["contexts"] += 1
+            return FakeContext()
+        async def close(self):
+            pass
+
+    async def launch():
+        stats["launches"] += 1
+        return FakeBrowser()
+
+    pool = BrowserPool(size=2, launch=launch)
+    try:
+        urls = [f"https://example.com/{i}" for i in range(8)]
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            bodies = list(executor.map(pool.get, urls))
+        # 8 个请求在 2 个复用的上下文上并发执行
+        assert [json.loads(b)["url"] for b in bodies] == urls
+        assert stats == {"launches": 1, "contexts": 2, "active": 0, "peak": 2}
+        assert time.perf_counter() - t0 < 8 * 0.05
+
+        # 上下文出错（页面失败、route 失败）时释放名额，等待中的请求重新创建上下文，而不是等到超时
+        class FlakyPage(FakePage):
+            async def goto(self, url, wait_until=None):
+                await asyncio.sleep(0.05)
+                if url.endswith("/bad"):
+                    raise ValueError(f"Failed to load URL: {url}")
+                return FakeResponse(url)
+
+        class FlakyContext(FakeContext):
+            created, closed = 0, 0
+            async def route(self, pattern, handler):
+                if FlakyContext.created == 1:
+                    raise RuntimeError("route failed")
+            async def new_page(self):
+                return FlakyPage()
+            async def close(self):
+                FlakyContext.closed += 1
+
+        class FlakyBrowser(FakeBrowser):
+            async def new_context(self):
+                FlakyContext.created += 1
+                return FlakyContext()
+
+        async def flaky_launch():
+            return FlakyBrowser()
+
+        flaky = BrowserPool(size=1, timeout=5, launch=flaky_launch)
+        try:
+            def fetch(urls):
+                # 按顺序间隔提交，保证第一个请求先占用唯一的名额，后面的请求在等待
+                futures = []
+                with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+                    for url in urls:
+                        futures.append(executor.submit(flaky.get, url))
+                        time.sleep(0.01)
+                return [f.exception() or f.result() for f in futures]
+            t0 = time.perf_counter()
+            results = fetch(["https://example.com/a", "https://example.com/b"])
+            assert isinstance(results[0], RuntimeError) and json.loads(results[1])["url"] == "https://example.com/b"
+            results = fetch(["https://example.com/bad", "https://example.com/c"])
+            assert isinstance(results[0], ValueError) and json.loads(results[1])["url"] == "https://example.com/c"
+            assert time.perf_counter() - t0 < 1
+            # route 失败与页面失败的上下文都已关闭，等待的请求各自重新创建了上下文
+            assert FlakyContext.closed == 2 and FlakyContext.created == 3 and flaky._created == 1
+        finally:
+            flaky.close()
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            cls = DATASOURCES["investing.com"]
+            saved = (cls._pool, dict(cls._instrument_ids), cls.grab_investing_com_html)
+            scrapes = []
+            def fake_grab(self, name, type):
+                scrapes.append(name)
+                return '<html><body><script id="__NEXT_DATA__">{"props": {"pageProps": {"state": {"pageInfoStore": {"identifiers": {"instrument_id": "%d"}}}}}}</script></body></html>' % len(scrapes)
+            cls._pool, cls.grab_investing_com_html = pool, fake_grab
+            try:
+                src = cls()
+                df = src.history_many(["usd-cny", "eur-usd"], type=UnderlyingType.FOREX, start=datetime(2024, 1, 1), end=datetime(2024, 1, 10))
+                assert len(df) == 6 and set(df["symbol"]) == {"usd-cny", "eur-usd"}
+                # instrument id 只抓取一次
+                src.history("usd-cny", type=UnderlyingType.FOREX, start=datetime(2024, 1, 1), end=datetime(2024, 1, 10))
+                assert scrapes == ["usd-cny", "eur-usd"] and stats["contexts"] == 2
+            finally:
+                cls._pool, cls.grab_investing_com_html = saved[0], saved[2]
+                cls._instrument_ids.clear()
+                cls._instrument_ids.update(saved[1])
+    finally:
+        pool.close()
+
+
+def test_nanhua_range_and_etag():
+    import inspect
+    import pandas as pd
+    from nanhua_stub import NanHuaStubServer
+
+    cls = DATASOURCES["nanhua"]
+    history = inspect.unwrap(cls.history)  # 直接测试下载路径，不经过缓存
+    end = datetime(2024, 3, 1).astimezone()
+    start, stop = end - timedelta(days=30), end - timedelta(days=10)
+
+    with NanHuaStubServer(bars=400, end=end) as server:
+        nh = cls(server.url)
+        ranged = history(nh, "PP_NH", start=start, end=stop, freq=DataFrequency.DAILY)
+        assert len(ranged) and cls.range_supported[server.url] is True
+        assert "startTime" in server.requests[-1] and server.bytes_sent < len(ranged) * 200
+
+    with NanHuaStubServer(bars=400, end=end, supports_range=False) as server:
+        nh = cls(server.url, cache_ttl=60)
+        df = history(nh, "PP_NH", start=start, end=stop, freq=DataFrequency.DAILY)
+        pd.testing.assert_frame_equal(df.reset_index(drop=True), ranged.reset_index(drop=True))
+        assert cls.range_supported[server.url] is False
+        # TTL 内的其他区间直接使用本地缓存的整段数据
+        tail = history(nh, "PP_NH", start=stop, end=end, freq=DataFrequency.DAILY)
+        assert len(tail) and len(server.requests) == 1
+        # 过期后带 ETag 重新验证，服务端返回 304
+        nh.cache_ttl = 0
+        history(nh, "PP_NH", start=start, end=end, freq=DataFrequency.DAILY)
+        assert len(server.requests) == 2 and server.requests[-1]["if_none_match"]
+        assert server.bytes_sent < 2 * 400 * 200
+
+
 if __name__ == "__main__":
+    test_lazy_registry()
+    test_tushare_minute_windows()
+    test_efinance_range_and_batch()
+    test_yahoo_windows_and_batch()
+    test_choice_session_batching()
+    test_investing_browser_pool()
+    test_nanhua_range_and_etag()
     # test_investing_history()
     test_choice_history()
     test_tushare_history()
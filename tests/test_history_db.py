@@ -0,0 +1,627 @@
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+    sys.path.append(Path(__file__).parent.parent.as_posix())
+
+import sqlite3
+import tempfile
+import os
+import pandas as pd
+import pytest
+from datetime import datetime, timedelta
+
+from fintools.databases.history_db import HistoryDB, history_cache
+
+
+def _fake_daily(symbol: str, start: datetime, end: datetime, calls: list = []) -> pd.DataFrame:
+    calls.append((symbol, start, end))
+    dates = pd.date_range(start.astimezone().replace(hour=0, minute=0, second=0, microsecond=0), end, freq="D", inclusive="left", tz=start.astimezone().tzinfo)
+    dates = dates[(dates >= start) & (dates < end)]
+    base = float(sum(ord(c) for c in symbol))
+    return pd.DataFrame({
+        "date": dates,
+        "open": [base + i for i in range(len(dates))],
+        "high": [base + i + 1 for i in range(len(dates))],
+        "low": [base + i - 1 for i in range(len(dates))],
+        "close": [base + i + 0.5 for i in range(len(dates))],
+        "volume": [100.0 * (i + 1) for i in range(len(dates))],
+    })
+
+
+def _new_db(**kwargs) -> HistoryDB:
+    path = os.path.join(tempfile.mkdtemp(), "history.db")
+    return HistoryDB("test", db_path=path, **kwargs)
+
+
+def test_history_fills_gaps_once():
+    db = _new_db()
+    calls = []
+    start = datetime(2024, 1, 1).astimezone()
+    end = datetime(2024, 1, 11).astimezone()
+    cb = lambda symbol, freq, start, end: _fake_daily(symbol, start, end, calls)
+    df = db.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"}, start=start, end=end, callback=cb)
+    assert len(df) == 10
+    assert len(calls) == 1
+    df = db.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"}, start=start, end=end, callback=cb)
+    assert len(df) == 10
+    # 只会补最后一根 bar 之后的尾巴
+    assert len(calls) == 2
+    assert calls[1][1] > datetime(2024, 1, 10).astimezone()
+
+
+def test_history_many_single_query():
+    db = _new_db()
+    start = datetime(2024, 1, 1).astimezone()
+    end = datetime(2024, 1, 6).astimezone()
+    cb = lambda symbol, freq, start, end: _fake_daily(symbol, start, end, [])
+    symbols = ["AAA", "BBB", "CCC"]
+    df = db.history_many([{"symbol": s} for s in symbols], common_fields={"freq": "daily"}, start=start, end=end, callback=cb)
+    assert df.columns[0] == "symbol"
+    assert set(df.columns) == {"symbol", "date", "open", "high", "low", "close", "volume"}
+    assert len(df) == 15
+    assert sorted(df["symbol"].unique()) == symbols
+    one = db.history(key_fields={"symbol": "BBB"}, common_fields={"freq": "daily"}, start=start, end=end, callback=cb)
+    many = df[df["symbol"] == "BBB"].drop(columns=["symbol"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(one.sort_values("date").reset_index(drop=True), many[one.columns])
+
+
+def test_duckdb_read_engine_matches_sqlite():
+    pytest.importorskip("duckdb")
+    db = _new_db()
+    start = datetime(2024, 1, 1).astimezone()
+    end = datetime(2024, 1, 6).astimezone()
+    cb = lambda symbol, freq, start, end: _fake_daily(symbol, start, end, [])
+    expected = db.history_many([{"symbol": "AAA"}, {"symbol": "BBB"}], common_fields={"freq": "daily"}, start=start, end=end, callback=cb)
+    try:
+        duck = HistoryDB("test", db_path=db.db_path, read_engine="duckdb")
+        got = duck.history_many([{"symbol": "AAA"}, {"symbol": "BBB"}], common_fields={"freq": "daily"}, start=start, end=end)
+    except Exception as e:
+        if "sqlite" in str(e).lower() and "extension" in str(e).lower():
+            pytest.skip(f"DuckDB sqlite extension unavailable: {e}")
+        raise
+    pd.testing.assert_frame_equal(expected, got, check_dtype=False)
+
+def test_history_cache_many():
+    path = os.path.join(tempfile.mkdtemp(), "history.db")
+    calls = []
+
+    @history_cache(table_basename="many", db_path=path, key_fields=("symbol",), common_fields=("freq",))
+    def history(symbol: str, start: datetime, end: datetime, freq: str = "daily") -> pd.DataFrame:
+        return _fake_daily(symbol, start, end, calls)
+
+    start = datetime(2024, 1, 1).astimezone()
+    history("AAA", start=start, end=datetime(2024, 1, 4).astimezone())
+    df = history.many(["AAA", "BBB"], start=start, end=datetime(2024, 1, 4).astimezone())
+    assert len(df) == 6
+    # AAA 已缓存到最后一根 bar，只有 BBB 需要整段下载
+    assert [c[0] for c in calls] == ["AAA", "AAA", "BBB"]
+
+def test_cache_metrics():
+    from fintools.utils.metrics import REGISTRY, CACHE_REQUESTS, CACHE_DOWNLOADED_ROWS, CACHE_CALLBACK_SECONDS
+    REGISTRY.reset()
+    db = HistoryDB("metrics", db_path=os.path.join(tempfile.mkdtemp(), "history.db"))
+    start = datetime(2024, 1, 1).astimezone()
+    end = datetime(2024, 1, 6).astimezone()
+    cb = lambda symbol, freq, start, end: _fake_daily(symbol, start, end, [])
+    db.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"}, start=start, end=end, callback=cb)
+    db.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"}, start=start, end=datetime(2024, 1, 5).astimezone(), callback=cb)
+    assert CACHE_REQUESTS.get(table="metrics", result="miss") == 1
+    assert CACHE_REQUESTS.get(table="metrics", result="hit") == 1
+    assert CACHE_DOWNLOADED_ROWS.get(table="metrics") == 5
+    assert CACHE_CALLBACK_SECONDS.get(table="metrics")["count"] == 1
+    text = REGISTRY.to_prometheus()
+    assert 'fintools_cache_requests_total{result="hit",table="metrics"} 1' in text
+    assert 'fintools_cache_callback_seconds_bucket{table="metrics",le="+Inf"} 1' in text
+
+def test_upsert_only_touches_changed_rows():
+    db = _new_db()
+    start = datetime(2024, 1, 1).astimezone()
+    df = _fake_daily("AAA", start, datetime(2024, 1, 6).astimezone(), [])
+    res = db._insert_data(df.copy(), key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"})
+    assert (res.inserted, res.updated, res.unchanged) == (5, 0, 0)
+    res = db._insert_data(df.copy(), key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"})
+    assert (res.inserted, res.updated, res.unchanged) == (0, 0, 5)
+    revised = _fake_daily("AAA", start, datetime(2024, 1, 8).astimezone(), [])
+    revised.loc[1, "close"] = 0.0
+    res = db._insert_data(revised, key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"})
+    assert (res.inserted, res.updated, res.unchanged) == (2, 1, 4)
+    table_name = db._get_table_name(common_fields={"freq": "daily"})
+    got = db.query(f'SELECT close FROM "{table_name}" ORDER BY date LIMIT 2')
+    assert got["close"].tolist() == [revised.loc[0, "close"], 0.0]
+
+def _fake_minutes(symbol: str, start: datetime, end: datetime) -> pd.DataFrame:
+    dates = pd.date_range(start, end, freq="min", inclusive="left")
+    base = float(sum(ord(c) for c in symbol))
+    return pd.DataFrame({
+        "date": dates,
+        "close": [base + (i % 37) * 0.01 for i in range(len(dates))],
+        "volume": [float(i) * 1.5 + 0.123456789 for i in range(len(dates))],
+        "trades": [i % 7 for i in range(len(dates))],
+        "flag": [i % 2 == 0 for i in range(len(dates))],
+    })
+
+def test_block_roundtrip():
+    from fintools.databases.blocks import encode_block, decode_block
+    df = pd.DataFrame({
+        "date": [1, 61, 121, 181],
+        "close": [10.01, 10.02, float("nan"), 9.99],
+        "volume": [0.1 + 0.2, 1e300, 2.0, 3.0],
+        "count": [1, 2, 3, 4],
+        "name": ["a", "b", None, "d"],
+    })
+    n, cols = decode_block(encode_block(df))
+    assert n == 4
+    assert cols["date"].tolist() == [1, 61, 121, 181]
+    assert cols["close"][[0, 1, 3]].tolist() == [10.01, 10.02, 9.99] and pd.isna(cols["close"][2])
+    assert cols["volume"].tolist() == df["volume"].tolist()
+    assert cols["name"].tolist() == ["a", "b", None, "d"]
+
+def test_block_storage_matches_rows():
+    start = datetime(2024, 1, 1, 9, 30).astimezone()
+    end = datetime(2024, 1, 3, 15, 0).astimezone()
+    cb = lambda symbol, freq, start, end: _fake_minutes(symbol, start, end)
+    for period in ("day", "month"):
+        path = os.path.join(tempfile.mkdtemp(), "history.db")
+        rows = HistoryDB("minutes", db_path=path)
+        blocks = HistoryDB("minutes", db_path=path, storage="blocks", block_period=period)
+        expected = rows.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "1min"}, start=start, end=end, callback=cb)
+        got = blocks.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "1min"}, start=start, end=end, callback=cb)
+        pd.testing.assert_frame_equal(expected, got[expected.columns])
+        # 子区间查询只返回区间内的行
+        sub = blocks.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "1min"},
+                             start=datetime(2024, 1, 2, 10).astimezone(), end=datetime(2024, 1, 2, 11).astimezone())
+        assert len(sub) == 60
+        many = blocks.history_many([{"symbol": "AAA"}, {"symbol": "BBB"}], common_fields={"freq": "1min"}, start=start, end=end, callback=cb)
+        assert (many["symbol"] == "BBB").sum() == len(expected)
+        assert many["symbol"].iloc[0] == "AAA" and many["symbol"].iloc[-1] == "BBB"
+
+def test_block_upsert_counts():
+    db = _new_db(storage="blocks")
+    start = datetime(2024, 1, 1, 9, 30).astimezone()
+    df = _fake_minutes("AAA", start, start + timedelta(hours=2))
+    res = db._insert_data(df.copy(), key_fields={"symbol": "AAA"}, common_fields={"freq": "1min"})
+    assert (res.inserted, res.updated, res.unchanged) == (120, 0, 0)
+    res = db._insert_data(df.copy(), key_fields={"symbol": "AAA"}, common_fields={"freq": "1min"})
+    assert (res.inserted, res.updated, res.unchanged) == (0, 0, 120)
+    revised = _fake_minutes("AAA", start, start + timedelta(hours=3))
+    revised.loc[5, "close"] = 0.0
+    res = db._insert_data(revised, key_fields={"symbol": "AAA"}, common_fields={"freq": "1min"})
+    assert (res.inserted, res.updated, res.unchanged) == (60, 1, 119)
+
+def test_read_only_serving():
+    from fintools.databases import CacheMissError
+    from fintools.databases.refresh_queue import RefreshQueue
+    path = os.path.join(tempfile.mkdtemp(), "history.db")
+    start = datetime(2024, 1, 1).astimezone()
+    end = datetime(2024, 1, 6).astimezone()
+    cb = lambda symbol, freq, start, end: _fake_daily(symbol, start, end, [])
+    HistoryDB("ro", db_path=path).history(key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"}, start=start, end=end, callback=cb)
+    mtime = os.path.getmtime(path)
+
+    ro = HistoryDB("ro", db_path=path, read_only=True)
+    df = ro.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"}, start=start, end=datetime(2024, 1, 5).astimezone())
+    assert len(df) == 4
+    with pytest.raises(CacheMissError):
+        ro.history(key_fields={"symbol": "BBB"}, common_fields={"freq": "daily"}, start=start, end=end)
+    assert os.path.getmtime(path) == mtime
+
+    queue_path = os.path.join(tempfile.mkdtemp(), "queue.db")
+    ro = HistoryDB("ro", db_path=path, read_only=True, on_miss="queue", registry_key="tests:history", refresh_queue=queue_path)
+    assert ro.history(key_fields={"symbol": "BBB"}, common_fields={"freq": "daily"}, start=start, end=end).empty
+    ro.history(key_fields={"symbol": "BBB"}, common_fields={"freq": "daily"}, start=start, end=end)
+    queue = RefreshQueue(queue_path)
+    pending = queue.pending()
+    assert len(pending) == 1 and pending[0].arguments["symbol"] == "BBB" and pending[0].arguments["start"] == start
+    rw = HistoryDB("ro", db_path=path)
+    refresh = lambda **kwargs: rw.history(key_fields={"symbol": kwargs["symbol"]}, common_fields={"freq": kwargs["freq"]},
+                                          start=kwargs["start"], end=kwargs["end"], callback=cb)
+    assert queue.drain(resolver=lambda key: refresh) == 1
+    assert not queue.pending()
+    assert len(ro.history(key_fields={"symbol": "BBB"}, common_fields={"freq": "daily"}, start=start, end=datetime(2024, 1, 5).astimezone())) == 4
+def test_symbol_dict_encoding():
+    start = datetime(2024, 1, 1, 9, 30).astimezone()
+    end = datetime(2024, 1, 1, 15, 0).astimezone()
+    cb = lambda symbol, freq, start, end: _fake_minutes(symbol, start, end)
+    symbols = [f"SYMBOL{i:04d}.SHANGHAI" for i in range(20)]
+    sizes, frames = {}, {}
+    for encode in (False, True):
+        db = _new_db(dict_encode=encode)
+        frames[encode] = db.history_many([{"symbol": s} for s in symbols], common_fields={"freq": "1min"}, start=start, end=end, callback=cb)
+        db.close()
+        sizes[encode] = os.path.getsize(db.db_path)
+    # 调用方看到的数据不变，文件明显变小
+    pd.testing.assert_frame_equal(frames[False], frames[True])
+    assert sizes[True] < sizes[False] * 0.8
+    # list_all_cached / select_by_primary_keys 同样返回原始字符串
+    cached = {}
+    for encode in (False, True):
+        db = _new_db(dict_encode=encode)
+        db.history_many([{"symbol": s} for s in symbols[:2]], common_fields={"freq": "1min"}, start=start, end=end, callback=cb)
+        rows = db.select_by_primary_keys([{"symbol": symbols[1]}, {"symbol": "UNKNOWN"}], common_fields={"freq": "1min"})
+        assert len(rows) == 330 and {r["symbol"] for r in rows} == {symbols[1]}
+        cached[encode] = sorted(set(tuple(r) for r in db.list_all_cached(common_fields={"freq": "1min"})))
+    assert cached[True] == cached[False] == [(s,) for s in symbols[:2]]
+    # 旧的 TEXT 表仍然按原样读写
+    legacy = _new_db(dict_encode=False)
+    legacy.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "1min"}, start=start, end=end, callback=cb)
+    reopened = HistoryDB("test", db_path=legacy.db_path, dict_encode=True)
+    df = reopened.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "1min"}, start=start, end=end - timedelta(minutes=1))
+    assert len(df) == 329
+    table_name = reopened._get_table_name(common_fields={"freq": "1min"})
+    assert reopened.query(f'SELECT DISTINCT symbol FROM "{table_name}"')["symbol"].tolist() == ["AAA"]
+
+def test_without_rowid_migration():
+    from fintools.databases.migrate import migrate_without_rowid, is_without_rowid
+    start = datetime(2024, 1, 1).astimezone()
+    end = datetime(2024, 1, 11).astimezone()
+    cb = lambda symbol, freq, start, end: _fake_daily(symbol, start, end, [])
+    db = _new_db(without_rowid=False)
+    expected = db.history_many([{"symbol": "AAA"}, {"symbol": "BBB"}], common_fields={"freq": "daily"}, start=start, end=end, callback=cb)
+    table_name = db._get_table_name(common_fields={"freq": "daily"})
+    assert not is_without_rowid(db._connect(), table_name)
+
+    assert migrate_without_rowid(db.db_path) == [table_name]
+    assert migrate_without_rowid(db.db_path) == []
+    assert is_without_rowid(db._connect(), table_name)
+    # 已打开的实例无需重建即可继续读写
+    got = db.history_many([{"symbol": "AAA"}, {"symbol": "BBB"}], common_fields={"freq": "daily"}, start=start, end=end, callback=cb)
+    pd.testing.assert_frame_equal(expected, got)
+    res = db._insert_data(_fake_daily("CCC", start, end, []), key_fields={"symbol": "CCC"}, common_fields={"freq": "daily"})
+    assert res.inserted == 10
+    # 分区表同样重建，之后新建的分区沿用逻辑表的 WITHOUT ROWID 结构
+    parted = _new_db(without_rowid=False, partition="month")
+    parted.history_many([{"symbol": "AAA"}], common_fields={"freq": "daily"}, start=datetime(2023, 12, 25).astimezone(), end=end, callback=cb)
+    partitions = [f"{table_name}_p202312", f"{table_name}_p202401"]
+    assert migrate_without_rowid(parted.db_path) == [table_name] + partitions
+    assert all(is_without_rowid(parted._connect(), t) for t in [table_name] + partitions)
+    assert len(parted.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"}, start=datetime(2023, 12, 25).astimezone(), end=datetime(2024, 1, 10).astimezone())) == 16
+    # 新建的表默认就是 WITHOUT ROWID
+    fresh = _new_db()
+    fresh.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"}, start=start, end=end, callback=cb)
+    assert is_without_rowid(fresh._connect(), table_name)
+
+def test_time_partitions():
+    start = datetime(2023, 12, 20).astimezone()
+    end = datetime(2024, 2, 10).astimezone()
+    cb = lambda symbol, freq, start, end: _fake_daily(symbol, start, end, [])
+    plain = _new_db()
+    expected = plain.history_many([{"symbol": "AAA"}, {"symbol": "BBB"}], common_fields={"freq": "daily"}, start=start, end=end, callback=cb)
+
+    db = _new_db(partition="month")
+    got = db.history_many([{"symbol": "AAA"}, {"symbol": "BBB"}], common_fields={"freq": "daily"}, start=start, end=end, callback=cb)
+    pd.testing.assert_frame_equal(expected, got)
+    assert db.list_partitions(common_fields={"freq": "daily"}) == ["202312", "202401", "202402"]
+    one = db.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"}, start=start, end=end - timedelta(days=1))
+    assert one["date"].is_monotonic_decreasing and len(one) == 51
+    table_name = db._get_table_name(common_fields={"freq": "daily"})
+    assert db._partitions_between(table_name, datetime(2024, 1, 5).astimezone(), datetime(2024, 1, 9).astimezone()) == ["202401"]
+
+    db.compact_partition({"freq": "daily"}, "202401")
+    archive = os.path.join(tempfile.mkdtemp(), "archive.db")
+    db.archive_partition({"freq": "daily"}, "202312", archive)
+    assert db.list_partitions(common_fields={"freq": "daily"}) == ["202401", "202402"]
+    import sqlite3
+    with sqlite3.connect(archive) as conn:
+        assert conn.execute(f'SELECT count(*) FROM "{table_name}_p202312"').fetchone()[0] == 2 * 12
+    # 删除分区后对应的已缓存区间也被扣掉，再查询会重新下载
+    missing = db._interval_db.get_missing({"symbol": "AAA"}, {"freq": "daily"}, start, end - timedelta(days=1))
+    assert [(s.month, e.month) for s, e in missing] == [(12, 1)]
+    calls = []
+    db.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"}, start=start, end=end - timedelta(days=1),
+               callback=lambda symbol, freq, start, end: _fake_daily(symbol, start, end, calls))
+    assert len(calls) == 1 and db.list_partitions(common_fields={"freq": "daily"}) == ["202312", "202401", "202402"]
+
+def test_sharded_history_many():
+    import threading
+    from fintools.databases.sharded_db import ShardedHistoryDB, shard_paths
+    start = datetime(2024, 1, 1).astimezone()
+    end = datetime(2024, 1, 11).astimezone()
+    threads = set()
+    def cb(symbol, freq, start, end):
+        threads.add(threading.get_ident())
+        return _fake_daily(symbol, start, end, [])
+    symbols = [f"S{i:02d}" for i in range(16)]
+    expected = _new_db().history_many([{"symbol": s} for s in symbols], common_fields={"freq": "daily"}, start=start, end=end, callback=cb)
+
+    threads.clear()
+    path = os.path.join(tempfile.mkdtemp(), "history.db")
+    db = ShardedHistoryDB("test", db_path=path, shards=4)
+    got = db.history_many([{"symbol": s} for s in symbols], common_fields={"freq": "daily"}, start=start, end=end, callback=cb)
+    pd.testing.assert_frame_equal(expected, got)
+    assert len(threads) > 1
+    assert all(os.path.exists(p) for p in shard_paths(path, 4))
+    one = db.history(key_fields={"symbol": "S03"}, common_fields={"freq": "daily"}, start=start, end=datetime(2024, 1, 10).astimezone())
+    assert len(one) == 9
+    table_name = db.shards[0]._get_table_name(common_fields={"freq": "daily"})
+    assert len(db.query(f'SELECT date FROM "{table_name}"')) == 16 * 10
+    db.close()
+
+
+def test_canonical_cache_keys():
+    from fintools.data_sources import DataFrequency
+    from fintools.databases import DB_CONNECTIONS
+    from fintools.databases.keys import upper_symbol
+    path = os.path.join(tempfile.mkdtemp(), "history.db")
+    calls = []
+
+    @history_cache(table_basename="canon", db_path=path, key_fields=("symbol",), common_fields=("freq",),
+                   normalizers={"symbol": upper_symbol})
+    def history(symbol: str, start: datetime, end: datetime, freq: DataFrequency = DataFrequency.DAILY) -> pd.DataFrame:
+        assert freq is DataFrequency.DAILY and symbol == "AAA"
+        return _fake_daily(symbol, start, end, calls)
+
+    start = datetime(2024, 1, 1).astimezone()
+    end = datetime(2024, 1, 6).astimezone()
+    a = history("aaa", start=start, end=end, freq="daily")
+    b = history(" AAA", start=start, end=end, freq=DataFrequency.DAILY)
+    c = history.many(["Aaa"], start=start, end=end, freq="DataFrequency.DAILY")
+    assert len(a) == len(b) == len(c) == 5
+    # 第一次整段下载，之后只补尾巴，且都落在同一张表、同一个 key 下
+    assert len(calls) == 3 and all(c[1] > datetime(2024, 1, 5).astimezone() for c in calls[1:])
+    db = DB_CONNECTIONS[f"{history.__module__}:{history.__qualname__}"]
+    assert db.query("SELECT name FROM sqlite_master WHERE name LIKE 'canon_%' AND name NOT LIKE '%intervals%'")["name"].tolist() \
+        == [db._get_table_name(common_fields={"freq": DataFrequency.DAILY})]
+    # 表名仍按 str(公共字段) 计算，时间类型的公共字段不换算时区，已有的缓存表不会失联
+    from hashlib import sha1
+    from zoneinfo import ZoneInfo
+    asof = datetime(2024, 1, 1, 9, 30, tzinfo=ZoneInfo("Asia/Shanghai"))
+    assert db._get_table_name(common_fields={"asof": asof}) == f"canon_{sha1(str(asof).encode()).hexdigest()}"
+
+
+def test_merge_diverged_cache_keys():
+    from fintools.data_sources import DataFrequency
+    from fintools.databases.keys import upper_symbol, enum_normalizer
+    from fintools.databases.migrate import canonicalize_history_db
+    # 分区表（_pYYYYMM）与未分区的表一样合并
+    for kwargs in ({}, {"partition": "month"}):
+        db = _new_db(normalizers={"symbol": upper_symbol, "freq": enum_normalizer(DataFrequency)}, common_field_names=("freq",), **kwargs)
+        cb = lambda symbol, freq, start, end: _fake_daily(symbol.upper(), start, end, [])
+        # 旧版本中同一份数据因写法不同落在了三个 (表, key) 下
+        db.history(key_fields={"symbol": "aaa"}, common_fields={"freq": "daily"},
+                   start=datetime(2024, 1, 1).astimezone(), end=datetime(2024, 1, 6).astimezone(), callback=cb)
+        db.history(key_fields={"symbol": "AAA"}, common_fields={"freq": DataFrequency.DAILY},
+                   start=datetime(2024, 1, 4).astimezone(), end=datetime(2024, 1, 9).astimezone(), callback=cb)
+        db.history(key_fields={"symbol": "Aaa"}, common_fields={"freq": DataFrequency.DAILY},
+                   start=datetime(2024, 1, 12).astimezone(), end=datetime(2024, 1, 14).astimezone(), callback=cb)
+        variant = db._get_table_name(common_fields={"freq": "daily"})
+
+        assert canonicalize_history_db(db) == 2
+        assert db.query("SELECT name FROM sqlite_master WHERE name LIKE ?", (f"{variant}%",)).empty
+        canonical = {"freq": DataFrequency.DAILY}
+        assert db._interval_db.get_all(key_fields={"symbol": "Aaa"}, common_fields=canonical) == []
+        calls = []
+        cb = lambda symbol, freq, start, end: _fake_daily(symbol, start, end, calls)
+        df = db.history(key_fields={"symbol": "AAA"}, common_fields=canonical,
+                        start=datetime(2024, 1, 1).astimezone(), end=datetime(2024, 1, 9).astimezone(), callback=cb)
+        assert len(df) == 8 and df["date"].is_unique
+        # 合并后的区间覆盖了 1 日到 8 日，只需补 8 日这根 bar 之后的尾巴
+        assert len(calls) == 1 and calls[0][1] > datetime(2024, 1, 8).astimezone()
+        assert len(db.history(key_fields={"symbol": "AAA"}, common_fields=canonical,
+                              start=datetime(2024, 1, 12).astimezone(), end=datetime(2024, 1, 13).astimezone(), callback=cb)) == 1
+        assert canonicalize_history_db(db) == 0
+
+
+def test_iter_history_chunks():
+    start = datetime(2024, 1, 30, 20, 0).astimezone()
+    end = datetime(2024, 2, 2, 4, 0).astimezone()
+    cb = lambda symbol, freq, start, end: _fake_minutes(symbol, start, end)
+    for kwargs in ({}, {"partition": "month"}, {"storage": "blocks"}):
+        db = _new_db(**kwargs)
+        chunks = list(db.iter_history(key_fields={"symbol": "AAA"}, common_fields={"freq": "1min"}, start=start, end=end,
+                                      callback=cb, chunk_rows=1000))
+        expected = db.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "1min"}, start=start, end=end,
+                              callback=lambda **kwargs: pd.DataFrame())
+        expected = expected.sort_values("date", ignore_index=True)
+        assert [len(c) for c in chunks[:-1]] == [1000] * (len(chunks) - 1) and 0 < len(chunks[-1]) <= 1000
+        got = pd.concat(chunks, ignore_index=True)
+        pd.testing.assert_frame_equal(expected, got[expected.columns], check_dtype=False)
+
+    path = os.path.join(tempfile.mkdtemp(), "history.db")
+    calls = []
+
+    @history_cache(table_basename="chunks", db_path=path, key_fields=("symbol",), common_fields=("freq",))
+    def history(symbol: str, start: datetime, end: datetime, freq: str = "1min") -> pd.DataFrame:
+        calls.append(symbol)
+        return _fake_minutes(symbol, start, end)
+
+    sizes = [len(c) for c in history.iter_chunks("AAA", start=start, end=end, chunk_rows=500)]
+    assert sum(sizes) == 3360 and max(sizes) == 500
+    assert calls == ["AAA"]
+
+
+def test_changelog_sync():
+    from fintools.databases.common_db import CommonDB
+    from fintools.databases.changelog import sync, export_changes, apply_lines, Changelog
+    tmp = tempfile.mkdtemp()
+    source, target, offline = (os.path.join(tmp, f"{name}.db") for name in ("a", "b", "c"))
+    start = datetime(2024, 1, 1).astimezone()
+    end = datetime(2024, 1, 11).astimezone()
+
+    a = HistoryDB("test", db_path=source, changelog=True, partition="month")
+    for symbol in ("AAA", "BBB"):
+        a.history(key_fields={"symbol": symbol}, common_fields={"freq": "daily"}, start=start, end=end,
+                  callback=lambda symbol, freq, start, end: _fake_daily(symbol, start, end, []))
+    details = CommonDB("details", db_path=source, changelog=True)
+    details.fetch(key_fields={"code": "N1"}, callback=lambda code: f"content of {code}")
+    assert [c["op"] for c in Changelog(source).since()] == ["upsert", "add_interval"] * 2 + ["upsert"]
+
+    assert sync(source, target) == 5
+    assert sync(source, target) == 0
+    calls = []
+    b = HistoryDB("test", db_path=target, partition="month")
+    df = b.history(key_fields={"symbol": "BBB"}, common_fields={"freq": "daily"}, start=start, end=end,
+                   callback=lambda symbol, freq, start, end: _fake_daily(symbol, start, end, calls))
+    # 数据和已缓存区间都已同步，只会像源节点一样补最后一根 bar 之后的尾巴
+    assert len(df) == 10 and len(calls) == 1 and calls[0][1] > datetime(2024, 1, 10).astimezone()
+    assert CommonDB("details", db_path=target).fetch(key_fields={"code": "N1"}) == "content of N1"
+    # 重放出来的写入不再记日志
+    assert not Changelog(target).since()
+
+    lines = list(export_changes(source, since=2))
+    assert apply_lines(offline, lines) == 3 and apply_lines(offline, lines) == 0
+    c = HistoryDB("test", db_path=offline, partition="month")
+    assert c._interval_db.get_all(key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"}) == []
+    assert len(c._interval_db.get_all(key_fields={"symbol": "BBB"}, common_fields={"freq": "daily"})) == 1
+
+
+def test_changelog_atomic_with_data():
+    from fintools.databases.common_db import CommonDB
+    from fintools.databases.changelog import Changelog
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "a.db")
+    start = datetime(2024, 1, 1).astimezone()
+    end = datetime(2024, 1, 11).astimezone()
+
+    # 追加变更日志失败时，数据和已缓存区间一起回滚，不会留下未记入日志的缓存
+    a = HistoryDB("test", db_path=path, changelog=True)
+    a._ensure_changelog()
+    append = a._changelog.append
+    def broken(*args, **kwargs):
+        raise sqlite3.OperationalError("disk I/O error")
+    a._changelog.append = broken
+    try:
+        a.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"}, start=start, end=end,
+                  callback=lambda symbol, freq, start, end: _fake_daily(symbol, start, end, []))
+        assert False, "expected the journal failure to propagate"
+    except sqlite3.OperationalError:
+        pass
+    assert a._interval_db.get_all(key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"}) == []
+    a._changelog.append = append
+    calls = []
+    df = a.history(key_fields={"symbol": "AAA"}, common_fields={"freq": "daily"}, start=start, end=end,
+                   callback=lambda symbol, freq, start, end: _fake_daily(symbol, start, end, calls))
+    assert len(df) == 10 and len(calls) == 1 and [c["op"] for c in Changelog(path).since()] == ["upsert", "add_interval"]
+
+    details = CommonDB("details", db_path=path, changelog=True)
+    details._ensure_changelog()
+    details._changelog.append = broken
+    try:
+        details.fetch(key_fields={"code": "N1"}, callback=lambda code: f"content of {code}")
+        assert False, "expected the journal failure to propagate"
+    except sqlite3.OperationalError:
+        pass
+    assert CommonDB("details", db_path=path).fetch(key_fields={"code": "N1"}, callback=lambda code: "refetched") == "refetched"
+
+
+def test_cache_server_coalesces_requests():
+    import time
+    import threading
+    from fintools.databases.cache_server import CacheServer, get_client
+    tmp = tempfile.mkdtemp()
+    start = datetime(2024, 1, 1).astimezone()
+    end = datetime(2024, 1, 11).astimezone()
+    calls = []
+
+    @history_cache(db_path=os.path.join(tmp, "server.db"), table_basename="served", key_fields=("symbol",))
+    def served(symbol: str, freq: str, start: datetime, end: datetime) -> pd.DataFrame:
+        time.sleep(0.2)  # 让并发的相同请求在服务端重叠
+        return _fake_daily(symbol, start, end, calls)
+
+    server = CacheServer(f"unix://{os.path.join(tmp, 'cache.sock')}", resolve=lambda key: served).start()
+    try:
+        @history_cache(db_path="", cache_url=server.url, table_basename="served", key_fields=("symbol",))
+        def remote(symbol: str, freq: str, start: datetime, end: datetime) -> pd.DataFrame:
+            raise AssertionError("客户端不应直接下载")
+
+        results = [None] * 4
+        def run(i):
+            results[i] = remote("AAA", "daily", start=start, end=end)
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        assert len(calls) == 1
+        expected = served("AAA", "daily", start=start, end=end)
+        for df in results:
+            pd.testing.assert_frame_equal(df, expected)
+
+        many = remote.many(["AAA", "BBB"], "daily", start=start, end=end)
+        assert list(many["symbol"].unique()) == ["AAA", "BBB"] and len(many) == 20
+
+        # 客户端自行下载的数据写入服务端后，相同区间不会再触发服务端下载
+        data = _fake_daily("CCC", start, end, [])
+        reg_key = f"{remote.__module__}:{remote.__qualname__}"
+        assert get_client(server.url).put([(reg_key, {"symbol": "CCC"}, {"freq": "daily"}, start, end, data)]) == 10
+        n = len(calls)
+        assert len(remote("CCC", "daily", start=start, end=end)) == 10 and len(calls) == n
+        # 请求结束后不保留按 key 创建的锁
+        assert server._key_locks == {} and server._inflight == {}
+    finally:
+        server.shutdown()
+
+
+def test_bulk_insert_cross_section():
+    db = _new_db()
+    start = datetime(2024, 1, 1).astimezone()
+    end = datetime(2024, 1, 6).astimezone()
+    frames = []
+    for s in ["AAA", "BBB"]:
+        df = _fake_daily(s, start, end, [])
+        df.insert(0, "symbol", s)
+        frames.append(df)
+    data = pd.concat(frames, ignore_index=True)
+    conn = db._connect()
+    before = conn.total_changes
+    # CCC 当天没有数据（停牌），显式登记后也不会再回源
+    result = db.bulk_insert(data, key_columns=["symbol"], common_fields={"freq": "daily"}, start=start, end=end,
+                            key_fields_list=[{"symbol": s} for s in ["AAA", "BBB", "CCC"]])
+    assert result.inserted == 10 and conn.total_changes > before
+    assert not conn.in_transaction
+    calls = []
+    cb = lambda symbol, freq, start, end: _fake_daily(symbol, start, end, calls)
+    df = db.history_many([{"symbol": s} for s in ["AAA", "BBB", "CCC"]], common_fields={"freq": "daily"}, start=start, end=end, callback=cb)
+    assert calls == [] and len(df) == 10
+    expected = data[data["symbol"] == "BBB"].drop(columns=["symbol"]).reset_index(drop=True)
+    got = df[df["symbol"] == "BBB"].drop(columns=["symbol"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(expected, got[expected.columns], check_dtype=False)
+
+    # 嵌套事务并入外层：外层失败时内层写入的数据一起回滚
+    with pytest.raises(RuntimeError):
+        with db._tx():
+            db.bulk_insert(_fake_daily("DDD", start, end, []).assign(symbol="DDD"), key_columns=["symbol"],
+                           common_fields={"freq": "daily"}, start=start, end=end)
+            raise RuntimeError("abort")
+    assert db._interval_db.get_missing(key_fields={"symbol": "DDD"}, common_fields={"freq": "daily"}, start=start, end=end) == [(start, end)]
+
+
+def test_rate_limiter_shared_quota():
+    from fintools.databases.rate_limit import RateLimit, RateLimiter, RateLimitTimeout
+    path = os.path.join(tempfile.mkdtemp(), "rate_limits.db")
+    limits = {"api": [RateLimit(10, 1, burst=2)], "api:slow": [RateLimit(1, 60)]}
+    # 两个实例共用一个文件，相当于两个进程
+    a, b = RateLimiter(path, limits=limits), RateLimiter(path, limits=limits)
+    waits = [a.acquire("api"), b.acquire("api"), a.acquire("api"), b.acquire("api")]
+    assert waits[0] == 0 and waits[1] == 0
+    # 令牌用完后按预定顺序排队：第 3、4 次分别约等 0.1、0.2 秒
+    assert 0.05 < waits[2] <= 0.1 and 0.05 < waits[3] <= 0.1 + 1e-6
+    assert a.acquire("other") == 0
+    a.acquire("api", "slow", timeout=1)
+    with pytest.raises(RateLimitTimeout):
+        b.acquire("api", "slow", timeout=1)
+
+    memory = RateLimiter("", limits=limits)
+    assert memory.acquire("api") == 0 and memory.acquire("api") == 0 and memory.acquire("api") > 0
+
+
+if __name__ == "__main__":
+    test_history_fills_gaps_once()
+    test_history_many_single_query()
+    test_duckdb_read_engine_matches_sqlite()
+    test_history_cache_many()
+    test_cache_metrics()
+    test_upsert_only_touches_changed_rows()
+    test_block_roundtrip()
+    test_block_storage_matches_rows()
+    test_block_upsert_counts()
+    test_read_only_serving()
+    test_symbol_dict_encoding()
+    test_without_rowid_migration()
+    test_time_partitions()
+    test_sharded_history_many()
+    test_canonical_cache_keys()
+    test_merge_diverged_cache_keys()
+    test_iter_history_chunks()
+    test_changelog_sync()
+    test_changelog_atomic_with_data()
+    test_cache_server_coalesces_requests()
+    test_bulk_insert_cross_section()
+    test_rate_limiter_shared_quota()
@@ -107,7 +107,32 @@ def test_utils_parse_datetime():
     except TypeError as e:
         assert str(e) == "Unsupported datetime input type: <class 'float'>"
 
+def test_resolve_end_snaps_to_bar():
+    from fintools.data_sources import resolve_end, DataFrequency
+    from datetime import datetime, timedelta
+
+    # 显式给出的 end 不对齐，避免把 bar 不以本地零点标记的数据源的下一根 bar 包含进来
+    assert resolve_end("2024-01-02 10:37:22", DataFrequency.MINUTE15) == datetime(2024, 1, 2, 10, 37, 22).astimezone()
+    assert resolve_end("2024-01-02 10:37:22", DataFrequency.DAILY) == datetime(2024, 1, 2, 10, 37, 22).astimezone()
+    assert resolve_end("2024-01-02", DataFrequency.WEEKLY) == datetime(2024, 1, 2).astimezone()
+
+    # None 在调用时解析为当前时间，并向上对齐到 bar 边界
+    now = datetime.now().astimezone()
+    end = resolve_end(None, DataFrequency.MINUTE5)
+    assert now <= end <= now + timedelta(minutes=5)
+    assert end.second == 0 and end.minute % 5 == 0
+    assert resolve_end(None, DataFrequency.MINUTE5) in (end, end + timedelta(minutes=5))
+
+    # 每个频率（包括 bar_duration 不支持的年线）都能解析默认的 end；日线及以上对齐到次日零点
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    for freq in DataFrequency:
+        end = resolve_end(None, freq)
+        assert now <= end <= tomorrow + timedelta(days=1)
+        if not freq.value.startswith("minute"):
+            assert end.time() == datetime.min.time()
+
 if __name__ == "__main__":
     test_datasource_parse_datetime()
     test_utils_parse_datetime()
+    test_resolve_end_snaps_to_bar()
     print("All tests passed.")
\ No newline at end of file